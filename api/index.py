@@ -1,10 +1,56 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Request, Response, request, jsonify, send_file
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import secure_filename
+from contextlib import contextmanager
+import hashlib
 import io
-import re
+import json
+import mmap
 import os
 import sys
+import tempfile
+import time
+import zipfile
+
+# Shared extraction engine lives in the project root, next to the CLI
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from hsbc_cache import ResultCache, bytes_digest, default_cache_path
+from hsbc_backends import EmptyPdfError, available_backends, extract_with_backends, resolve_backends
+from hsbc_extractor import DEFAULT_FAST_REGIONS, parse_regions
+from hsbc_metrics import StageMetrics, collect_stages, stage
+from hsbc_prefilter import CANDIDATE, IMAGE_ONLY, NON_ADVICE, classify_pdf
+
+# Upload handling: "zerocopy" parses spooled uploads in place (memory-mapped),
+# "copy" reads every upload into memory first. Request bodies up to the
+# threshold stay in memory, larger ones are spooled to a temporary file.
+UPLOAD_MODE = os.environ.get('HSBC_UPLOAD_MODE', 'zerocopy')
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('HSBC_UPLOAD_SPOOL_THRESHOLD', 1024 * 1024))
+
+
+class SpoolingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_SPOOL_THRESHOLD:
+            return io.BytesIO()
+        return tempfile.TemporaryFile('wb+')
+
 
 app = Flask(__name__)
+app.request_class = SpoolingRequest
+
+# Request size limits, Flask defaults unless set: HSBC_MAX_REQUEST_MB caps the
+# whole request body, HSBC_MAX_FORM_PARTS the number of files and fields
+# (server-side ZIPs of folders with more than 1000 files need a higher value).
+if os.environ.get('HSBC_MAX_REQUEST_MB'):
+    app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ['HSBC_MAX_REQUEST_MB']) * 1024 * 1024)
+if os.environ.get('HSBC_MAX_FORM_PARTS'):
+    app.config['MAX_FORM_PARTS'] = int(os.environ['HSBC_MAX_FORM_PARTS'])
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": "Request too large"}), 413
 
 # HTML Template with Client-Side Batching Logic
 HTML_TEMPLATE = """
@@ -29,6 +75,7 @@ HTML_TEMPLATE = """
         #status { margin-top: 1rem; padding: 1rem; border-radius: 4px; display: none; }
         .success { background: #d4edda; color: #155724; }
         .error { background: #f8d7da; color: #721c24; }
+        #progress { width: 100%; margin-top: 1rem; display: none; }
         #log { margin-top: 1rem; font-family: monospace; font-size: 0.9rem; white-space: pre-wrap; background: #eee; padding: 1rem; max-height: 300px; overflow-y: auto; display: none; }
     </style>
 </head>
@@ -41,13 +88,30 @@ HTML_TEMPLATE = """
             <input type="text" id="periodCode" value="P1" placeholder="Enter Period Code">
         </div>
 
-        <div class="upload-area">
+        <div class="form-group">
+            <label for="uploadMode">Upload mode:</label>
+            <select id="uploadMode">
+                <option value="pipelined">Parallel (one file per request, retried on failure)</option>
+                <option value="batched">Batched (streamed results per group of files)</option>
+            </select>
+            <label for="concurrency" style="font-weight: normal; margin-top: 0.5rem;">
+                Parallel uploads: <input type="number" id="concurrency" min="1" max="32" value="4" style="width: 4em;">
+            </label>
+        </div>
+
+        <form id="uploadForm" class="upload-area" method="post" action="/batch_upload" enctype="multipart/form-data">
             <p>Select a folder containing PDF files:</p>
-            <input type="file" id="fileInput" webkitdirectory directory multiple accept=".pdf">
+            <input type="file" id="fileInput" name="files" webkitdirectory directory multiple accept=".pdf">
+            <input type="hidden" id="formPeriodCode" name="period_code">
             <br><br>
-            <button id="processBtn" onclick="processFiles()">Process & Download ZIP</button>
-        </div>
+            <label style="font-weight: normal;">
+                <input type="checkbox" id="serverZip"> Build the ZIP on the server (for very large folders)
+            </label>
+            <br>
+            <button type="button" id="processBtn" onclick="processFiles()">Process & Download ZIP</button>
+        </form>
 
+        <progress id="progress" value="0" max="1"></progress>
         <div id="status"></div>
         <div id="log"></div>
         
@@ -64,6 +128,246 @@ HTML_TEMPLATE = """
             console.log(msg);
         }
 
+        // Batched mode sends files to /process_batch in groups; each response
+        // streams back one JSON line per file as soon as that file is done.
+        const BATCH_MAX_FILES = 50;
+        const BATCH_MAX_BYTES = 4 * 1024 * 1024;
+
+        function makeBatches(files) {
+            const batches = [];
+            let current = [];
+            let currentBytes = 0;
+            for (const file of files) {
+                if (current.length > 0 &&
+                    (current.length >= BATCH_MAX_FILES || currentBytes + file.size > BATCH_MAX_BYTES)) {
+                    batches.push(current);
+                    current = [];
+                    currentBytes = 0;
+                }
+                current.push(file);
+                currentBytes += file.size;
+            }
+            if (current.length > 0) batches.push(current);
+            return batches;
+        }
+
+        async function* readNdjson(response) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let newline;
+                while ((newline = buffer.indexOf('\\n')) >= 0) {
+                    const line = buffer.slice(0, newline).trim();
+                    buffer = buffer.slice(newline + 1);
+                    if (line) yield JSON.parse(line);
+                }
+            }
+            if (buffer.trim()) yield JSON.parse(buffer);
+        }
+
+        // Progress and ETA come from the measured throughput (bytes done per
+        // second), so large files count for more than small ones.
+        const progressState = { total: 0, done: 0, totalBytes: 0, doneBytes: 0, started: 0, baseDone: 0, baseBytes: 0 };
+
+        function startProgress(files) {
+            progressState.total = files.length;
+            progressState.done = 0;
+            progressState.totalBytes = files.reduce((sum, file) => sum + file.size, 0);
+            progressState.doneBytes = 0;
+            restartThroughput();
+        }
+
+        // Files resolved without an upload finish instantly; measure the
+        // throughput from here on so they do not skew the ETA
+        function restartThroughput() {
+            progressState.started = performance.now();
+            progressState.baseDone = progressState.done;
+            progressState.baseBytes = progressState.doneBytes;
+            updateProgress();
+        }
+
+        function advanceProgress(file) {
+            progressState.done++;
+            progressState.doneBytes += file.size;
+            updateProgress();
+        }
+
+        function updateProgress() {
+            const { total, done, totalBytes, doneBytes, started, baseDone, baseBytes } = progressState;
+            const progress = document.getElementById('progress');
+            progress.style.display = 'block';
+            progress.max = total;
+            progress.value = done;
+
+            let text = `Processing ${done}/${total} files...`;
+            const elapsed = (performance.now() - started) / 1000;
+            if (done > baseDone && done < total && elapsed > 0) {
+                const bytesPerSecond = (doneBytes - baseBytes) / elapsed;
+                const remaining = bytesPerSecond > 0 ? (totalBytes - doneBytes) / bytesPerSecond : 0;
+                text += ` ${((done - baseDone) / elapsed).toFixed(1)} files/s, about ${Math.ceil(remaining)}s left`;
+            }
+            document.getElementById('status').innerText = text;
+        }
+
+        // The server advertises how many parallel uploads fill its workers
+        // and whether it can resolve already-processed files by hash
+        const serverConfig = { concurrency: 4, lookup: false, lookup_max_digests: 1000 };
+
+        async function loadConfig() {
+            try {
+                const response = await fetch('/config');
+                if (!response.ok) return;
+                Object.assign(serverConfig, await response.json());
+                document.getElementById('concurrency').value = serverConfig.concurrency;
+            } catch (e) {
+                // Keep the defaults
+            }
+        }
+        loadConfig();
+
+        async function sha256Hex(file) {
+            const hash = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+            return Array.from(new Uint8Array(hash), b => b.toString(16).padStart(2, '0')).join('');
+        }
+
+        // Hash-first handshake: files the server has already processed are
+        // resolved from their SHA-256 alone and reported through onResult.
+        // Returns the files that still have to be uploaded.
+        async function resolveKnown(files, periodCode, onResult) {
+            // crypto.subtle only exists in secure contexts (HTTPS or localhost)
+            if (!serverConfig.lookup || !(window.crypto && crypto.subtle)) return files;
+
+            const statusDiv = document.getElementById('status');
+            const digests = [];
+            for (const file of files) {
+                // One file at a time keeps memory bounded on large folders
+                statusDiv.innerText = `Checking ${digests.length + 1}/${files.length} files...`;
+                digests.push(await sha256Hex(file));
+            }
+
+            const missing = [];
+            const chunkSize = serverConfig.lookup_max_digests;
+            for (let start = 0; start < files.length; start += chunkSize) {
+                const chunkFiles = files.slice(start, start + chunkSize);
+                const chunkDigests = digests.slice(start, start + chunkSize);
+                try {
+                    const response = await fetch('/lookup', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ period_code: periodCode, digests: chunkDigests })
+                    });
+                    if (!response.ok) throw new Error(`Server error: ${response.status}`);
+                    const { known } = await response.json();
+                    chunkFiles.forEach((file, i) => {
+                        const newName = known[chunkDigests[i]];
+                        if (newName) {
+                            onResult(file, { new_name: newName, known: true });
+                        } else {
+                            missing.push(file);
+                        }
+                    });
+                } catch (err) {
+                    log(`Lookup ERROR: ${err.message} (uploading these files instead)`);
+                    missing.push(...chunkFiles);
+                }
+            }
+            return missing;
+        }
+
+        // Gateway errors and rate limiting are retried with exponential backoff.
+        // The app's own JSON errors (unreadable PDF, no match...) are final.
+        const RETRY_LIMIT = 3;
+        const RETRY_BASE_MS = 500;
+        const TRANSIENT_STATUSES = new Set([408, 429, 502, 503, 504]);
+
+        const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+        async function processOne(file, periodCode) {
+            for (let attempt = 0; ; attempt++) {
+                let error;
+                let retryAfter = null;
+                try {
+                    const formData = new FormData();
+                    formData.append('file', file);
+                    formData.append('period_code', periodCode);
+                    const response = await fetch('/process_one', { method: 'POST', body: formData });
+
+                    let result = null;
+                    try {
+                        result = await response.json();
+                    } catch (e) {
+                        // Not our JSON: a proxy error page or a crashed function
+                    }
+                    if (response.ok && result) return result;
+                    if (result && result.error && !TRANSIENT_STATUSES.has(response.status)) return result;
+
+                    error = (result && result.error) || `Server error: ${response.status}`;
+                    retryAfter = Number(response.headers.get('Retry-After')) * 1000 || null;
+                } catch (err) {
+                    // Network failure
+                    error = err.message;
+                }
+
+                if (attempt >= RETRY_LIMIT) {
+                    return { error: `${error} (gave up after ${attempt + 1} attempts)` };
+                }
+                const delay = retryAfter ?? RETRY_BASE_MS * 2 ** attempt * (0.5 + Math.random());
+                log(`${file.name} -> retrying in ${(delay / 1000).toFixed(1)}s (${error})`);
+                await sleep(delay);
+            }
+        }
+
+        // Keeps `concurrency` /process_one requests in flight; each finished
+        // upload immediately starts the next file.
+        async function processPipelined(files, periodCode, concurrency, onResult) {
+            let next = 0;
+            async function worker() {
+                while (next < files.length) {
+                    const file = files[next++];
+                    onResult(file, await processOne(file, periodCode));
+                }
+            }
+            const workers = Math.max(1, Math.min(concurrency, files.length));
+            await Promise.all(Array.from({ length: workers }, worker));
+        }
+
+        async function processBatched(files, periodCode, onResult) {
+            for (const batch of makeBatches(files)) {
+                const formData = new FormData();
+                batch.forEach(file => formData.append('files', file));
+                formData.append('period_code', periodCode);
+
+                const pending = new Set(batch.map((_, i) => i));
+                try {
+                    const response = await fetch('/process_batch', {
+                        method: 'POST',
+                        body: formData
+                    });
+
+                    if (!response.ok) {
+                        const errText = await response.text();
+                        throw new Error(`Server error: ${response.status} - ${errText}`);
+                    }
+
+                    for await (const result of readNdjson(response)) {
+                        pending.delete(result.index);
+                        onResult(batch[result.index], result);
+                    }
+                } catch (err) {
+                    log(`Batch ERROR: ${err.message}`);
+                }
+
+                // Files the server never reported on (request failed or stream cut off)
+                for (const i of pending) {
+                    onResult(batch[i], { error: 'no result from server' });
+                }
+            }
+        }
+
         async function processFiles() {
             const fileInput = document.getElementById('fileInput');
             const periodCode = document.getElementById('periodCode').value || 'P1';
@@ -75,57 +379,54 @@ HTML_TEMPLATE = """
                 return;
             }
 
+            // Server-side ZIP: a plain form post lets the browser stream the
+            // archive straight to disk instead of holding it in memory
+            if (document.getElementById('serverZip').checked) {
+                document.getElementById('formPeriodCode').value = periodCode;
+                document.getElementById('uploadForm').submit();
+                statusDiv.style.display = 'block';
+                statusDiv.className = 'success';
+                statusDiv.innerText = 'Uploading... the ZIP download starts while files are processed.';
+                return;
+            }
+
+            // Skip non-PDFs
+            const pdfFiles = Array.from(fileInput.files).filter(f => f.name.toLowerCase().endsWith('.pdf'));
+
             btn.disabled = true;
             statusDiv.style.display = 'block';
             statusDiv.className = '';
-            statusDiv.innerText = 'Processing ' + fileInput.files.length + ' files...';
             document.getElementById('log').innerText = ''; // Clear log
 
             const zip = new JSZip();
             let processedCount = 0;
             let errorCount = 0;
+            let knownCount = 0;
+            startProgress(pdfFiles);
 
-            try {
-                for (let i = 0; i < fileInput.files.length; i++) {
-                    const file = fileInput.files[i];
-                    
-                    // Skip non-PDFs
-                    if (!file.name.toLowerCase().endsWith('.pdf')) {
-                        continue;
-                    }
-
-                    log(`Processing [${i+1}/${fileInput.files.length}]: ${file.name}...`);
-
-                    const formData = new FormData();
-                    formData.append('file', file);
-                    formData.append('period_code', periodCode);
-
-                    try {
-                        const response = await fetch('/process_one', {
-                            method: 'POST',
-                            body: formData
-                        });
-
-                        if (!response.ok) {
-                            const errText = await response.text();
-                            throw new Error(`Server error: ${response.status} - ${errText}`);
-                        }
-
-                        const data = await response.json();
-                        if (data.error) {
-                            throw new Error(data.error);
-                        }
-
-                        // Add renamed file to zip
-                        zip.file(data.new_name, file);
-                        log(`  -> Renamed to: ${data.new_name}`);
-                        processedCount++;
+            function record(file, result) {
+                if (result.error) {
+                    log(`${file.name} -> ERROR: ${result.error}`);
+                    errorCount++;
+                    zip.file("UNPROCESSED_" + file.name, file);
+                } else {
+                    // Add renamed file to zip
+                    zip.file(result.new_name, file);
+                    log(`${file.name} -> Renamed to: ${result.new_name}${result.known ? ' (known, not uploaded)' : ''}`);
+                    processedCount++;
+                    if (result.known) knownCount++;
+                }
+                advanceProgress(file);
+            }
 
-                    } catch (err) {
-                        log(`  -> ERROR: ${err.message}`);
-                        errorCount++;
-                        zip.file("UNPROCESSED_" + file.name, file);
-                    }
+            try {
+                const uploadFiles = await resolveKnown(pdfFiles, periodCode, record);
+                restartThroughput();
+                if (document.getElementById('uploadMode').value === 'batched') {
+                    await processBatched(uploadFiles, periodCode, record);
+                } else {
+                    const concurrency = parseInt(document.getElementById('concurrency').value, 10) || 1;
+                    await processPipelined(uploadFiles, periodCode, concurrency, record);
                 }
 
                 if (processedCount === 0 && errorCount > 0) {
@@ -137,7 +438,7 @@ HTML_TEMPLATE = """
                 saveAs(content, `renamed_invoices_${periodCode}.zip`);
 
                 statusDiv.className = 'success';
-                statusDiv.innerText = `Done! Processed: ${processedCount}, Errors: ${errorCount}. ZIP downloaded.`;
+                statusDiv.innerText = `Done! Processed: ${processedCount} (${knownCount} without upload), Errors: ${errorCount}. ZIP downloaded.`;
 
             } catch (e) {
                 statusDiv.className = 'error';
@@ -152,9 +453,128 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# The page has no template variables: encode it once at import instead of
+# rendering it through Jinja on every hit, and let browsers revalidate by ETag.
+INDEX_PAGE = HTML_TEMPLATE.encode('utf-8')
+INDEX_ETAG = hashlib.sha256(INDEX_PAGE).hexdigest()[:16]
+
+# Fast extraction: only text inside these regions is collected first
+# (header with "Advice sending date", then the top of the outlet table).
+FAST_EXTRACTION = os.environ.get('HSBC_FAST_EXTRACTION', '0') == '1'
+FAST_REGIONS = (parse_regions(os.environ['HSBC_FAST_REGIONS'])
+                if os.environ.get('HSBC_FAST_REGIONS') else DEFAULT_FAST_REGIONS)
+
+# PDF backend chain (HSBC_PDF_BACKEND, default "auto"), built on first use
+_backends = None
+
+
+def get_backends():
+    global _backends
+    if _backends is None:
+        _backends = resolve_backends()
+        if not _backends:
+            raise ValueError("No PDF backend installed")
+    return _backends
+
+# Content-hash -> extracted fields cache, so re-uploads skip PDF parsing.
+# Opened on first use; set HSBC_CACHE=0 to disable.
+CACHE_ENABLED = os.environ.get('HSBC_CACHE', '1') == '1'
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None and CACHE_ENABLED:
+        try:
+            # Several serverless/WSGI workers may share the file, so commit every write
+            _cache = ResultCache(flush_interval=1)
+        except Exception as e:
+            app.logger.warning("Result cache disabled: %s", e)
+            return None
+    return _cache
+
+# Reject non-advice and image-only PDFs from cheap signals (header, page
+# size, text operators) before a backend parses them; HSBC_PREFILTER=0 disables.
+PREFILTER_ENABLED = os.environ.get('HSBC_PREFILTER', '1') == '1'
+PREFILTER_ERRORS = {
+    NON_ADVICE: "Not an HSBC payment advice",
+    IMAGE_ONLY: "Scanned image without a text layer (run OCR first)",
+}
+
+# Per-stage timings of this worker process, exposed at /metrics
+METRICS = StageMetrics()
+
+# Optional record of every renamed upload for downstream lookup:
+# HSBC_MANIFEST appends to a .csv/.jsonl file, HSBC_MANIFEST_INDEX to a
+# SQLite index that `hsbc_payment_renamer.py query` can search.
+MANIFEST_PATH = os.environ.get('HSBC_MANIFEST')
+MANIFEST_INDEX = os.environ.get('HSBC_MANIFEST_INDEX')
+_manifest = None
+
+
+def get_manifest():
+    global _manifest
+    if _manifest is None and (MANIFEST_PATH or MANIFEST_INDEX):
+        from hsbc_manifest import Manifest
+        try:
+            # Workers share the index file, so commit every row like the result cache
+            _manifest = Manifest(MANIFEST_PATH, MANIFEST_INDEX, flush_interval=1)
+        except Exception as e:
+            app.logger.warning("Manifest disabled: %s", e)
+            return None
+    return _manifest
+
+
+def record_manifest(file, fields, name, period_code, digest):
+    """Append one renamed upload to the manifest, if enabled (digest comes from extract_upload)."""
+    manifest = get_manifest()
+    if manifest is None:
+        return
+    from hsbc_manifest import manifest_row
+    manifest.write(manifest_row(upload_basename(file.filename or ''), name, fields, period_code, digest))
+
+# Background batch jobs (/jobs). HSBC_JOB_STORE picks the state store
+# ("memory" or "sqlite[:path]"); server-side directories are only accepted
+# when HSBC_JOBS_LOCAL_DIRS=1, i.e. when the app runs on the user's machine.
+# HSBC_JOBS=0 switches the endpoints off and HSBC_JOBS_RESUME=0 leaves jobs
+# interrupted by a restart to another process; api/wsgi.py sets both when
+# several workers would otherwise lose or duplicate jobs.
+JOBS_ENABLED = os.environ.get('HSBC_JOBS', '1') == '1'
+JOBS_LOCAL_DIRS = os.environ.get('HSBC_JOBS_LOCAL_DIRS', '0') == '1'
+JOBS_RESUME = os.environ.get('HSBC_JOBS_RESUME', '1') == '1'
+_jobs = None
+
+
+def get_jobs():
+    global _jobs
+    if _jobs is None:
+        # The job machinery (process pool, SQLite store) is only imported when used
+        from hsbc_jobs import DEFAULT_TTL, JobManager, open_job_store
+        _jobs = JobManager(
+            open_job_store(),
+            workdir=os.environ.get('HSBC_JOB_DIR'),
+            workers=int(os.environ.get('HSBC_JOB_WORKERS', '0')) or None,
+            fast_regions=FAST_REGIONS,
+            cache_path=default_cache_path() if CACHE_ENABLED else None,
+            metrics=METRICS,
+            manifest=get_manifest(),
+            ttl=float(os.environ.get('HSBC_JOB_TTL', DEFAULT_TTL)),
+            prefilter=PREFILTER_ENABLED,
+            resume=JOBS_RESUME,
+        )
+    return _jobs
+
+
+def jobs_disabled():
+    return jsonify({"error": "Background jobs are disabled on this server"}), 503
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    response = Response(INDEX_PAGE, mimetype='text/html')
+    response.set_etag(INDEX_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
 
 @app.route('/debug')
 def debug():
@@ -169,19 +589,206 @@ def debug():
     return jsonify({
         "python_version": sys.version,
         "pypdf_version": pypdf_version,
+        "pdf_backends": available_backends(),
         "cwd": os.getcwd(),
         "files": os.listdir('.')
     })
 
-@app.route('/process_one', methods=['POST'])
-def process_one():
+@app.route('/metrics')
+def metrics():
+    """Prometheus histograms of per-stage timings and per-result file counters."""
+    return Response(METRICS.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def extract_upload(file, fast):
+    """
+    Extract advice fields from one uploaded PDF.
+    Returns (fields, None, 200, digest) on success or (None, error message, HTTP status, digest).
+    The SHA-256 digest is only computed when the result cache or the manifest needs it.
+    """
+    with collect_stages() as sample:
+        fields, error, status, category, digest = _extract_upload(file, fast)
+    if category != CANDIDATE:
+        result = category
+    else:
+        # Cache hits never open the PDF, so no stage is recorded for them
+        result = 'error' if error else 'ok' if 'open' in sample else 'cached'
+    METRICS.record(sample, result)
+    return fields, error, status, digest
+
+
+def new_filename(fields, period_code):
+    """Generate the renamed filename, timed as the "filename" stage."""
+    start = time.perf_counter()
+    name = fields.filename(period_code)
+    METRICS.observe('filename', time.perf_counter() - start)
+    return name
+
+
+def _extract_upload(file, fast):
+    """Returns (fields, error, status, prefilter category, digest)."""
+    # Lazy backend import to prevent startup crash
     try:
-        # Lazy import to prevent startup crash
+        backends = get_backends()
+    except ValueError:
+        return (None, "Server Configuration Error: no PDF library found. Please check requirements.txt", 500,
+                CANDIDATE, None)
+
+    try:
+        with open_upload(file) as (buffer, stream):
+            cache = get_cache()
+            # Hash once for both the cache key and the manifest row
+            digest = bytes_digest(buffer) if cache is not None or get_manifest() is not None else None
+            fields = cache.get(digest) if cache is not None else None
+            if fields is not None:
+                return fields, None, 200, CANDIDATE, digest
+
+            if PREFILTER_ENABLED:
+                with stage('prefilter'):
+                    category, _ = classify_pdf(buffer)
+                if category != CANDIDATE:
+                    return None, PREFILTER_ERRORS[category], 422, category, digest
+
+            # Read PDF with the fastest installed backend; incomplete results fall through to the next one
+            try:
+                # Fast mode: only look at the configured regions, full page as fallback
+                fields, _ = extract_with_backends(stream, backends, FAST_REGIONS if fast else None)
+
+            except EmptyPdfError:
+                return None, "Empty PDF", 400, CANDIDATE, digest
+            except Exception as e:
+                return None, f"Failed to read PDF: {str(e)}", 500, CANDIDATE, digest
+    finally:
+        # Callers that re-send the upload (ZIP, attachment) read it from the start
+        file.stream.seek(0)
+
+    if fields.year is None:
+        return None, "Could not find date in PDF", 400, CANDIDATE, digest
+    if fields.outlet_num is None:
+        return None, "Could not find Outlet/Bene info pattern", 400, CANDIDATE, digest
+
+    if cache is not None:
+        cache.put(digest, fields)
+
+    return fields, None, 200, CANDIDATE, digest
+
+
+@contextmanager
+def open_upload(file):
+    """
+    Yield (buffer, stream) for an upload: a bytes-like object for hashing and
+    a seekable stream for the PDF parser. In "zerocopy" mode in-memory uploads
+    are shared through the BytesIO buffer and spooled uploads are memory-mapped,
+    so the upload is never copied into a bytes object; "copy" mode keeps the
+    old read-into-BytesIO behaviour.
+    """
+    stream = file.stream
+    if UPLOAD_MODE == 'zerocopy':
+        if isinstance(stream, io.BytesIO):
+            stream.seek(0)
+            with stream.getbuffer() as view:
+                yield view, stream
+            return
+
         try:
-            from pypdf import PdfReader
-        except ImportError:
-            return jsonify({"error": "Server Configuration Error: pypdf library not found. Please check requirements.txt"}), 500
+            fileno = stream.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fileno = None
+        if fileno is not None:
+            stream.flush()
+            if os.fstat(fileno).st_size > 0:
+                with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as view:
+                    yield view, view
+                return
+
+    # Create a copy of the stream for pypdf
+    stream.seek(0)
+    data = stream.read()
+    yield data, io.BytesIO(data)
+
+
+def detach_uploads(files):
+    """
+    Take ownership of uploaded files for a streamed response.
+    The request context closes request.files as soon as the view returns,
+    before the response body is consumed, so move each spooled stream into
+    a new FileStorage that the generator closes itself.
+    """
+    detached = []
+    for file in files:
+        detached.append(FileStorage(stream=file.stream, filename=file.filename,
+                                    name=file.name, headers=file.headers))
+        file.stream = io.BytesIO()
+    return detached
+
 
+def use_fast_extraction():
+    return request.form.get('fast', '1' if FAST_EXTRACTION else '0') == '1'
+
+
+# Parallel /process_one uploads the browser keeps in flight (HSBC_CLIENT_CONCURRENCY).
+# Defaults to two per CPU (one upload on the wire while another is parsed), capped
+# so one browser cannot queue up a whole server; raise it for larger deployments.
+CLIENT_CONCURRENCY = int(os.environ.get('HSBC_CLIENT_CONCURRENCY', 0)) or min(2 * (os.cpu_count() or 1), 8)
+
+
+# Largest number of digests accepted by one /lookup request
+LOOKUP_MAX_DIGESTS = 1000
+
+
+@app.route('/config')
+def config():
+    """Client settings advertised by the server."""
+    return jsonify({
+        "concurrency": CLIENT_CONCURRENCY,
+        "lookup": CACHE_ENABLED,
+        "lookup_max_digests": LOOKUP_MAX_DIGESTS,
+    })
+
+
+def is_sha256(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+@app.route('/lookup', methods=['POST'])
+def lookup():
+    """
+    Hash-first handshake: resolve files the server has already processed
+    from their SHA-256 alone, so the client only uploads the rest.
+    Body: {"period_code": "P5", "digests": [sha256 hex, ...]}
+    Returns {"known": {digest: new_name}, "missing": [digest, ...]}
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('digests'), list):
+        return jsonify({"error": "Expected a JSON body with a 'digests' list"}), 400
+
+    digests = list(dict.fromkeys(payload['digests']))
+    if len(digests) > LOOKUP_MAX_DIGESTS:
+        return jsonify({"error": f"At most {LOOKUP_MAX_DIGESTS} digests per request"}), 413
+    if not all(is_sha256(digest) for digest in digests):
+        return jsonify({"error": "Digests must be lowercase hex SHA-256"}), 400
+
+    period_code = payload.get('period_code') or 'P1'
+    cache = get_cache()
+    found = cache.get_many(digests) if cache is not None else {}
+
+    known = {}
+    for digest, fields in found.items():
+        known[digest] = new_filename(fields, period_code)
+        METRICS.record({}, 'cached')
+    return jsonify({"known": known, "missing": [digest for digest in digests if digest not in known]})
+
+
+@app.after_request
+def advertise_concurrency(response):
+    # Scripted clients read the recommendation straight off /process_one responses
+    if request.endpoint == 'process_one':
+        response.headers['X-Recommended-Concurrency'] = str(CLIENT_CONCURRENCY)
+    return response
+
+
+@app.route('/process_one', methods=['POST'])
+def process_one():
+    try:
         if 'file' not in request.files:
             return jsonify({"error": "No file part"}), 400
         
@@ -191,62 +798,304 @@ def process_one():
         if file.filename == '':
             return jsonify({"error": "No selected file"}), 400
 
-        # Read PDF using pypdf
-        try:
-            # Create a copy of the stream for pypdf
-            file_stream = io.BytesIO(file.read())
-            reader = PdfReader(file_stream)
-            
-            if len(reader.pages) == 0:
-                return jsonify({"error": "Empty PDF"}), 400
-                
-            text = reader.pages[0].extract_text()
-            
-        except Exception as e:
-            return jsonify({"error": f"Failed to read PDF: {str(e)}"}), 500
-
-        # Extraction Logic (Regex)
-        extracted_info = {}
-        
-        # 1. Extract Year
-        # Look for "Advice sending date" followed by date
-        date_match = re.search(r"Advice sending date.*?(\d{1,2}\s+\w{3}\s+(\d{4}))", text, re.DOTALL | re.IGNORECASE)
-        if date_match:
-            year_short = date_match.group(2)[-2:]
-            extracted_info['year'] = year_short
-        else:
-            # Fallback: Try to find just a date pattern if the label is missing/garbled
-            # 20 Jun 2025
-            fallback_date = re.search(r"\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+(\d{4})", text, re.IGNORECASE)
-            if fallback_date:
-                extracted_info['year'] = fallback_date.group(1)[-2:]
-            else:
-                return jsonify({"error": "Could not find date in PDF"}), 400
-
-        # 2. Extract Outlet Info
-        # Pattern: 1208008138/ APC-IT801
-        outlet_match = re.search(r"(\d{10,})\s*/\s*([A-Z]{3})\s*-?\s*([A-Z0-9]+)", text)
-        if outlet_match:
-            extracted_info['outlet_num'] = outlet_match.group(1)
-            extracted_info['bene_abbr'] = outlet_match.group(2)
-            extracted_info['outlet_code'] = outlet_match.group(3)
-        else:
-            return jsonify({"error": "Could not find Outlet/Bene info pattern"}), 400
+        fields, error, status, digest = extract_upload(file, use_fast_extraction())
+        if error:
+            return jsonify({"error": error}), status
 
         # Generate New Filename
-        new_filename = (
-            f"{extracted_info['year']}_"
-            f"{period_code}_"
-            f"{extracted_info['bene_abbr']}_"
-            f"{extracted_info['outlet_code']}_"
-            f"{extracted_info['outlet_num']}.pdf"
-        )
+        name = new_filename(fields, period_code)
+        record_manifest(file, fields, name, period_code, digest)
+        return jsonify({"new_name": name})
 
-        return jsonify({"new_name": new_filename})
+    except HTTPException:
+        # Oversized requests are answered by the 413 handler
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Server Error: {str(e)}"}), 500
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    """
+    Process many uploads ('files' fields) in one request.
+    Streams one JSON line per file as soon as it is done:
+    {"index": i, "filename": ..., "new_name": ...} or {"index": i, "filename": ..., "error": ...}
+    """
+    files = detach_uploads(request.files.getlist('files'))
+    if not files:
+        return jsonify({"error": "No files part"}), 400
+
+    period_code = request.form.get('period_code', 'P1')
+    fast = use_fast_extraction()
+
+    def generate():
+        for index, file in enumerate(files):
+            result = {"index": index, "filename": file.filename}
+            try:
+                fields, error, _, digest = extract_upload(file, fast)
+                if error:
+                    result["error"] = error
+                else:
+                    result["new_name"] = new_filename(fields, period_code)
+                    record_manifest(file, fields, result["new_name"], period_code, digest)
+            except Exception as e:
+                # One bad file must not abort the rest of the batch
+                result["error"] = f"Server Error: {str(e)}"
+            finally:
+                file.close()
+            yield json.dumps(result) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
+@app.route('/upload', methods=['POST'])
+def upload():
+    """Rename a single uploaded PDF and send it back as an attachment."""
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+
+        file = request.files['file']
+        period_code = request.form.get('period_code', 'P1')
+
+        if file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
+
+        fields, error, status, digest = extract_upload(file, use_fast_extraction())
+        if error:
+            return jsonify({"error": error}), status
 
+        # The response body is read after the request context closes the upload
+        file, = detach_uploads([file])
+        file.stream.seek(0)
+        return send_file(file.stream, mimetype='application/pdf', as_attachment=True,
+                         download_name=new_filename(fields, period_code))
+
+    except HTTPException:
+        # Oversized requests are answered by the 413 handler
+        raise
     except Exception as e:
         return jsonify({"error": f"Server Error: {str(e)}"}), 500
 
+
+class ZipStreamBuffer:
+    """
+    Write-only sink for zipfile.ZipFile. It has no seek/tell, so zipfile
+    falls back to data descriptors and never rewinds; the generator drains
+    whatever has been written after every chunk and yields it to the client.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+def upload_basename(filename):
+    """Browsers send folder uploads as relative paths; keep only the file name."""
+    return filename.replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def unique_entry_name(name, used):
+    if name not in used:
+        used.add(name)
+        return name
+    stem, ext = os.path.splitext(name)
+    counter = 2
+    while f"{stem}_{counter}{ext}" in used:
+        counter += 1
+    name = f"{stem}_{counter}{ext}"
+    used.add(name)
+    return name
+
+
+def stream_renamed_zip(files, period_code, fast):
+    """
+    Yield a ZIP archive of renamed uploads chunk by chunk. Only one upload
+    (plus one copy chunk) is held in memory at a time; files that cannot be
+    processed are stored as UNPROCESSED_<original name>.
+    """
+    sink = ZipStreamBuffer()
+    used = set()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for file in files:
+            try:
+                original = upload_basename(file.filename or 'unnamed.pdf')
+                try:
+                    fields, error, _, digest = extract_upload(file, fast)
+                except Exception as e:
+                    fields, error, digest = None, str(e), None
+                name = new_filename(fields, period_code) if not error else "UNPROCESSED_" + original
+                name = unique_entry_name(name, used)
+                if not error:
+                    record_manifest(file, fields, name, period_code, digest)
+
+                stream = file.stream
+                size = stream.seek(0, os.SEEK_END)
+                stream.seek(0)
+                info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                # Time only the copy, not the client draining the yielded chunks
+                written = 0.0
+                with archive.open(info, 'w', force_zip64=size > zipfile.ZIP64_LIMIT // 2) as entry:
+                    while True:
+                        start = time.perf_counter()
+                        chunk = stream.read(ZIP_CHUNK_SIZE)
+                        if chunk:
+                            entry.write(chunk)
+                        written += time.perf_counter() - start
+                        if not chunk:
+                            break
+                        yield sink.drain()
+                METRICS.observe('write', written)
+            finally:
+                file.close()
+            yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+
+@app.route('/batch_upload', methods=['POST'])
+def batch_upload():
+    """Rename every uploaded PDF ('files' fields) and stream back one ZIP."""
+    files = [f for f in request.files.getlist('files') if f.filename.lower().endswith('.pdf')]
+    if not files:
+        return jsonify({"error": "No PDF files uploaded"}), 400
+
+    period_code = request.form.get('period_code', 'P1')
+    files = detach_uploads(files)
+    chunks = (chunk for chunk in stream_renamed_zip(files, period_code, use_fast_extraction()) if chunk)
+    # period_code is client input: strip quotes, CR/LF and path separators before it reaches a header
+    download_name = secure_filename(f"renamed_invoices_{period_code}.zip") or "renamed_invoices.zip"
+    return Response(chunks, mimetype='application/zip', headers={
+        'Content-Disposition': f'attachment; filename="{download_name}"',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue a batch and return immediately with a job id.
+    Accepts uploads ('files' fields) or, when HSBC_JOBS_LOCAL_DIRS=1,
+    a server-side 'directory' whose PDFs are renamed in place.
+    """
+    if not JOBS_ENABLED:
+        return jobs_disabled()
+    period_code = request.form.get('period_code', 'P1')
+    fast = use_fast_extraction()
+    directory = request.form.get('directory')
+
+    try:
+        if directory:
+            if not JOBS_LOCAL_DIRS:
+                return jsonify({"error": "Directory jobs are disabled on this server"}), 403
+            if not os.path.isdir(directory):
+                return jsonify({"error": f"Not a directory: {directory}"}), 400
+            job_id = get_jobs().submit_directory(directory, period_code, fast)
+        else:
+            files = [f for f in request.files.getlist('files') if f.filename.lower().endswith('.pdf')]
+            if not files:
+                return jsonify({"error": "No PDF files uploaded"}), 400
+            job_id = get_jobs().submit_uploads(((f.filename, f.stream) for f in files), period_code, fast)
+    except Exception as e:
+        return jsonify({"error": f"Server Error: {str(e)}"}), 500
+
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report job progress: state, total, processed, failed."""
+    if not JOBS_ENABLED:
+        return jobs_disabled()
+    status = get_jobs().status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """
+    Return the renamed files as a ZIP (upload jobs) or, with ?format=manifest
+    and for directory jobs, a JSON manifest of per-file results.
+    """
+    from hsbc_jobs import DONE
+
+    if not JOBS_ENABLED:
+        return jobs_disabled()
+    jobs = get_jobs()
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if status['state'] != DONE:
+        return jsonify({"error": f"Job is {status['state']}", "job": status}), 409
+
+    if request.args.get('format') == 'manifest' or status['kind'] == 'directory':
+        return jsonify({"job": status, "results": jobs.results(job_id)})
+
+    return send_file(jobs.result_path(job_id), mimetype='application/zip', as_attachment=True,
+                     download_name=f"renamed_invoices_{status['period_code']}.zip")
+
+# Optional warm start: HSBC_PRELOAD=1 imports the PDF backends and runs one
+# extraction while the module is imported, so a serverless snapshot (or a
+# preloading WSGI master) already holds the warm code paths and the first
+# upload after an idle period does not pay for them.
+PRELOAD = os.environ.get('HSBC_PRELOAD', '0') == '1'
+
+
+def _warmup_pdf():
+    """A minimal one-page advice, built in memory for the warm-up extraction."""
+    content = (b"BT /F1 10 Tf 50 780 Td (Advice sending date) Tj 0 -14 Td (20 Jun 2025) Tj"
+               b" 0 -200 Td (1208008138/ APC - IT801) Tj ET")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842]"
+        b" /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def preload():
+    """Import the backend chain and warm it with one in-memory extraction."""
+    start = time.perf_counter()
+    try:
+        fields, backend = extract_with_backends(io.BytesIO(_warmup_pdf()), get_backends())
+    except Exception as e:
+        app.logger.warning("Preload failed: %s", e)
+        return
+    app.logger.info("Preloaded %s backend in %.1f ms (fields complete: %s)",
+                    backend, (time.perf_counter() - start) * 1000, fields.complete)
+
+
+if PRELOAD:
+    preload()
+
 # For local testing
 if __name__ == '__main__':
     app.run(debug=True, port=3000)
@@ -0,0 +1,125 @@
+"""
+Production entry point for self-hosting the web API with gunicorn
+(pip install gunicorn; Vercel keeps using api/index.py directly).
+
+    python api/wsgi.py
+
+The app is imported and the PDF backend warmed once in the gunicorn master,
+then the workers are forked from it, so every worker starts with PyMuPDF or
+pypdf and the compiled patterns already loaded. Settings come from the
+environment:
+
+    HSBC_BIND           address to listen on (default 0.0.0.0:$PORT or 0.0.0.0:8000)
+    HSBC_WORKERS        worker processes (default: CPU count)
+    HSBC_JOB_STORE      /jobs state store; "sqlite[:path]" is required for /jobs with several workers
+    HSBC_THREADS        threads per worker (default 2)
+    HSBC_TIMEOUT        seconds before a silent worker is restarted (default 120)
+    HSBC_MAX_REQUESTS   requests before a worker is recycled (0 = never; default 1000,
+                        or 0 while /jobs is enabled)
+    HSBC_ACCESS_LOG     access log file, "-" for stderr (default off)
+
+Request size limits (HSBC_MAX_REQUEST_MB, HSBC_MAX_FORM_PARTS) are applied by
+the app itself, see api/index.py. Each worker keeps its own /metrics counters.
+
+Background jobs (/jobs) run in the worker that accepted them, and the status
+polls may reach any worker. With more than one worker the job state must
+therefore live in the shared SQLite store (HSBC_JOB_STORE=sqlite[:path]);
+with the in-memory store /jobs is switched off (503). Jobs that a restart
+interrupted are read from the store by the master before any worker starts
+and resumed by the first worker alone, so none of them runs twice. Recycling
+a worker would kill the jobs it is running, so workers are not recycled while
+/jobs is enabled unless HSBC_MAX_REQUESTS says otherwise; jobs a crashed
+worker was running are resumed on the next restart.
+
+`gunicorn --chdir api wsgi:app` also works for a hand-rolled configuration.
+"""
+
+import os
+import sys
+
+WORKERS = int(os.environ.get('HSBC_WORKERS', 0)) or os.cpu_count() or 1
+THREADS = int(os.environ.get('HSBC_THREADS', 2))
+
+# Browsers get one parallel upload per worker thread, and the backend is
+# warmed at import (before the fork) unless configured otherwise
+os.environ.setdefault('HSBC_CLIENT_CONCURRENCY', str(WORKERS * THREADS))
+os.environ.setdefault('HSBC_PRELOAD', '1')
+
+# Several workers can only share jobs through the SQLite store, and only the
+# first worker may resume the jobs a restart interrupted (see resume_jobs)
+SHARED_JOBS = WORKERS > 1 and os.environ.get('HSBC_JOB_STORE', 'memory').partition(':')[0] == 'sqlite'
+if WORKERS > 1:
+    os.environ['HSBC_JOBS'] = '1' if SHARED_JOBS else '0'
+    os.environ['HSBC_JOBS_RESUME'] = '0'
+
+# A recycled worker takes its running jobs down with it and leaves them
+# "running" in the store, so only recycle by default when /jobs is off
+JOBS_ENABLED = os.environ.get('HSBC_JOBS', '1') == '1'
+MAX_REQUESTS = int(os.environ.get('HSBC_MAX_REQUESTS', 0 if JOBS_ENABLED else 1000))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from index import app  # noqa: E402
+
+
+# Jobs left unfinished by the previous run, read by the master before forking
+_interrupted_jobs = frozenset()
+
+
+def find_interrupted_jobs(server):
+    """Gunicorn when_ready hook: no worker is running yet, so every unfinished job was interrupted."""
+    global _interrupted_jobs
+    from hsbc_jobs import open_job_store
+
+    store = open_job_store()
+    try:
+        _interrupted_jobs = frozenset(job['id'] for job in store.unfinished())
+    finally:
+        store.close()
+    if _interrupted_jobs:
+        server.log.info("Resuming %d interrupted job(s) in the first worker", len(_interrupted_jobs))
+
+
+def resume_jobs(server, worker):
+    """Gunicorn post_fork hook: the first worker resumes the interrupted jobs."""
+    if worker.age == 1 and _interrupted_jobs:
+        from index import get_jobs
+        get_jobs().resume(_interrupted_jobs)
+
+
+def gunicorn_options():
+    """Gunicorn settings derived from the environment."""
+    options = {
+        'bind': os.environ.get('HSBC_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}"),
+        'workers': WORKERS,
+        'threads': THREADS,
+        'timeout': int(os.environ.get('HSBC_TIMEOUT', 120)),
+        # Recycle workers now and then so memory held by the PDF library cannot grow unbounded
+        'max_requests': MAX_REQUESTS,
+        'max_requests_jitter': MAX_REQUESTS // 10,
+        'preload_app': True,
+        'accesslog': os.environ.get('HSBC_ACCESS_LOG'),
+    }
+    if SHARED_JOBS:
+        options.update(when_ready=find_interrupted_jobs, post_fork=resume_jobs)
+    return options
+
+
+def main():
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("gunicorn is not installed: pip install gunicorn")
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options().items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Application().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Web API 冷啟動效能測試
+
+每次執行都啟動新的 Python process (模擬 serverless 冷啟動)，量測:
+    - import api/index.py 的時間
+    - 第一個與第二個 GET / 的延遲
+    - 第一個與第二個 /process_one 的延遲 (不使用快取)
+    - 從啟動 process 到第一個 /process_one 完成的總時間
+
+分別以預設模式與 HSBC_PRELOAD=1 (import 時預先載入後端) 執行，結果取中位數並以 JSON 輸出:
+    python benchmarks/cold_start.py --runs 10 --output cold.json
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'default': {'HSBC_PRELOAD': '0'},
+    'preload': {'HSBC_PRELOAD': '1'},
+}
+
+
+def child(sample_path):
+    """在新的 process 中量測 import 與前兩個請求，結果以一行 JSON 輸出"""
+    sys.path.insert(0, os.path.join(BASE_DIR, 'api'))
+    timings = {}
+
+    t0 = time.perf_counter()
+    import index
+    timings['import_ms'] = (time.perf_counter() - t0) * 1000
+
+    client = index.app.test_client()
+    for label in ('first', 'second'):
+        t0 = time.perf_counter()
+        client.get('/')
+        timings[f'{label}_index_ms'] = (time.perf_counter() - t0) * 1000
+
+    with open(sample_path, 'rb') as f:
+        data = f.read()
+    for label in ('first', 'second'):
+        t0 = time.perf_counter()
+        response = client.post('/process_one', data={'file': (io.BytesIO(data), 'advice.pdf'), 'period_code': 'P1'})
+        timings[f'{label}_process_ms'] = (time.perf_counter() - t0) * 1000
+        timings['ok'] = response.status_code == 200
+        if label == 'first':
+            timings['ready_at'] = time.time()
+
+    # PDF 函式庫可能在 stdout 輸出警告，結果固定放在最後一行
+    print(json.dumps(timings))
+
+
+def run_once(mode, sample_path, backend=None):
+    """啟動一個新的 process 並回傳其量測結果"""
+    env = dict(os.environ, HSBC_CACHE='0', **MODES[mode])
+    if backend:
+        env['HSBC_PDF_BACKEND'] = backend
+    started = time.time()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', sample_path],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings['spawn_to_first_result_ms'] = (timings.pop('ready_at') - started) * 1000
+    return timings
+
+
+def summarize(runs):
+    """
+    取每個量測值的中位數
+
+    Args:
+        runs (list): run_once() 的結果
+
+    Returns:
+        dict: 量測名稱 -> 中位數 (毫秒)
+    """
+    names = [name for name in runs[0] if name.endswith('_ms')]
+    summary = {name: round(statistics.median(run[name] for run in runs), 2) for name in names}
+    summary['ok'] = all(run['ok'] for run in runs)
+    return summary
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        return child(sys.argv[2])
+
+    parser = argparse.ArgumentParser(description="HSBC Payment Advice Web API 冷啟動效能測試")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="每個模式啟動的 process 數量 (預設 5)")
+    parser.add_argument("--backend", help="PDF 後端 (預設為環境變數 HSBC_PDF_BACKEND 或 auto)")
+    parser.add_argument("-o", "--output", help="JSON 輸出檔案 (預設輸出到 stdout)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(BASE_DIR, 'benchmarks'))
+    from synthetic_advices import generate_corpus
+
+    with tempfile.TemporaryDirectory(prefix='hsbc_cold_') as workdir:
+        (sample_path, _), = generate_corpus(workdir, 1)
+        results = {'runs': args.runs, 'backend': args.backend, 'modes': {}}
+        for mode in MODES:
+            print(f"[cold] {mode} x {args.runs}", file=sys.stderr)
+            results['modes'][mode] = summarize([run_once(mode, sample_path, args.backend)
+                                                for _ in range(args.runs)])
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Web API 負載測試
+
+以合成的通知書對本機服務發送並行請求，在數個並行數下量測
+/process_one、/process_batch 與 /batch_upload 的 req/s、files/s 與 p50/p95/p99 延遲，
+結果以 JSON 輸出:
+    python benchmarks/load_test.py --concurrency 1,4,16 --requests 100 --workers 4 --output load.json
+
+預設會以 api/wsgi.py 自行啟動 gunicorn 服務 (停用結果快取，量測的是實際提取)。
+以 --url 對已在執行的服務測試時，該服務應以 HSBC_CACHE=0 啟動，否則重複的檔案會直接命中快取。
+"""
+
+import argparse
+import contextlib
+import http.client
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'benchmarks'))
+
+from run_benchmarks import summarize  # noqa: E402
+from synthetic_advices import generate_corpus  # noqa: E402
+
+ENDPOINTS = ('process_one', 'process_batch', 'batch_upload')
+
+# 等待自行啟動的服務可以接受請求的秒數
+STARTUP_TIMEOUT = 60
+
+
+def encode_multipart(fields, files):
+    """
+    編碼 multipart/form-data
+
+    Args:
+        fields (dict): 一般欄位
+        files (list): (欄位名稱, 檔名, 內容) 的清單
+
+    Returns:
+        tuple: (內容, Content-Type)
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     'Content-Type: application/pdf\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def build_requests(endpoint, blobs, batch_size):
+    """
+    預先編碼一個端點的請求 (量測時不包含編碼時間)
+
+    Args:
+        endpoint (str): ENDPOINTS 之一
+        blobs (list): (檔名, 內容) 的清單
+        batch_size (int): 批量端點每個請求的檔案數
+
+    Returns:
+        list: (路徑, 內容, Content-Type, 檔案數) 的清單
+    """
+    if endpoint == 'process_one':
+        groups = [[blob] for blob in blobs]
+        field = 'file'
+    else:
+        groups = [blobs[start:start + batch_size] for start in range(0, len(blobs), batch_size)]
+        field = 'files'
+    requests = []
+    for group in groups:
+        body, content_type = encode_multipart({'period_code': 'P1'}, [(field, name, data) for name, data in group])
+        requests.append((f'/{endpoint}', body, content_type, len(group)))
+    return requests
+
+
+def run_level(host, port, requests, total, concurrency):
+    """
+    以固定並行數送出 total 個請求 (循環使用預先編碼的請求)，每個並行連線各自保持連線
+
+    Args:
+        host (str): 主機
+        port (int): 連接埠
+        requests (list): build_requests() 的結果
+        total (int): 請求總數
+        concurrency (int): 並行數
+
+    Returns:
+        dict: req/s、files/s、錯誤數 (非 200 回應或連線失敗) 與延遲統計
+    """
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    totals = {'files': 0, 'errors': 0}
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=300)
+        try:
+            while True:
+                with lock:
+                    index = next(counter)
+                if index >= total:
+                    return
+                path, body, content_type, files = requests[index % len(requests)]
+                t0 = time.perf_counter()
+                try:
+                    conn.request('POST', path, body=body, headers={'Content-Type': content_type})
+                    response = conn.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    # 下一個請求會重新連線
+                    conn.close()
+                    ok = False
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    latencies.append(elapsed)
+                    if ok:
+                        totals['files'] += files
+                    else:
+                        totals['errors'] += 1
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': totals['errors'],
+        'req_per_sec': round(total / elapsed, 2),
+        'files_per_sec': round(totals['files'] / elapsed, 2),
+        'latency': summarize(latencies),
+    }
+
+
+def _wait_ready(host, port, process, log):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"服務啟動失敗:\n{log.read().decode(errors='replace')}")
+        conn = http.client.HTTPConnection(host, port, timeout=5)
+        try:
+            conn.request('GET', '/config')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.2)
+    raise RuntimeError(f"服務在 {STARTUP_TIMEOUT} 秒內沒有回應")
+
+
+@contextlib.contextmanager
+def local_server(workers, threads):
+    """
+    以 api/wsgi.py 啟動本機服務 (停用結果快取)，結束時停止
+
+    Yields:
+        str: 服務網址
+    """
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = dict(os.environ, HSBC_BIND=f'127.0.0.1:{port}', HSBC_CACHE='0',
+               HSBC_WORKERS=str(workers), HSBC_THREADS=str(threads))
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, 'api', 'wsgi.py')],
+                                   env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            _wait_ready('127.0.0.1', port, process, log)
+            yield f'http://127.0.0.1:{port}'
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HSBC Payment Advice Web API 負載測試")
+    parser.add_argument("--url", help="已在執行的服務網址 (預設自行以 api/wsgi.py 啟動)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="自行啟動的服務的 worker 數量 (預設為 CPU 核心數)")
+    parser.add_argument("--threads", type=int, default=2, help="自行啟動的服務每個 worker 的 thread 數量 (預設 2)")
+    parser.add_argument("-c", "--concurrency", default="1,4,16", help="以逗號分隔的並行數 (預設 1,4,16)")
+    parser.add_argument("-n", "--requests", type=int, default=100, help="每個並行數送出的請求數 (預設 100)")
+    parser.add_argument("--files", type=int, default=50, help="合成的通知書數量，請求會循環使用 (預設 50)")
+    parser.add_argument("--batch-size", type=int, default=10, help="批量端點每個請求的檔案數 (預設 10)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"以逗號分隔的端點 (預設 {','.join(ENDPOINTS)})")
+    parser.add_argument("-o", "--output", help="JSON 輸出檔案 (預設輸出到 stdout)")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    endpoints = args.endpoints.split(',')
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"未知的端點: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix='hsbc_load_') as workdir:
+        blobs = []
+        for path, _ in generate_corpus(workdir, args.files):
+            with open(path, 'rb') as f:
+                blobs.append((os.path.basename(path), f.read()))
+
+        server = contextlib.nullcontext(args.url) if args.url else local_server(args.workers, args.threads)
+        with server as url:
+            parsed = urllib.parse.urlsplit(url)
+            host, port = parsed.hostname, parsed.port or 80
+            results = {
+                'url': url,
+                'workers': None if args.url else args.workers,
+                'threads': None if args.url else args.threads,
+                'files': args.files,
+                'batch_size': args.batch_size,
+                'endpoints': {},
+            }
+            for endpoint in endpoints:
+                requests = build_requests(endpoint, blobs, args.batch_size)
+                # 未計時的暖身，讓每個 worker 都處理過請求
+                run_level(host, port, requests, max(levels), max(levels))
+                results['endpoints'][endpoint] = []
+                for level in levels:
+                    print(f"[load] {endpoint} 並行 {level} x {args.requests}", file=sys.stderr)
+                    results['endpoints'][endpoint].append(run_level(host, port, requests, args.requests, level))
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
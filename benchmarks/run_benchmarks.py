@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 重新命名工具效能測試
+
+以合成的通知書量測:
+    - 各後端的分段時間 (開啟 PDF、文字提取、欄位比對) 與提取速度
+    - 重新命名 (生成檔名 + os.rename) 的時間
+    - 命令列 batch_rename 的端對端 files/sec (單一 process 與 process pool)
+    - Flask app (/process_one、/process_batch) 透過 test client 的 files/sec
+
+結果以 JSON 輸出，方便跨版本追蹤:
+    python benchmarks/run_benchmarks.py --count 200 --pages 1,5 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'api'))
+
+from hsbc_backends import available_backends, resolve_backends  # noqa: E402
+from hsbc_extractor import DEFAULT_FAST_REGIONS, match_fields  # noqa: E402
+from synthetic_advices import generate_corpus  # noqa: E402
+
+
+def summarize(samples):
+    """
+    將時間樣本 (秒) 整理為毫秒統計
+
+    Args:
+        samples (list): 每個檔案的耗時 (秒)
+
+    Returns:
+        dict: mean/p50/p95/p99/max (毫秒)
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4),
+        'p50_ms': round(pct(50), 4),
+        'p95_ms': round(pct(95), 4),
+        'p99_ms': round(pct(99), 4),
+        'max_ms': round(ordered[-1] * 1000, 4),
+    }
+
+
+def _stage_functions(name):
+    """
+    各後端的分段實作: open(path) -> handle, text(handle) -> str, close(handle)
+    """
+    if name == 'pymupdf':
+        import fitz
+
+        def open_pdf(path):
+            return fitz.open(path)
+
+        def text(doc):
+            return doc[0].get_text("text")
+
+        return open_pdf, text, lambda doc: doc.close()
+
+    if name == 'pypdf':
+        from pypdf import PdfReader
+
+        def open_pdf(path):
+            return PdfReader(path).pages[0]
+
+        return open_pdf, lambda page: page.extract_text(), lambda page: None
+
+    if name == 'raw':
+        backend = resolve_backends('raw')[0]
+
+        def open_pdf(path):
+            with open(path, 'rb') as f:
+                return io.BytesIO(f.read())
+
+        return open_pdf, backend.first_page_text, lambda handle: None
+
+    raise ValueError(name)
+
+
+def bench_stages(corpus, backend_name):
+    """量測單一後端的分段時間並驗證提取結果"""
+    open_pdf, extract_text, close = _stage_functions(backend_name)
+    timings = {'open': [], 'text': [], 'regex': []}
+    correct = 0
+
+    for path, expected in corpus:
+        t0 = time.perf_counter()
+        handle = open_pdf(path)
+        t1 = time.perf_counter()
+        text = extract_text(handle)
+        t2 = time.perf_counter()
+        fields = match_fields(text)
+        t3 = time.perf_counter()
+        close(handle)
+        timings['open'].append(t1 - t0)
+        timings['text'].append(t2 - t1)
+        timings['regex'].append(t3 - t2)
+        correct += fields == expected
+
+    result = {stage: summarize(samples) for stage, samples in timings.items()}
+    result['correct'] = correct
+    return result
+
+
+def bench_extract(corpus, backend_name, regions=None):
+    """量測後端完整提取 (含區域裁切) 的 files/sec"""
+    backend = resolve_backends(backend_name)[0]
+    samples = []
+    correct = 0
+    for path, expected in corpus:
+        t0 = time.perf_counter()
+        fields = backend.extract(path, regions)
+        samples.append(time.perf_counter() - t0)
+        correct += fields == expected
+    return {'files_per_sec': round(len(samples) / sum(samples), 2), 'latency': summarize(samples), 'correct': correct}
+
+
+def bench_rename(corpus, workdir):
+    """量測生成檔名與 os.rename 的時間"""
+    target = os.path.join(workdir, 'rename')
+    os.makedirs(target)
+    samples = []
+    for i, (path, expected) in enumerate(corpus):
+        src = os.path.join(target, f"{i}.pdf")
+        shutil.copyfile(path, src)
+        t0 = time.perf_counter()
+        os.rename(src, os.path.join(target, expected.filename('P1')))
+        samples.append(time.perf_counter() - t0)
+    shutil.rmtree(target)
+    return summarize(samples)
+
+
+def bench_cli(corpus, workdir, jobs, backend_name):
+    """量測 batch_rename 的端對端 files/sec (不使用快取，輸出導向 /dev/null)"""
+    from hsbc_renamer import HSBCPaymentAdviceRenamer
+
+    target = os.path.join(workdir, f'cli_{jobs}')
+    os.makedirs(target)
+    for path, _ in corpus:
+        shutil.copy(path, target)
+
+    renamer = HSBCPaymentAdviceRenamer(backend=backend_name)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        t0 = time.perf_counter()
+        stats = renamer.batch_rename(target, 'P1', jobs=jobs)
+        elapsed = time.perf_counter() - t0
+    shutil.rmtree(target)
+    return {'jobs': jobs, 'files_per_sec': round(stats['total'] / elapsed, 2), 'seconds': round(elapsed, 4),
+            'success': stats['success']}
+
+
+def bench_flask(corpus, batch_size):
+    """透過 Flask test client 量測 /process_one 與 /process_batch 的 files/sec (不使用快取)"""
+    os.environ['HSBC_CACHE'] = '0'
+    import index
+
+    client = index.app.test_client()
+    blobs = []
+    for path, expected in corpus:
+        with open(path, 'rb') as f:
+            blobs.append((os.path.basename(path), f.read(), expected.filename('P1')))
+
+    samples = []
+    correct = 0
+    for name, data, expected_name in blobs:
+        t0 = time.perf_counter()
+        response = client.post('/process_one', data={'file': (io.BytesIO(data), name), 'period_code': 'P1'})
+        samples.append(time.perf_counter() - t0)
+        correct += response.get_json().get('new_name') == expected_name
+    process_one = {'files_per_sec': round(len(samples) / sum(samples), 2), 'latency': summarize(samples),
+                   'correct': correct}
+
+    t0 = time.perf_counter()
+    correct = 0
+    for start in range(0, len(blobs), batch_size):
+        batch = blobs[start:start + batch_size]
+        response = client.post('/process_batch', data={
+            'files': [(io.BytesIO(data), name) for name, data, _ in batch],
+            'period_code': 'P1',
+        })
+        for line in response.get_data(as_text=True).splitlines():
+            result = json.loads(line)
+            correct += result.get('new_name') == batch[result['index']][2]
+    elapsed = time.perf_counter() - t0
+    process_batch = {'batch_size': batch_size, 'files_per_sec': round(len(blobs) / elapsed, 2), 'correct': correct}
+
+    return {'process_one': process_one, 'process_batch': process_batch}
+
+
+def _metadata(backends):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    versions = {}
+    for name in backends:
+        module = {'pymupdf': 'fitz', 'pypdf': 'pypdf'}.get(name)
+        if module:
+            mod = __import__(module)
+            versions[name] = getattr(mod, 'VersionBind', None) or getattr(mod, '__version__', None)
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'backend_versions': versions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HSBC Payment Advice 重新命名工具效能測試")
+    parser.add_argument("-n", "--count", type=int, default=100, help="每個情境的檔案數量 (預設 100)")
+    parser.add_argument("--pages", default="1,5", help="以逗號分隔的頁數情境 (預設 1,5)")
+    parser.add_argument("--rows", type=int, default=40, help="每頁的交易明細列數 (預設 40)")
+    parser.add_argument("--no-cjk", action="store_true", help="不加入中文標籤")
+    parser.add_argument("--backends", help="以逗號分隔的後端 (預設為所有已安裝的後端)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="process pool 情境的 process 數量 (預設為 CPU 核心數)")
+    parser.add_argument("--batch-size", type=int, default=50, help="/process_batch 每個請求的檔案數 (預設 50)")
+    parser.add_argument("--skip-flask", action="store_true", help="不測試 Flask app")
+    parser.add_argument("-o", "--output", help="JSON 輸出檔案 (預設輸出到 stdout)")
+    args = parser.parse_args()
+
+    backends = args.backends.split(',') if args.backends else available_backends()
+    results = {'meta': _metadata(backends), 'scenarios': []}
+
+    with tempfile.TemporaryDirectory(prefix='hsbc_bench_') as workdir:
+        for pages in (int(p) for p in args.pages.split(',')):
+            corpus_dir = os.path.join(workdir, f'corpus_{pages}')
+            corpus = generate_corpus(corpus_dir, args.count, pages=pages, rows=args.rows, cjk=not args.no_cjk)
+            print(f"[bench] {pages} 頁 x {args.count} 個檔案", file=sys.stderr)
+
+            scenario = {
+                'pages': pages,
+                'rows': args.rows,
+                'files': args.count,
+                'stages': {name: bench_stages(corpus, name) for name in backends},
+                'extract': {name: bench_extract(corpus, name) for name in backends},
+                'extract_fast': {name: bench_extract(corpus, name, DEFAULT_FAST_REGIONS) for name in backends},
+                'rename': bench_rename(corpus, workdir),
+                'cli': [bench_cli(corpus, workdir, jobs, None) for jobs in sorted({1, args.jobs})],
+            }
+            if not args.skip_flask:
+                scenario['flask'] = bench_flask(corpus, args.batch_size)
+            results['scenarios'].append(scenario)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+合成 HSBC Payment Advice PDF 產生器 (需要 PyMuPDF)
+
+產生版面接近實際通知書的測試檔案: 中英文標籤、不同的 Outlet 格式、
+可調整的頁數與表格列數，並回傳每個檔案預期的提取結果以便驗證。
+"""
+
+import os
+import random
+import sys
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hsbc_extractor import AdviceFields  # noqa: E402
+
+
+# Outlet no. / Name 欄位的各種實際格式
+OUTLET_FORMATS = (
+    "{num}/ {bene} - {code}",
+    "{num}/ {bene}-{code}",
+    "{num} / {bene}-{code}",
+    "{num}/{bene} - {code}",
+)
+
+BENES = ("APC", "HKE", "KMB", "MTR", "CLP", "PCC")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+_PAGE_WIDTH, _PAGE_HEIGHT = 595, 842
+_LINE_HEIGHT = 14
+_CJK_FONT = "china-t"
+
+
+def _label(page, point, english, chinese, cjk):
+    """寫入英文標籤，cjk 為 True 時在後面加上中文標籤"""
+    page.insert_text(point, english, fontsize=9)
+    if cjk:
+        page.insert_text((point[0] + fitz.get_text_length(english, fontsize=9) + 4, point[1]),
+                         chinese, fontsize=9, fontname=_CJK_FONT)
+
+
+def generate_advice(path, fields, date, pages=1, rows=40, outlet_format=OUTLET_FORMATS[0], cjk=True, rng=None):
+    """
+    產生一份合成的 Payment Advice
+
+    Args:
+        path (str): 輸出檔案路徑
+        fields (AdviceFields): 要寫入的欄位 (year 只用於驗證，實際日期由 date 決定)
+        date (str): Advice sending date，例如 "20 Jun 2025"
+        pages (int): 頁數
+        rows (int): 每頁的交易明細列數
+        outlet_format (str): Outlet no. / Name 的格式
+        cjk (bool): 是否加入中文標籤
+        rng (random.Random): 亂數產生器
+    """
+    rng = rng or random.Random(0)
+    outlet = outlet_format.format(num=fields.outlet_num, bene=fields.bene_abbr, code=fields.outlet_code)
+    doc = fitz.open()
+
+    for page_no in range(pages):
+        page = doc.new_page(width=_PAGE_WIDTH, height=_PAGE_HEIGHT)
+        y = 50
+        if page_no == 0:
+            page.insert_text((40, y), "HSBC", fontsize=18)
+            _label(page, (40, y + 24), "Payment Advice", "付款通知書", cjk)
+            _label(page, (340, y + 24), "Advice sending date", "通知書發出日期:", cjk)
+            page.insert_text((340, y + 38), date, fontsize=9)
+            _label(page, (40, y + 60), "Payer", "付款人:", cjk)
+            page.insert_text((40, y + 74), "HONG KONG SAMPLE HOLDINGS LIMITED", fontsize=9)
+            y += 110
+            _label(page, (40, y), "Outlet no. / Name", "商戶編號/名稱", cjk)
+            _label(page, (300, y), "Amount", "金額", cjk)
+            y += _LINE_HEIGHT
+            page.insert_text((40, y), outlet, fontsize=9)
+            page.insert_text((300, y), f"HKD {rng.randint(1000, 999999) / 100:,.2f}", fontsize=9)
+            y += _LINE_HEIGHT * 2
+        else:
+            page.insert_text((40, y), f"Page {page_no + 1} of {pages}", fontsize=9)
+            y += _LINE_HEIGHT * 2
+
+        # 交易明細表格
+        _label(page, (40, y), "Invoice no.", "發票編號", cjk)
+        _label(page, (200, y), "Invoice date", "發票日期", cjk)
+        _label(page, (400, y), "Amount", "金額", cjk)
+        y += _LINE_HEIGHT
+        for _ in range(rows):
+            if y > _PAGE_HEIGHT - 40:
+                break
+            page.insert_text((40, y), f"INV{rng.randint(0, 99999999):08d}", fontsize=8)
+            page.insert_text((200, y), f"{rng.randint(1, 28)} {rng.choice(MONTHS)} {date[-4:]}", fontsize=8)
+            page.insert_text((400, y), f"{rng.randint(100, 9999999) / 100:,.2f}", fontsize=8)
+            y += _LINE_HEIGHT - 2
+
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+def generate_corpus(directory, count, pages=1, rows=40, cjk=True, seed=0):
+    """
+    產生一批合成的 Payment Advice
+
+    Args:
+        directory (str): 輸出目錄
+        count (int): 檔案數量
+        pages (int): 每份通知書的頁數
+        rows (int): 每頁的交易明細列數
+        cjk (bool): 是否加入中文標籤
+        seed (int): 亂數種子
+
+    Returns:
+        list: (檔案路徑, 預期的 AdviceFields) 的清單
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    corpus = []
+    for i in range(count):
+        year = rng.randint(2020, 2029)
+        fields = AdviceFields(
+            year=str(year)[-2:],
+            outlet_num=str(1200000000 + rng.randint(0, 99999999)),
+            bene_abbr=rng.choice(BENES),
+            outlet_code=f"IT{rng.randint(100, 999)}",
+        )
+        path = os.path.join(directory, f"advice_{i:06d}.pdf")
+        generate_advice(path, fields, f"{rng.randint(1, 28)} {rng.choice(MONTHS)} {year}",
+                        pages=pages, rows=rows, outlet_format=OUTLET_FORMATS[i % len(OUTLET_FORMATS)],
+                        cjk=cjk, rng=rng)
+        corpus.append((path, fields))
+    return corpus
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="產生合成的 HSBC Payment Advice PDF")
+    parser.add_argument("directory", help="輸出目錄")
+    parser.add_argument("-n", "--count", type=int, default=100, help="檔案數量 (預設 100)")
+    parser.add_argument("--pages", type=int, default=1, help="每份通知書的頁數 (預設 1)")
+    parser.add_argument("--rows", type=int, default=40, help="每頁的交易明細列數 (預設 40)")
+    parser.add_argument("--no-cjk", action="store_true", help="不加入中文標籤")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    generated = generate_corpus(args.directory, args.count, args.pages, args.rows, not args.no_cjk, args.seed)
+    print(f"已產生 {len(generated)} 個檔案於 {args.directory}")
@@ -0,0 +1,654 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice PDF 讀取後端
+將「開啟 PDF、取得第一頁文字」與欄位提取分開，所有後端的輸出都交給
+hsbc_extractor 的共用提取引擎驗證
+
+可用後端:
+    pymupdf  PyMuPDF (C 實作，最快，支援區域裁切)
+    raw      純 Python 內容串流掃描器 (不需任何第三方套件，只支援簡單字型)
+    pypdf    pypdf (純 Python，完整但最慢)
+
+選擇方式: 命令列 --backend 或環境變數 HSBC_PDF_BACKEND，預設 "auto"。
+auto 模式依速度排序嘗試已安裝的後端，輸出缺少欄位時自動改用下一個後端。
+"""
+
+import io
+import mmap
+import os
+import re
+import zlib
+from itertools import accumulate
+
+from hsbc_extractor import (
+    AdviceFields,
+    extract_from_pymupdf_page,
+    extract_from_pypdf_page,
+    match_fields,
+)
+from hsbc_metrics import stage
+
+
+# auto 模式的嘗試順序 (由快到慢)
+AUTO_ORDER = ('pymupdf', 'raw', 'pypdf')
+
+
+class EmptyPdfError(ValueError):
+    """PDF 沒有任何頁面"""
+
+
+class UnsupportedPdfError(ValueError):
+    """後端無法處理此 PDF 的結構 (例如 raw 掃描器遇到物件串流)"""
+
+
+def _is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+class PdfBackend:
+    """PDF 讀取後端的基底類別"""
+
+    name = None
+
+    @classmethod
+    def available(cls):
+        """此後端的依賴套件是否已安裝"""
+        return True
+
+    def extract(self, source, regions=None):
+        """
+        從 PDF 第一頁提取欄位
+
+        Args:
+            source: 檔案路徑，或可 read/seek 的二進位串流 (BytesIO、mmap 等)
+            regions (tuple): 快速提取模式的頁面區域 (不支援的後端會忽略)
+
+        Returns:
+            AdviceFields: 提取的欄位 (可能不完整)
+        """
+        raise NotImplementedError
+
+
+class PyMuPDFBackend(PdfBackend):
+    """PyMuPDF 後端"""
+
+    name = 'pymupdf'
+
+    def __init__(self):
+        import fitz  # PyMuPDF
+        self._fitz = fitz
+
+    @classmethod
+    def available(cls):
+        try:
+            import fitz  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def open(self, source):
+        """開啟 PDF，串流以 memoryview 傳入避免複製"""
+        if _is_path(source):
+            return self._fitz.open(source)
+        if isinstance(source, io.BytesIO):
+            return self._fitz.open(stream=source.getbuffer(), filetype='pdf')
+        if isinstance(source, mmap.mmap):
+            return self._fitz.open(stream=memoryview(source), filetype='pdf')
+        source.seek(0)
+        return self._fitz.open(stream=source.read(), filetype='pdf')
+
+    def extract(self, source, regions=None):
+        with stage('open'):
+            doc = self.open(source)
+        try:
+            if doc.page_count == 0:
+                raise EmptyPdfError("Empty PDF")
+            return extract_from_pymupdf_page(doc[0], regions)  # 只需要第一頁
+        finally:
+            doc.close()
+
+
+class PypdfBackend(PdfBackend):
+    """pypdf 後端"""
+
+    name = 'pypdf'
+
+    def __init__(self):
+        from pypdf import PdfReader
+        self._reader_class = PdfReader
+
+    @classmethod
+    def available(cls):
+        try:
+            import pypdf  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def extract(self, source, regions=None):
+        with stage('open'):
+            if not _is_path(source):
+                source.seek(0)
+            reader = self._reader_class(source)
+            if len(reader.pages) == 0:
+                raise EmptyPdfError("Empty PDF")
+            page = reader.pages[0]
+        return extract_from_pypdf_page(page, regions)
+
+
+# --- raw 內容串流掃描器 ---
+
+_OBJ_RE = re.compile(rb"(\d+)\s+\d+\s+obj\b")
+_ROOT_RE = re.compile(rb"/Root\s+(\d+)\s+\d+\s+R")
+_PAGES_RE = re.compile(rb"/Pages\s+(\d+)\s+\d+\s+R")
+_KIDS_RE = re.compile(rb"/Kids\s*\[\s*(\d+)\s+\d+\s+R")
+_TYPE_PAGE_RE = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+_CONTENTS_RE = re.compile(rb"/Contents\s*(\[[^\]]*\]|\d+\s+\d+\s+R)")
+_REF_RE = re.compile(rb"(\d+)\s+\d+\s+R")
+# 間接長度 (/Length 12 0 R) 不符合：\b 避免回溯成只取前幾位數字，改以 endstream 定位串流結尾
+_LENGTH_RE = re.compile(rb"/Length\s+(\d+)\b(?!\s+\d+\s+R)")
+_FILTER_RE = re.compile(rb"/Filter\s*\[?\s*/(\w+)")
+_STREAM_RE = re.compile(rb"stream\r?\n")
+_ENDOBJ_RE = re.compile(rb"endobj")
+
+# 交叉參照表 (xref)：startxref 位於檔尾的這個範圍內，trailer 字典不超過 _TRAILER_WINDOW
+_TAIL_WINDOW = 1024
+_TRAILER_WINDOW = 4096
+_XREF_ENTRY_SIZE = 20
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+_OBJ_AT_RE = re.compile(rb"\s*(\d+)\s+\d+\s+obj\b")
+_XREF_SECTION_RE = re.compile(rb"\s*(\d+)[ ]+(\d+)[ \t]*\r?\n")
+_XREF_ENTRY_RE = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+_TRAILER_RE = re.compile(rb"\s*trailer")
+_PREV_RE = re.compile(rb"/Prev\s+(\d+)")
+_XREFSTM_RE = re.compile(rb"/XRefStm\s+(\d+)")
+_XREF_TYPE_RE = re.compile(rb"/Type\s*/XRef\b")
+_W_RE = re.compile(rb"/W\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s*\]")
+_INDEX_RE = re.compile(rb"/Index\s*\[([\d\s]*)\]")
+_SIZE_RE = re.compile(rb"/Size\s+(\d+)")
+_PREDICTOR_RE = re.compile(rb"/Predictor\s+(\d+)")
+_COLUMNS_RE = re.compile(rb"/Columns\s+(\d+)")
+
+_TOKEN_RE = re.compile(
+    rb"\((?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*\)"     # 字面字串 (允許一層巢狀括號)
+    rb"|<<|>>"                                        # 字典
+    rb"|<[0-9A-Fa-f\s]*>"                             # 十六進位字串
+    rb"|\[|\]"
+    rb"|/[^\s/\[\]()<>{}%]+"                          # 名稱
+    rb"|[-+]?(?:\d+\.?\d*|\.\d+)"                     # 數字
+    rb"|[A-Za-z'\"*][A-Za-z0-9*]*"                    # 運算子
+    rb"|%[^\r\n]*",                                   # 註解
+    re.DOTALL,
+)
+_ESCAPE_RE = re.compile(rb"\\([0-7]{1,3}|\r\n|.)", re.DOTALL)
+_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f', b'\r\n': b'', b'\n': b'', b'\r': b''}
+
+# TJ 陣列中的字距調整小於此值時視為單字間的空白
+_TJ_SPACE_THRESHOLD = -200
+
+
+def _unescape(match):
+    value = match.group(1)
+    if value[:1].isdigit():
+        return bytes([int(value, 8) & 0xFF])
+    return _ESCAPES.get(value, value)
+
+
+def _decode_string(token):
+    if token[:1] == b'(':
+        return _ESCAPE_RE.sub(_unescape, token[1:-1]).decode('latin-1')
+    return bytes.fromhex(re.sub(rb"\s", b"", token[1:-1]).decode('ascii').ljust(2, '0')).decode('latin-1')
+
+
+def content_stream_text(content):
+    """
+    掃描內容串流中的文字運算子 (Tj、TJ、'、")，依文字位置變化插入換行
+
+    Args:
+        content (bytes): 已解碼的內容串流
+
+    Returns:
+        str: 頁面文字
+    """
+    parts = []
+    operands = []
+    array = None
+    last_y = None
+
+    for match in _TOKEN_RE.finditer(content):
+        token = match.group()
+        first = token[:1]
+        if first == b'%':
+            continue
+        if first == b'[':
+            array = []
+        elif first == b']':
+            operands.append(array if array is not None else [])
+            array = None
+        elif first == b'(' or (first == b'<' and token != b'<<'):
+            value = _decode_string(token)
+            (array if array is not None else operands).append(value)
+        elif first in b'+-.0123456789':
+            value = float(token)
+            (array if array is not None else operands).append(value)
+        elif first == b'/' or token in (b'<<', b'>>'):
+            if array is None:
+                operands.append(token)
+        else:
+            op = token
+            if op == b'Tj' and operands and isinstance(operands[-1], str):
+                parts.append(operands[-1])
+            elif op == b'TJ' and operands and isinstance(operands[-1], list):
+                for item in operands[-1]:
+                    if isinstance(item, str):
+                        parts.append(item)
+                    elif item < _TJ_SPACE_THRESHOLD:
+                        parts.append(' ')
+            elif op in (b"'", b'"'):
+                parts.append('\n')
+                if operands and isinstance(operands[-1], str):
+                    parts.append(operands[-1])
+            elif op == b'T*':
+                parts.append('\n')
+            elif op in (b'Td', b'TD'):
+                if len(operands) >= 2 and operands[-1] != 0:
+                    parts.append('\n')
+            elif op == b'Tm':
+                if len(operands) >= 6 and operands[-1] != last_y:
+                    if last_y is not None:
+                        parts.append('\n')
+                    last_y = operands[-1]
+            elif op == b'ET':
+                parts.append(' ')
+            operands = []
+
+    return ''.join(parts)
+
+
+class _BrokenXrefError(UnsupportedPdfError):
+    """xref 缺少或內容不符 (改為掃描整個檔案找出物件)"""
+
+
+def _decode_stream(obj):
+    """解碼物件中的串流 (只支援未壓縮與 FlateDecode)"""
+    header, sep, rest = obj.partition(b"stream")
+    if not sep:
+        raise UnsupportedPdfError("content object has no stream")
+    eol = _STREAM_RE.match(obj, len(header))
+    start = eol.end() if eol else len(header) + len(sep)
+    length = _LENGTH_RE.search(header)
+    if length:
+        raw = obj[start:start + int(length.group(1))]
+    else:
+        raw = obj[start:obj.rfind(b"endstream")].rstrip(b"\r\n")
+
+    filters = _FILTER_RE.findall(header)
+    if not filters:
+        return raw
+    if filters == [b'FlateDecode']:
+        return zlib.decompressobj().decompress(raw)
+    raise UnsupportedPdfError(f"unsupported stream filter: {filters}")
+
+
+def _png_unpredict(data, dictionary):
+    """還原 xref 串流的 PNG 預測編碼 (None、Sub、Up)"""
+    predictor = _PREDICTOR_RE.search(dictionary)
+    if predictor is None or int(predictor.group(1)) == 1:
+        return data
+    if int(predictor.group(1)) < 10:
+        raise _BrokenXrefError("unsupported xref predictor")
+    columns = _COLUMNS_RE.search(dictionary)
+    columns = int(columns.group(1)) if columns else 1
+
+    stride = columns + 1
+    data = data[:len(data) // stride * stride]
+    kinds = set(data[0::stride])
+    if kinds == {2}:
+        # 寫出程式幾乎都整表使用 Up：逐欄累加，不需逐位元組迴圈
+        table = bytearray(len(data) // stride * columns)
+        for column in range(columns):
+            table[column::columns] = bytes(map((0xFF).__and__, accumulate(data[column + 1::stride])))
+        return bytes(table)
+
+    rows = []
+    previous = bytes(columns)
+    for start in range(0, len(data) - columns, stride):
+        kind, row = data[start], bytearray(data[start + 1:start + 1 + columns])
+        if kind == 1:
+            for i in range(1, columns):
+                row[i] = (row[i] + row[i - 1]) & 0xFF
+        elif kind == 2:
+            row = bytearray((a + b) & 0xFF for a, b in zip(row, previous))
+        elif kind != 0:
+            raise _BrokenXrefError("unsupported xref predictor")
+        rows.append(bytes(row))
+        previous = row
+    return b"".join(rows)
+
+
+class _CrossReference:
+    """
+    PDF 的交叉參照表：依物件編號直接算出物件位置，不需掃描整個檔案
+
+    從檔尾的 startxref 開始，依 /Prev 由新到舊讀取各區段 (傳統 xref 表、
+    PDF 1.5 的 xref 串流或兩者混合)。表項在查詢時才解析。
+    """
+
+    def __init__(self, data):
+        self.data = data
+        # 由新到舊: (第一個物件編號, 物件數量, 讀取區段中第 i 個表項的函式)
+        self.sections = []
+        self.root = None
+
+        starts = _STARTXREF_RE.findall(data, max(0, len(data) - _TAIL_WINDOW))
+        if not starts:
+            raise _BrokenXrefError("startxref not found")
+        pos, seen = int(starts[-1]), set()
+        while pos is not None:
+            if pos in seen or pos >= len(data):
+                raise _BrokenXrefError("invalid xref offset")
+            seen.add(pos)
+            trailer = self._read_section(pos)
+            root = _ROOT_RE.search(trailer)
+            if self.root is None and root:
+                self.root = int(root.group(1))
+            prev = _PREV_RE.search(trailer)
+            pos = int(prev.group(1)) if prev else None
+        if self.root is None:
+            raise _BrokenXrefError("document catalog not found")
+
+    def offset(self, num):
+        """
+        查詢物件位置
+
+        Returns:
+            int: 物件在檔案中的位置，不存在 (或已刪除) 時為 None
+
+        Raises:
+            UnsupportedPdfError: 物件位於壓縮的物件串流中
+        """
+        for first, count, entry in self.sections:
+            if first <= num < first + count:
+                return entry(num - first)
+        return None
+
+    def _read_section(self, pos):
+        """讀取一個 xref 區段，回傳其 trailer 字典"""
+        if bytes(self.data[pos:pos + 4]) == b'xref':
+            trailer = self._read_table(pos + 4)
+            hybrid = _XREFSTM_RE.search(trailer)
+            if hybrid:
+                # 混合格式: 傳統表之後接著查詢 xref 串流中的物件
+                self._read_stream(int(hybrid.group(1)))
+            return trailer
+        return self._read_stream(pos)
+
+    def _read_table(self, pos):
+        data = self.data
+        while True:
+            header = _XREF_SECTION_RE.match(data, pos)
+            if header is None:
+                break
+            first, count, start = int(header.group(1)), int(header.group(2)), header.end()
+            self.sections.append((first, count, lambda index, start=start: self._table_entry(start, index)))
+            pos = start + count * _XREF_ENTRY_SIZE
+        trailer = _TRAILER_RE.match(data, pos)
+        if trailer is None:
+            raise _BrokenXrefError("xref trailer not found")
+        start = trailer.end()
+        end = _STARTXREF_RE.search(data, start, start + _TRAILER_WINDOW)
+        return bytes(data[start:end.start() if end else start + _TRAILER_WINDOW])
+
+    def _table_entry(self, start, index):
+        entry = _XREF_ENTRY_RE.match(self.data, start + index * _XREF_ENTRY_SIZE)
+        if entry is None:
+            raise _BrokenXrefError("malformed xref entry")
+        return int(entry.group(1)) if entry.group(3) == b'n' else None
+
+    def _read_stream(self, pos):
+        header = _OBJ_AT_RE.match(self.data, pos)
+        if header is None:
+            raise _BrokenXrefError("xref not found at startxref")
+        end = _ENDOBJ_RE.search(self.data, header.end())
+        obj = bytes(self.data[header.end():end.start() if end else len(self.data)])
+        dictionary = obj.partition(b"stream")[0]
+        widths = _W_RE.search(dictionary)
+        if not _XREF_TYPE_RE.search(dictionary) or widths is None:
+            raise _BrokenXrefError("xref not found at startxref")
+        widths = tuple(int(width) for width in widths.groups())
+        table = _png_unpredict(_decode_stream(obj), dictionary)
+
+        index = _INDEX_RE.search(dictionary)
+        size = _SIZE_RE.search(dictionary)
+        if index:
+            numbers = [int(number) for number in index.group(1).split()]
+        elif size:
+            numbers = [0, int(size.group(1))]
+        else:
+            raise _BrokenXrefError("xref stream without /Size")
+        row = 0
+        for first, count in zip(numbers[0::2], numbers[1::2]):
+            self.sections.append((first, count, lambda index, row=row: self._stream_entry(table, widths, row + index)))
+            row += count
+        return dictionary
+
+    @staticmethod
+    def _stream_entry(table, widths, row):
+        size = sum(widths)
+        entry = table[row * size:(row + 1) * size]
+        if len(entry) < size:
+            raise _BrokenXrefError("truncated xref stream")
+        fields, pos = [], 0
+        for width in widths:
+            fields.append(int.from_bytes(entry[pos:pos + width], 'big'))
+            pos += width
+        kind = fields[0] if widths[0] else 1
+        if kind == 1:
+            return fields[1]
+        if kind == 2:
+            raise UnsupportedPdfError("object in compressed object stream")
+        return None
+
+
+class RawStreamBackend(PdfBackend):
+    """
+    純 Python 內容串流掃描器
+
+    只解析到第一頁的內容串流為止，不建立完整的文件物件。
+    物件串流、加密或 CID 字型等結構無法處理，auto 模式會改用其他後端。
+    """
+
+    name = 'raw'
+
+    def first_page_text(self, source):
+        """
+        取得第一頁的文字
+
+        Args:
+            source: 檔案路徑或二進位串流
+
+        Returns:
+            str: 第一頁文字
+        """
+        if _is_path(source):
+            with open(source, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    raise EmptyPdfError("Empty PDF")
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    return self._scan(view)
+        if isinstance(source, io.BytesIO):
+            with source.getbuffer() as view:
+                return self._scan(view)
+        if isinstance(source, mmap.mmap):
+            return self._scan(source)
+        source.seek(0)
+        return self._scan(source.read())
+
+    def _scan(self, data):
+        with stage('open'):
+            content = self._first_page_content(data)
+        with stage('text'):
+            return content_stream_text(content)
+
+    def _first_page_content(self, data):
+        """定位第一頁並解壓縮其內容串流"""
+        nodes, body = self.first_page(data)
+        return self.page_content(nodes[-1], body)
+
+    def first_page(self, data):
+        """
+        沿著頁面樹定位第一頁，不解析其他物件
+
+        Args:
+            data: PDF 內容 (bytes、memoryview 或 mmap)
+
+        Returns:
+            tuple: (從 /Pages 根節點到第一頁的物件內容清單, 依物件編號取得物件內容的函式)
+        """
+        if len(data) == 0:
+            raise EmptyPdfError("Empty PDF")
+
+        # 以 xref 直接定位需要的物件；xref 缺少或位置不符時才掃描整個檔案
+        try:
+            xref = _CrossReference(data)
+        except (_BrokenXrefError, ValueError, zlib.error):
+            xref = None
+        scanned = None
+
+        def scan():
+            nonlocal scanned
+            if scanned is None:
+                # 物件編號 -> 位置索引 (增量更新時以最後一個為準)
+                scanned = {int(m.group(1)): m.end() for m in _OBJ_RE.finditer(data)}
+            return scanned
+
+        def locate(num):
+            if xref is not None:
+                try:
+                    offset = xref.offset(num)
+                except _BrokenXrefError:
+                    offset = None
+                header = _OBJ_AT_RE.match(data, offset) if offset is not None else None
+                if header is not None and int(header.group(1)) == num:
+                    return header.end()
+            return scan().get(num)
+
+        def body(num):
+            start = locate(num)
+            if start is None:
+                raise UnsupportedPdfError(f"object {num} not found (compressed object stream?)")
+            end = _ENDOBJ_RE.search(data, start)
+            return bytes(data[start:end.start() if end else len(data)])
+
+        roots = [xref.root] if xref is not None else _ROOT_RE.findall(data)
+        if not roots:
+            raise UnsupportedPdfError("document catalog not found")
+        pages = _PAGES_RE.search(body(int(roots[-1])))
+        if not pages:
+            raise UnsupportedPdfError("page tree not found")
+
+        # 沿著 /Kids 找到第一頁 (上層節點保留給可繼承的屬性，例如 /MediaBox)
+        nodes = [body(int(pages.group(1)))]
+        for _ in range(32):
+            if _TYPE_PAGE_RE.search(nodes[-1]):
+                break
+            kids = _KIDS_RE.search(nodes[-1])
+            if not kids:
+                raise EmptyPdfError("Empty PDF")
+            nodes.append(body(int(kids.group(1))))
+        else:
+            raise UnsupportedPdfError("page tree too deep")
+        return nodes, body
+
+    def page_content(self, node, body):
+        """
+        解壓縮頁面的內容串流
+
+        Args:
+            node (bytes): 頁面物件內容
+            body: first_page() 回傳的物件查詢函式
+
+        Returns:
+            bytes: 內容串流 (沒有內容時為空)
+        """
+        contents = _CONTENTS_RE.search(node)
+        if not contents:
+            return b''
+        return b"\n".join(_decode_stream(body(int(ref))) for ref in _REF_RE.findall(contents.group(1)))
+
+    def extract(self, source, regions=None):
+        # 第一頁內容串流通常只有數 KB，直接掃描整頁比裁切區域更省時
+        text = self.first_page_text(source)
+        with stage('match'):
+            return match_fields(text)
+
+
+BACKENDS = {
+    'pymupdf': PyMuPDFBackend,
+    'pypdf': PypdfBackend,
+    'raw': RawStreamBackend,
+}
+
+
+def available_backends():
+    """
+    列出已安裝的後端 (依 auto 模式的順序)
+
+    Returns:
+        list: 後端名稱
+    """
+    return [name for name in AUTO_ORDER if BACKENDS[name].available()]
+
+
+def resolve_backends(name=None):
+    """
+    依名稱建立後端清單
+
+    Args:
+        name (str): 後端名稱或 "auto" (None 時讀取環境變數 HSBC_PDF_BACKEND)
+
+    Returns:
+        list: PdfBackend 實例，依嘗試順序排列
+    """
+    name = (name or os.environ.get('HSBC_PDF_BACKEND') or 'auto').lower()
+    if name == 'auto':
+        names = available_backends()
+    elif name in BACKENDS:
+        if not BACKENDS[name].available():
+            raise ValueError(f"PDF 後端 '{name}' 未安裝")
+        names = [name]
+    else:
+        raise ValueError(f"未知的 PDF 後端 '{name}' (可用: auto, {', '.join(BACKENDS)})")
+    return [BACKENDS[n]() for n in names]
+
+
+def extract_with_backends(source, backends, regions=None):
+    """
+    依序使用後端提取欄位，輸出不完整或發生錯誤時改用下一個後端
+
+    Args:
+        source: 檔案路徑或二進位串流
+        backends (list): resolve_backends() 的結果
+        regions (tuple): 快速提取模式的頁面區域
+
+    Returns:
+        tuple: (AdviceFields, 產生結果的後端名稱)
+    """
+    fields, used, error = None, None, None
+    for backend in backends:
+        try:
+            result = backend.extract(source, regions)
+        except EmptyPdfError:
+            raise
+        except Exception as e:
+            error = e
+            continue
+        if result.complete:
+            return result, backend.name
+        if fields is None:
+            fields, used = result, backend.name
+    if fields is None:
+        if error is not None:
+            raise error
+        return AdviceFields(), None
+    return fields, used
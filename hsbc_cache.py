@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 提取結果快取
+以 PDF 內容的 SHA-256 為鍵，將提取的欄位保存在 SQLite 檔案中
+
+命令列工具另外以 (size, mtime, inode) 作為預先鍵，檔案未變動時完全不需要計算雜湊。
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from hsbc_extractor import AdviceFields
+
+
+# 提取邏輯或資料表結構改變時遞增，舊的快取會自動清除
+CACHE_VERSION = 1
+
+# 預設最多保存的結果數量，超過時淘汰最久未使用的項目
+DEFAULT_MAX_ENTRIES = 200_000
+
+# 預設每寫入多少筆提交一次
+DEFAULT_FLUSH_INTERVAL = 256
+
+# 每寫入多少筆檢查一次大小上限
+_EVICT_INTERVAL = 1024
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# get_many() 每次查詢的雜湊數量 (SQLite 預設最多 999 個參數)
+_LOOKUP_CHUNK_SIZE = 500
+
+
+def default_cache_path():
+    """
+    取得預設快取檔案路徑 (可用環境變數 HSBC_CACHE_PATH 覆寫)
+
+    Returns:
+        str: 快取檔案路徑
+    """
+    if os.environ.get('HSBC_CACHE_PATH'):
+        return os.environ['HSBC_CACHE_PATH']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    if not os.access(os.path.expanduser('~'), os.W_OK):
+        # 唯讀的家目錄 (例如 serverless 環境) 改用暫存目錄
+        base = tempfile.gettempdir()
+    return os.path.join(base, 'hsbc_renamer', 'results.sqlite')
+
+
+def file_digest(path):
+    """
+    計算檔案內容的 SHA-256
+
+    Args:
+        path (str): 檔案路徑
+
+    Returns:
+        str: 十六進位雜湊值
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bytes_digest(data):
+    """計算位元組內容的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def stat_key(path):
+    """
+    取得檔案的預先鍵 (device, inode, size, mtime)
+
+    重新命名不會改變這些值，因此重跑已處理過的資料夾仍可命中。
+    """
+    st = os.stat(path)
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class ResultCache:
+    """以內容雜湊為鍵的提取結果快取"""
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        初始化快取
+
+        Args:
+            path (str): SQLite 檔案路徑 (None 為預設路徑)
+            max_entries (int): 最多保存的結果數量
+            flush_interval (int): 每寫入多少筆提交一次 (多個 process 共用時應設為 1)
+        """
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._writes = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is not None and row[0] != str(CACHE_VERSION):
+                self._conn.execute("DROP TABLE IF EXISTS results")
+                self._conn.execute("DROP TABLE IF EXISTS file_keys")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " digest TEXT PRIMARY KEY, year TEXT, outlet_num TEXT,"
+                " bene_abbr TEXT, outlet_code TEXT, last_used REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_keys ("
+                " dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, digest TEXT,"
+                " PRIMARY KEY (dev, ino, size, mtime_ns))"
+            )
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(CACHE_VERSION),))
+
+    def get(self, digest):
+        """
+        以內容雜湊查詢
+
+        Args:
+            digest (str): SHA-256 雜湊值
+
+        Returns:
+            AdviceFields: 快取的欄位，未命中時為 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT year, outlet_num, bene_abbr, outlet_code FROM results WHERE digest = ?", (digest,)
+            ).fetchone()
+        return AdviceFields(*row) if row else None
+
+    def get_many(self, digests):
+        """
+        一次查詢多個內容雜湊
+
+        Args:
+            digests (iterable): SHA-256 雜湊值
+
+        Returns:
+            dict: 命中的雜湊值 -> AdviceFields (未命中的不在其中)
+        """
+        digests = list(dict.fromkeys(digests))
+        found = {}
+        with self._lock:
+            # 分段查詢，不超過 SQLite 的參數數量上限
+            for start in range(0, len(digests), _LOOKUP_CHUNK_SIZE):
+                chunk = digests[start:start + _LOOKUP_CHUNK_SIZE]
+                rows = self._conn.execute(
+                    "SELECT digest, year, outlet_num, bene_abbr, outlet_code FROM results"
+                    f" WHERE digest IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for digest, *fields in rows:
+                    found[digest] = AdviceFields(*fields)
+        return found
+
+    def put(self, digest, fields, key=None):
+        """
+        保存提取結果
+
+        Args:
+            digest (str): SHA-256 雜湊值
+            fields (AdviceFields): 提取的欄位
+            key (tuple): stat_key() 的預先鍵 (可選)
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, fields.year, fields.outlet_num, fields.bene_abbr, fields.outlet_code, time.time()),
+            )
+            if key is not None:
+                self._conn.execute("INSERT OR REPLACE INTO file_keys VALUES (?, ?, ?, ?, ?)", (*key, digest))
+            self._pending += 1
+            self._writes += 1
+            if self._writes % _EVICT_INTERVAL == 0:
+                self._evict()
+            if self._pending >= self.flush_interval:
+                self._flush()
+
+    def lookup_file(self, path):
+        """
+        以預先鍵查詢檔案，不讀取檔案內容
+
+        Args:
+            path (str): 檔案路徑
+
+        Returns:
+            tuple: (快取的 AdviceFields, 內容雜湊)，未命中時為 None
+        """
+        try:
+            key = stat_key(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT r.digest, r.year, r.outlet_num, r.bene_abbr, r.outlet_code"
+                " FROM file_keys k JOIN results r ON r.digest = k.digest"
+                " WHERE k.dev = ? AND k.ino = ? AND k.size = ? AND k.mtime_ns = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE results SET last_used = ? WHERE digest = ?", (time.time(), row[0]))
+            self._pending += 1
+            if self._pending >= self.flush_interval:
+                self._flush()
+        return AdviceFields(*row[1:]), row[0]
+
+    def clear(self):
+        """清除所有快取項目"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results")
+            self._conn.execute("DELETE FROM file_keys")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _evict(self):
+        """淘汰超出上限、最久未使用的項目 (呼叫端需持有 lock)"""
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            # 一次淘汰到上限的 90%，避免每次檢查都觸發淘汰
+            excess = count - int(self.max_entries * 0.9)
+            self._conn.execute(
+                "DELETE FROM results WHERE digest IN"
+                " (SELECT digest FROM results ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._conn.execute("DELETE FROM file_keys WHERE digest NOT IN (SELECT digest FROM results)")
+
+    def flush(self):
+        """提交尚未寫入的變更"""
+        with self._lock:
+            if self._conn is not None:
+                self._flush()
+
+    def _flush(self):
+        """提交尚未寫入的變更 (呼叫端需持有 lock)"""
+        self._conn.commit()
+        self._pending = 0
+
+    def close(self):
+        """淘汰超出上限的項目、提交變更並關閉"""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._evict()
+            self._flush()
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
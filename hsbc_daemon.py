@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 重新命名背景服務 (Unix domain socket)
+上游腳本每收到一個檔案就呼叫一次命令列時，每次都要付出 Python 啟動、
+PDF 函式庫 import 與 process pool 建立的成本。背景服務常駐並保持這些資源，
+命令列只把請求轉送過來，再把背景服務的輸出原樣印出。
+
+本模組只負責傳輸，不 import 任何 PDF 相關模組，讓轉送端保持輕量。
+
+協定 (每行一個 JSON 物件):
+    客戶端 -> 服務: 一個請求物件
+    服務 -> 客戶端: {"out": 輸出文字} ... 最後一行 {"result": ...} 或 {"error": 錯誤訊息}
+"""
+
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+
+
+# 連線到背景服務的逾時秒數；逾時視為沒有背景服務
+CONNECT_TIMEOUT = 0.5
+
+
+def default_socket_path():
+    """
+    取得預設 socket 路徑 (可用環境變數 HSBC_DAEMON_SOCKET 覆寫)
+
+    Returns:
+        str: socket 路徑
+    """
+    if os.environ.get('HSBC_DAEMON_SOCKET'):
+        return os.environ['HSBC_DAEMON_SOCKET']
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, f"hsbc_renamer-{os.getuid()}.sock")
+
+
+class DaemonUnavailable(Exception):
+    """沒有執行中的背景服務"""
+
+
+class _LineWriter:
+    """將 print 的輸出逐行送給客戶端 (取代 sys.stdout)"""
+
+    def __init__(self, send):
+        self._send = send
+        self._buffer = ''
+
+    def write(self, text):
+        self._buffer += text
+        # 以 \r 覆寫的進度行同樣立即送出
+        end = max(self._buffer.rfind('\n'), self._buffer.rfind('\r')) + 1
+        if end:
+            self._send({'out': self._buffer[:end]})
+            self._buffer = self._buffer[end:]
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            self._send({'out': self._buffer})
+            self._buffer = ''
+
+
+def _send_line(conn, message):
+    conn.sendall((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+def _bind(path):
+    """建立監聽 socket；已有服務在執行時拋出 OSError，殘留的 socket 檔案會被移除"""
+    if os.path.exists(path):
+        try:
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            probe.settimeout(CONNECT_TIMEOUT)
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            probe.close()
+            raise OSError(f"背景服務已在 '{path}' 執行")
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        # 只有同一個使用者可以連線
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    return server
+
+
+def serve(path, handle):
+    """
+    依序處理請求直到 Ctrl+C 或 SIGTERM (同一時間只處理一個請求，輸出不會交錯)
+
+    Args:
+        path (str): socket 路徑
+        handle (callable): handle(request) -> 可轉為 JSON 的結果；執行期間的 print 會送到客戶端
+    """
+    server = _bind(path)
+    # 以 kill 停止時同樣移除 socket 檔案
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    print(f"[資訊] 背景服務已啟動: {path} (Ctrl+C 停止)", flush=True)
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                _serve_connection(conn, handle)
+    except KeyboardInterrupt:
+        print("\n[資訊] 背景服務已停止")
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _serve_connection(conn, handle):
+    try:
+        with conn.makefile('r', encoding='utf-8') as reader:
+            request = json.loads(reader.readline())
+    except (OSError, ValueError):
+        return
+
+    writer = _LineWriter(lambda message: _send_line(conn, message))
+    stdout = sys.stdout
+    sys.stdout = writer
+    try:
+        result = handle(request)
+        writer.flush()
+        _send_line(conn, {'result': result})
+    except (BrokenPipeError, ConnectionError):
+        # 客戶端已中斷連線
+        pass
+    except Exception as e:
+        sys.stdout = stdout
+        try:
+            _send_line(conn, {'error': str(e)})
+        except OSError:
+            pass
+    finally:
+        sys.stdout = stdout
+
+
+def forward(request, path=None, out=None):
+    """
+    將請求轉送給背景服務，並即時印出服務的輸出
+
+    Args:
+        request (dict): 請求
+        path (str): socket 路徑 (None 為 default_socket_path())
+        out: 輸出目標 (None 為 sys.stdout)
+
+    Returns:
+        結果 (handle 的回傳值)
+
+    Raises:
+        DaemonUnavailable: 沒有背景服務 (呼叫端應改為在本 process 中處理)
+        RuntimeError: 背景服務回報錯誤或連線中斷
+    """
+    path = path or default_socket_path()
+    out = out or sys.stdout
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(CONNECT_TIMEOUT)
+        try:
+            conn.connect(path)
+        except OSError as e:
+            raise DaemonUnavailable(str(e)) from e
+        # 批量處理可能需要很久，連線後不設逾時
+        conn.settimeout(None)
+        _send_line(conn, request)
+
+        with conn.makefile('r', encoding='utf-8') as reader:
+            for line in reader:
+                message = json.loads(line)
+                if 'out' in message:
+                    out.write(message['out'])
+                    out.flush()
+                elif 'error' in message:
+                    raise RuntimeError(message['error'])
+                else:
+                    return message.get('result')
+        raise RuntimeError("與背景服務的連線中斷")
+    finally:
+        conn.close()
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 欄位提取引擎
+命令列工具 (hsbc_payment_renamer.py) 與 Web API (api/index.py) 共用
+
+所有正則表達式在模組載入時編譯一次，文字只需掃描一遍即可取得所有欄位。
+本模組不依賴任何 PDF 函式庫，頁面物件由呼叫端傳入。
+"""
+
+import re
+
+from hsbc_metrics import stage
+
+
+# "Advice sending date" 標籤後的日期，例如 "Advice sending date 通知書發出日期:\n20 Jun 2025"
+DATE_LABEL_PATTERN = re.compile(r"Advice sending date.*?(\d{1,2}\s+\w{3}\s+(\d{4}))", re.DOTALL | re.IGNORECASE)
+
+# 標籤遺失或亂碼時的備用日期格式，例如 "20 Jun 2025"
+FALLBACK_DATE_PATTERN = re.compile(
+    r"\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+(\d{4})", re.IGNORECASE
+)
+
+# 主表格的 Outlet no. / Name，例如 "1208008138/ APC-IT801" 或 "1208008138 / APC - IT801"
+OUTLET_PATTERN = re.compile(r"(\d{10,})\s*/\s*([A-Z]{3})\s*-?\s*([A-Z0-9]+)")
+
+# 合併以上三種模式，以單次掃描收集所有欄位
+FIELD_PATTERN = re.compile(
+    r"(?P<label>(?i:Advice sending date)(?s:.*?)\d{1,2}\s+\w{3}\s+(?P<label_year>\d{4}))"
+    r"|(?P<date>\d{1,2}\s+(?i:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)(?i:[a-z]*)\s+(?P<date_year>\d{4}))"
+    r"|(?P<outlet_num>\d{10,})\s*/\s*(?P<bene_abbr>[A-Z]{3})\s*-?\s*(?P<outlet_code>[A-Z0-9]+)"
+)
+
+# 已重新命名的檔名 (YY_PX_BENE_CODE_OUTLETNUM.pdf，檔名衝突時可能有 _2 等後綴)，監看或重跑時可直接略過
+RENAMED_FILENAME_PATTERN = re.compile(r"\d{2}_[^_]+_[A-Z]{3}_[A-Z0-9]+_\d{10,}(?:_\d+)?\.(?i:pdf)")
+
+# 快速提取模式預設的頁面區域 (以頁面寬高比例表示: x0, y0, x1, y1，原點在左上角)
+# 依序為: 頁首 (Advice sending date)、主表格開頭 (Outlet no. / Name)
+DEFAULT_FAST_REGIONS = (
+    (0.0, 0.0, 1.0, 0.35),
+    (0.0, 0.25, 1.0, 0.6),
+)
+
+
+class AdviceFields:
+    """從 Payment Advice 提取的欄位"""
+
+    __slots__ = ('year', 'outlet_num', 'bene_abbr', 'outlet_code')
+
+    def __init__(self, year=None, outlet_num=None, bene_abbr=None, outlet_code=None):
+        self.year = year
+        self.outlet_num = outlet_num
+        self.bene_abbr = bene_abbr
+        self.outlet_code = outlet_code
+
+    @property
+    def complete(self):
+        """是否已取得所有欄位"""
+        return self.year is not None and self.outlet_num is not None
+
+    def as_dict(self):
+        """轉換為字典"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def filename(self, period_code):
+        """
+        生成新檔名，格式: YY_PX_BENE_CODE_OUTLETNUM.pdf
+
+        Args:
+            period_code (str): 期間代碼 (例如 P1, P2X)
+
+        Returns:
+            str: 新的檔案名稱
+        """
+        return f"{self.year}_{period_code}_{self.bene_abbr}_{self.outlet_code}_{self.outlet_num}.pdf"
+
+    def __eq__(self, other):
+        if not isinstance(other, AdviceFields):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f"AdviceFields({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+
+
+def parse_regions(spec):
+    """
+    解析區域設定字串
+
+    Args:
+        spec (str): 以分號分隔的區域，每個區域為 "x0,y0,x1,y1" (頁面比例 0~1)
+
+    Returns:
+        tuple: 區域 tuple 的 tuple
+    """
+    regions = []
+    for part in spec.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        values = tuple(float(v) for v in part.split(','))
+        if len(values) != 4 or not all(0.0 <= v <= 1.0 for v in values):
+            raise ValueError(f"無效的區域設定: '{part}' (格式應為 x0,y0,x1,y1，數值介於 0 與 1)")
+        regions.append(values)
+    if not regions:
+        raise ValueError("區域設定不能為空")
+    return tuple(regions)
+
+
+def match_fields(text, fields=None):
+    """
+    單次掃描文字，填入尚未取得的欄位
+
+    Args:
+        text (str): PDF 文字
+        fields (AdviceFields): 已提取的欄位 (可選)
+
+    Returns:
+        AdviceFields: 提取的欄位
+    """
+    if fields is None:
+        fields = AdviceFields()
+
+    need_year = fields.year is None
+    need_outlet = fields.outlet_num is None
+    fallback_year = None
+    label_span = None
+
+    for match in FIELD_PATTERN.finditer(text):
+        if match.lastgroup == 'label':
+            if need_year:
+                fields.year = match.group('label_year')[-2:]
+                need_year = False
+                label_span = match.span()
+        elif match.lastgroup == 'date':
+            if need_year and fallback_year is None:
+                fallback_year = match.group('date_year')[-2:]
+        elif need_outlet:
+            fields.outlet_num = match.group('outlet_num')
+            fields.bene_abbr = match.group('bene_abbr')
+            fields.outlet_code = match.group('outlet_code')
+            need_outlet = False
+
+        if not need_year and not need_outlet:
+            break
+
+    # 標籤與日期之間的文字已被標籤模式吃掉，Outlet 可能夾在其中
+    if need_outlet and label_span is not None:
+        outlet_match = OUTLET_PATTERN.search(text, *label_span)
+        if outlet_match:
+            fields.outlet_num, fields.bene_abbr, fields.outlet_code = outlet_match.groups()
+
+    if need_year and fallback_year is not None:
+        fields.year = fallback_year
+
+    return fields
+
+
+def extract_fields(full_text, region_texts=()):
+    """
+    依序檢查區域文字，所有欄位找到後立即停止，欄位缺漏時才讀取整頁文字
+
+    Args:
+        full_text (callable): 回傳整頁文字的函式
+        region_texts (iterable): 各區域的文字 (可為延遲產生的 generator)
+
+    Returns:
+        AdviceFields: 提取的欄位
+    """
+    fields = AdviceFields()
+    texts = iter(region_texts)
+    while True:
+        with stage('text'):
+            text = next(texts, None)
+        if text is None:
+            break
+        with stage('match'):
+            match_fields(text, fields)
+        if fields.complete:
+            return fields
+
+    with stage('text'):
+        text = full_text()
+    with stage('match'):
+        return match_fields(text, fields)
+
+
+def pymupdf_region_texts(page, regions):
+    """逐一產生 PyMuPDF 頁面中各區域的文字"""
+    width, height = page.rect.width, page.rect.height
+    for x0, y0, x1, y1 in regions:
+        yield page.get_text("text", clip=(x0 * width, y0 * height, x1 * width, y1 * height))
+
+
+def extract_from_pymupdf_page(page, regions=None):
+    """
+    從 PyMuPDF 頁面提取欄位
+
+    Args:
+        page (fitz.Page): PDF 頁面
+        regions (tuple): 快速提取模式的頁面區域；為 None 時提取整頁文字
+
+    Returns:
+        AdviceFields: 提取的欄位
+    """
+    region_texts = pymupdf_region_texts(page, regions) if regions else ()
+    return extract_fields(lambda: page.get_text("text"), region_texts)
+
+
+class _FieldsFound(Exception):
+    """所有欄位已找到，用於提前中止 pypdf 的頁面解析"""
+
+
+def pypdf_region_text(page, regions):
+    """
+    只收集 pypdf 頁面中位於指定區域的文字，所有欄位找到後立即中止解析
+
+    pypdf 不支援裁切提取，因此透過 visitor 依文字座標過濾。
+
+    Args:
+        page (pypdf.PageObject): PDF 頁面
+        regions (tuple): 頁面區域
+
+    Returns:
+        str: 區域內的文字
+    """
+    box = page.mediabox
+    left, bottom = float(box.left), float(box.bottom)
+    width, height = float(box.width), float(box.height)
+    buffers = [[] for _ in regions]
+    last_y = [None] * len(regions)
+
+    def collected():
+        return "\n".join("".join(buf) for buf in buffers)
+
+    def visitor(text, cm, tm, font_dict, font_size):
+        if not text:
+            return
+        x = (tm[4] * cm[0] + tm[5] * cm[2] + cm[4] - left) / width
+        y = 1 - (tm[4] * cm[1] + tm[5] * cm[3] + cm[5] - bottom) / height
+        hit = False
+        for i, (x0, y0, x1, y1) in enumerate(regions):
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                # 基線改變視為換行，與整頁提取一致
+                if last_y[i] is not None and last_y[i] != y:
+                    buffers[i].append("\n")
+                buffers[i].append(text)
+                last_y[i] = y
+                hit = True
+        # 只有新文字含數字時才可能補齊欄位
+        if hit and any(c.isdigit() for c in text) and match_fields(collected()).complete:
+            raise _FieldsFound
+
+    try:
+        page.extract_text(visitor_text=visitor)
+    except _FieldsFound:
+        pass
+    return collected()
+
+
+def extract_from_pypdf_page(page, regions=None):
+    """
+    從 pypdf 頁面提取欄位
+
+    Args:
+        page (pypdf.PageObject): PDF 頁面
+        regions (tuple): 快速提取模式的頁面區域；為 None 時提取整頁文字
+
+    Returns:
+        AdviceFields: 提取的欄位
+    """
+    region_texts = (pypdf_region_text(page, regions),) if regions else ()
+    return extract_fields(page.extract_text, region_texts)
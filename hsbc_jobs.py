@@ -0,0 +1,633 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 背景批次工作
+Web API 的 /jobs 端點使用：上傳 (或本機資料夾) 先存成工作後立即回應，
+由同一 process 內的 process pool 在背景提取與重新命名，客戶端再輪詢進度並下載結果。
+
+工作狀態保存在可替換的 JobStore 中 (預設為記憶體，或 SQLite 檔案)，不需要外部訊息佇列。
+使用 SQLite 時，重新啟動後會繼續處理尚未完成的檔案；多個 process 共用同一個 SQLite 檔案時，
+只能由其中一個 process 繼續 (resume=False 並由指定的 process 呼叫 resume()，見 api/wsgi.py)。
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from hsbc_backends import EmptyPdfError, extract_with_backends, resolve_backends
+from hsbc_cache import ResultCache, file_digest
+from hsbc_manifest import manifest_row
+from hsbc_metrics import collect_stages, stage
+from hsbc_prefilter import CANDIDATE, IMAGE_ONLY, NON_ADVICE, classify_pdf
+
+
+# 工作狀態
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# 完成的工作預設保留的秒數
+DEFAULT_TTL = 3600
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+# 預先篩選排除的檔案的錯誤訊息 (與 Web API 一致)
+_PREFILTER_ERRORS = {
+    NON_ADVICE: "Not an HSBC payment advice",
+    IMAGE_ONLY: "Scanned image without a text layer (run OCR first)",
+}
+
+
+def _new_job(job_id, kind, period_code, fast, sources, directory=None):
+    """建立工作記錄"""
+    return {
+        'id': job_id,
+        'kind': kind,
+        'state': QUEUED,
+        'period_code': period_code,
+        'fast': fast,
+        'directory': directory,
+        'sources': sources,
+        'total': len(sources),
+        'processed': 0,
+        'failed': 0,
+        'created': time.time(),
+        'finished': None,
+        'error': None,
+    }
+
+
+class MemoryJobStore:
+    """保存在記憶體中的工作狀態 (process 結束即消失)"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        """新增工作"""
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+            self._results[job['id']] = {}
+
+    def get(self, job_id):
+        """
+        查詢工作
+
+        Returns:
+            dict: 工作記錄的副本，不存在時為 None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **changes):
+        """更新工作欄位"""
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(changes)
+
+    def add_result(self, job_id, result):
+        """
+        保存單一檔案的處理結果並累計進度
+
+        Args:
+            job_id (str): 工作 ID
+            result (dict): {'index', 'filename', 'new_name', 'error'}
+
+        Returns:
+            dict: 更新後的工作記錄
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            results = self._results[job_id]
+            if result['index'] not in results:
+                results[result['index']] = dict(result)
+                job['processed'] += 1
+                job['failed'] += result['error'] is not None
+            return dict(job)
+
+    def results(self, job_id):
+        """依檔案順序列出已完成的結果"""
+        with self._lock:
+            results = self._results.get(job_id, {})
+            return [dict(results[index]) for index in sorted(results)]
+
+    def unfinished(self):
+        """列出尚未完成的工作"""
+        with self._lock:
+            return [dict(job) for job in self._jobs.values() if job['state'] in (QUEUED, RUNNING)]
+
+    def expired(self, before):
+        """列出完成時間早於 before 的工作 ID"""
+        with self._lock:
+            return [job_id for job_id, job in self._jobs.items()
+                    if job['finished'] is not None and job['finished'] < before]
+
+    def delete(self, job_id):
+        """刪除工作與其結果"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._results.pop(job_id, None)
+
+    def close(self):
+        pass
+
+
+class SqliteJobStore:
+    """保存在 SQLite 檔案中的工作狀態，可跨 process 重新啟動"""
+
+    _COLUMNS = ('id', 'kind', 'state', 'period_code', 'fast', 'directory', 'sources',
+                'total', 'processed', 'failed', 'created', 'finished', 'error')
+
+    def __init__(self, path=None):
+        """
+        初始化工作狀態資料庫
+
+        Args:
+            path (str): SQLite 檔案路徑 (None 為暫存目錄下的 hsbc_renamer/jobs.sqlite)
+        """
+        self.path = path or os.path.join(tempfile.gettempdir(), 'hsbc_renamer', 'jobs.sqlite')
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT, state TEXT, period_code TEXT, fast INTEGER,"
+                " directory TEXT, sources TEXT, total INTEGER, processed INTEGER, failed INTEGER,"
+                " created REAL, finished REAL, error TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " job_id TEXT, idx INTEGER, filename TEXT, new_name TEXT, error TEXT,"
+                " PRIMARY KEY (job_id, idx))"
+            )
+
+    def _row_to_job(self, row):
+        job = dict(zip(self._COLUMNS, row))
+        job['fast'] = bool(job['fast'])
+        job['sources'] = json.loads(job['sources'])
+        return job
+
+    def create(self, job):
+        """新增工作"""
+        values = dict(job, sources=json.dumps(job['sources']))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                [values[column] for column in self._COLUMNS],
+            )
+
+    def get(self, job_id):
+        """
+        查詢工作
+
+        Returns:
+            dict: 工作記錄，不存在時為 None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def update(self, job_id, **changes):
+        """更新工作欄位"""
+        if not changes:
+            return
+        assignments = ', '.join(f"{column} = ?" for column in changes)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*changes.values(), job_id))
+
+    def add_result(self, job_id, result):
+        """
+        保存單一檔案的處理結果並累計進度
+
+        Args:
+            job_id (str): 工作 ID
+            result (dict): {'index', 'filename', 'new_name', 'error'}
+
+        Returns:
+            dict: 更新後的工作記錄
+        """
+        with self._lock, self._conn:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?)",
+                (job_id, result['index'], result['filename'], result['new_name'], result['error']),
+            ).rowcount
+            if inserted:
+                self._conn.execute(
+                    "UPDATE jobs SET processed = processed + 1, failed = failed + ? WHERE id = ?",
+                    (int(result['error'] is not None), job_id),
+                )
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def results(self, job_id):
+        """依檔案順序列出已完成的結果"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, filename, new_name, error FROM results WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        return [dict(zip(('index', 'filename', 'new_name', 'error'), row)) for row in rows]
+
+    def unfinished(self):
+        """列出尚未完成的工作"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs WHERE state IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def expired(self, before):
+        """列出完成時間早於 before 的工作 ID"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM jobs WHERE finished < ?", (before,)).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, job_id):
+        """刪除工作與其結果"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+JOB_STORES = {
+    'memory': MemoryJobStore,
+    'sqlite': SqliteJobStore,
+}
+
+
+def open_job_store(spec=None):
+    """
+    依設定建立工作狀態儲存
+
+    Args:
+        spec (str): 'memory'、'sqlite' 或 'sqlite:<路徑>' (None 為環境變數 HSBC_JOB_STORE 或 memory)
+
+    Returns:
+        MemoryJobStore 或 SqliteJobStore
+    """
+    spec = spec or os.environ.get('HSBC_JOB_STORE') or 'memory'
+    name, _, path = spec.partition(':')
+    if name not in JOB_STORES:
+        raise ValueError(f"未知的工作狀態儲存: '{name}' (可用: {', '.join(JOB_STORES)})")
+    return JOB_STORES[name](path) if path else JOB_STORES[name]()
+
+
+# process pool 中每個 worker 各自的後端與快取
+_worker_backends = None
+_worker_cache = None
+
+
+def _init_worker(backend, cache_path):
+    """process pool worker 初始化"""
+    global _worker_backends, _worker_cache
+    _worker_backends = tuple(resolve_backends(backend))
+    if cache_path:
+        _worker_cache = ResultCache(cache_path, flush_interval=1)
+
+
+def _process_file(path, regions, hash_content=False, prefilter=True):
+    """
+    在 worker 中提取單一檔案的欄位 (錯誤訊息與 Web API 一致)
+
+    Args:
+        path (str): PDF 檔案路徑
+        regions (tuple): 快速提取模式的頁面區域
+        hash_content (bool): 不使用快取時是否仍計算內容雜湊 (寫入清單時需要)
+        prefilter (bool): 提取前先排除非通知書與純圖片的 PDF
+
+    Returns:
+        tuple: (AdviceFields 或 None, 錯誤訊息或 None, 預先篩選分類, 內容雜湊或 None, 各階段耗時)
+    """
+    with collect_stages() as timings:
+        digest = file_digest(path) if _worker_cache is not None or hash_content else None
+        fields, error, category = _extract_job_file(path, regions, digest, prefilter)
+    return fields, error, category, digest, timings
+
+
+def _extract_job_file(path, regions, digest, prefilter):
+    if _worker_cache is not None:
+        fields = _worker_cache.get(digest)
+        if fields is not None:
+            return fields, None, CANDIDATE
+
+    if prefilter:
+        with stage('prefilter'):
+            category, _ = classify_pdf(path)
+        if category != CANDIDATE:
+            return None, _PREFILTER_ERRORS[category], category
+
+    try:
+        fields, _ = extract_with_backends(path, _worker_backends, regions)
+    except EmptyPdfError:
+        return None, "Empty PDF", CANDIDATE
+    except Exception as e:
+        return None, f"Failed to read PDF: {e}", CANDIDATE
+
+    if fields.year is None:
+        return None, "Could not find date in PDF", CANDIDATE
+    if fields.outlet_num is None:
+        return None, "Could not find Outlet/Bene info pattern", CANDIDATE
+
+    if _worker_cache is not None:
+        _worker_cache.put(digest, fields)
+    return fields, None, CANDIDATE
+
+
+def _unique_name(name, used):
+    """同一個 ZIP 中重複的檔名加上 _2、_3 ... 後綴"""
+    candidate = name
+    stem, ext = os.path.splitext(name)
+    counter = 2
+    while candidate in used:
+        candidate = f"{stem}_{counter}{ext}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+class JobManager:
+    """接收批次工作並以背景 process pool 處理"""
+
+    def __init__(self, store, workdir=None, workers=None, fast_regions=None, backend=None,
+                 cache_path=None, metrics=None, manifest=None, ttl=DEFAULT_TTL, prefilter=True,
+                 resume=True):
+        """
+        初始化工作管理器
+
+        Args:
+            store: 工作狀態儲存 (MemoryJobStore 或 SqliteJobStore)
+            workdir (str): 上傳檔案與結果 ZIP 的存放目錄 (None 為暫存目錄下的 hsbc_renamer/jobs)
+            workers (int): 背景 process 數量 (None 為 CPU 核心數)
+            fast_regions (tuple): 工作要求快速模式時使用的頁面區域
+            backend (str): PDF 後端名稱 (None 為環境變數 HSBC_PDF_BACKEND 或 auto)
+            cache_path (str): 提取結果快取路徑 (None 為不使用快取)
+            metrics (StageMetrics): 分段計時統計 (可選)
+            manifest (Manifest): 提取結果清單 (可選)
+            ttl (float): 完成的工作保留秒數
+            prefilter (bool): 提取前先排除非通知書與純圖片的 PDF
+            resume (bool): 建立時繼續處理重新啟動前未完成的工作
+                (多個 process 共用工作狀態時應設為 False，否則同一個工作會被處理多次)
+        """
+        self.store = store
+        self.workdir = workdir or os.path.join(tempfile.gettempdir(), 'hsbc_renamer', 'jobs')
+        self.workers = workers or os.cpu_count() or 1
+        self.fast_regions = fast_regions
+        self.backend = backend
+        self.cache_path = cache_path
+        self.metrics = metrics
+        self.manifest = manifest
+        self.ttl = ttl
+        self.prefilter = prefilter
+        self._executor = None
+        self._lock = threading.Lock()
+        # 資料夾工作中已被佔用的新檔名，用於偵測同一批次內的衝突
+        self._claimed = {}
+
+        if resume:
+            self.resume()
+
+    def resume(self, job_ids=None):
+        """
+        繼續處理重新啟動前未完成的工作 (只有 SQLite 會留下)
+
+        Args:
+            job_ids (set): 只繼續這些工作 (None 為全部)
+        """
+        for job in self.store.unfinished():
+            if job_ids is None or job['id'] in job_ids:
+                self._enqueue(job)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn 避免在多執行緒的 WSGI process 中 fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.backend, self.cache_path),
+                )
+            return self._executor
+
+    def _reset_executor(self, broken):
+        """worker 異常結束後 pool 無法再使用，丟棄後於下次提交時重建"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False)
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.workdir, job_id)
+
+    def submit_uploads(self, uploads, period_code, fast=False):
+        """
+        將上傳的檔案存成工作
+
+        Args:
+            uploads (iterable): (原始檔名, 二進位串流) 的序列
+            period_code (str): 期間代碼
+            fast (bool): 是否使用快速提取模式
+
+        Returns:
+            str: 工作 ID
+        """
+        self.purge()
+        job_id = uuid.uuid4().hex
+        input_dir = os.path.join(self._job_dir(job_id), 'input')
+        os.makedirs(input_dir)
+
+        sources = []
+        for index, (filename, stream) in enumerate(uploads):
+            path = os.path.join(input_dir, f"{index:06d}.pdf")
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(stream, f, _COPY_CHUNK_SIZE)
+            sources.append([path, filename])
+
+        job = _new_job(job_id, 'upload', period_code, fast, sources)
+        self.store.create(job)
+        self._enqueue(job)
+        return job_id
+
+    def submit_directory(self, directory, period_code, fast=False):
+        """
+        將伺服器本機資料夾中的 PDF 就地重新命名
+
+        Args:
+            directory (str): 資料夾路徑
+            period_code (str): 期間代碼
+            fast (bool): 是否使用快速提取模式
+
+        Returns:
+            str: 工作 ID
+        """
+        self.purge()
+        names = sorted(name for name in os.listdir(directory) if name.lower().endswith('.pdf'))
+        sources = [[os.path.join(directory, name), name] for name in names]
+        job = _new_job(uuid.uuid4().hex, 'directory', period_code, fast, sources, directory=directory)
+        self.store.create(job)
+        self._enqueue(job)
+        return job['id']
+
+    def _enqueue(self, job):
+        """將工作中尚未處理的檔案送到 process pool"""
+        done = {result['index'] for result in self.store.results(job['id'])}
+        self.store.update(job['id'], state=RUNNING)
+        if len(done) == job['total']:
+            self._complete(job['id'])
+            return
+
+        regions = self.fast_regions if job['fast'] else None
+        options = (regions, self.manifest is not None, self.prefilter)
+        for index, (path, filename) in enumerate(job['sources']):
+            if index in done:
+                continue
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_process_file, path, *options)
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+                future = self._get_executor().submit(_process_file, path, *options)
+            future.add_done_callback(
+                lambda future, job=job, index=index, filename=filename:
+                    self._finish_file(job, index, filename, future)
+            )
+
+    def _finish_file(self, job, index, filename, future):
+        """保存單一檔案的結果，最後一個檔案完成時結束工作"""
+        try:
+            fields, error, category, digest, timings = future.result()
+        except Exception as e:
+            fields, error, category, digest, timings = None, f"Server Error: {e}", CANDIDATE, None, {}
+
+        new_name = fields.filename(job['period_code']) if fields is not None else None
+        if new_name is not None and job['kind'] == 'directory':
+            error = self._rename_in_place(job, job['sources'][index][0], new_name)
+            if error:
+                new_name = None
+
+        if self.metrics is not None:
+            result = category if category != CANDIDATE else 'error' if error else 'ok'
+            self.metrics.record(timings, result)
+        if self.manifest is not None and new_name is not None:
+            self._write_manifest(job, filename, fields, new_name, digest)
+
+        try:
+            updated = self.store.add_result(job['id'], {
+                'index': index, 'filename': filename, 'new_name': new_name, 'error': error,
+            })
+            if updated['processed'] >= updated['total']:
+                self._complete(job['id'])
+        except Exception as e:
+            self.store.update(job['id'], state=FAILED, error=str(e), finished=time.time())
+
+    def _write_manifest(self, job, filename, fields, new_name, digest):
+        """將處理完成的檔案寫入清單 (內容雜湊由 worker 計算；上傳工作的 directory 為空字串)"""
+        directory = job['directory'] if job['kind'] == 'directory' else ''
+        self.manifest.write(manifest_row(filename, new_name, fields, job['period_code'], digest, directory))
+
+    def _rename_in_place(self, job, path, new_name):
+        """
+        重新命名資料夾工作中的檔案
+
+        Returns:
+            str: 錯誤訊息，成功時為 None
+        """
+        new_path = os.path.join(job['directory'], new_name)
+        with self._lock:
+            claimed = self._claimed.setdefault(job['id'], set())
+            if new_name in claimed or os.path.exists(new_path):
+                return f"File '{new_name}' already exists"
+            claimed.add(new_name)
+        try:
+            os.rename(path, new_path)
+        except OSError as e:
+            return f"Rename failed: {e}"
+        return None
+
+    def _complete(self, job_id):
+        """所有檔案處理完成：上傳工作寫出結果 ZIP 並刪除暫存的上傳檔"""
+        with self._lock:
+            self._claimed.pop(job_id, None)
+        job = self.store.get(job_id)
+        try:
+            if job['kind'] == 'upload':
+                self._write_zip(job)
+                shutil.rmtree(os.path.join(self._job_dir(job_id), 'input'), ignore_errors=True)
+        except Exception as e:
+            self.store.update(job_id, state=FAILED, error=str(e), finished=time.time())
+        else:
+            self.store.update(job_id, state=DONE, finished=time.time())
+
+    def _write_zip(self, job):
+        """依檔案順序寫出重新命名後的 ZIP，無法處理的檔案以 UNPROCESSED_ 開頭"""
+        used = set()
+        path = self.result_path(job['id'])
+        partial = path + '.part'
+        with zipfile.ZipFile(partial, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for result in self.store.results(job['id']):
+                source = job['sources'][result['index']][0]
+                name = result['new_name'] or "UNPROCESSED_" + os.path.basename(result['filename'])
+                archive.write(source, _unique_name(name, used))
+        os.replace(partial, path)
+
+    def status(self, job_id):
+        """
+        查詢工作進度
+
+        Returns:
+            dict: 工作狀態 (不含檔案清單)，不存在時為 None
+        """
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        return {
+            'id': job['id'],
+            'kind': job['kind'],
+            'state': job['state'],
+            'period_code': job['period_code'],
+            'total': job['total'],
+            'processed': job['processed'],
+            'failed': job['failed'],
+            'progress': round(job['processed'] / job['total'], 4) if job['total'] else 1.0,
+            'created': job['created'],
+            'finished': job['finished'],
+            'error': job['error'],
+        }
+
+    def results(self, job_id):
+        """依檔案順序列出工作的處理結果"""
+        return self.store.results(job_id)
+
+    def result_path(self, job_id):
+        """上傳工作的結果 ZIP 路徑"""
+        return os.path.join(self._job_dir(job_id), 'result.zip')
+
+    def purge(self):
+        """刪除超過保留時間的工作與其檔案"""
+        for job_id in self.store.expired(time.time() - self.ttl):
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+            self.store.delete(job_id)
+
+    def shutdown(self, wait=True):
+        """停止背景 process pool 並關閉工作狀態儲存"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+        self.store.close()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 提取結果清單
+批量處理時每處理完一個檔案就附加一列，供對帳等下游工作直接查詢，
+不必重新開啟 PDF 或解析檔名。
+
+    - ManifestWriter: 依副檔名寫出 CSV 或 JSONL
+    - ManifestIndex: SQLite 索引，可依 Outlet 號碼、受益人、期間等欄位查詢
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+MANIFEST_FIELDS = (
+    'original_name', 'new_name', 'sha256', 'year', 'period',
+    'bene_abbr', 'outlet_code', 'outlet_num', 'directory', 'processed_at',
+)
+
+# query 子命令可用的篩選條件: 參數名稱 -> 欄位
+QUERY_FILTERS = {
+    'outlet': 'outlet_num',
+    'bene': 'bene_abbr',
+    'period': 'period',
+    'code': 'outlet_code',
+    'year': 'year',
+    'sha256': 'sha256',
+}
+
+# 索引預設每寫入多少列提交一次
+DEFAULT_FLUSH_INTERVAL = 256
+
+
+def manifest_row(original_name, new_name, fields, period_code, digest=None, directory=''):
+    """
+    建立清單的一列
+
+    Args:
+        original_name (str): 原檔名
+        new_name (str): 新檔名
+        fields (AdviceFields): 提取的欄位
+        period_code (str): 期間代碼
+        digest (str): 內容 SHA-256
+        directory (str): 新檔案所在資料夾 (Web API 為空字串)
+
+    Returns:
+        dict: 清單的一列
+    """
+    return {
+        'original_name': original_name,
+        'new_name': new_name,
+        'sha256': digest,
+        'year': fields.year,
+        'period': period_code,
+        'bene_abbr': fields.bene_abbr,
+        'outlet_code': fields.outlet_code,
+        'outlet_num': fields.outlet_num,
+        'directory': directory,
+        'processed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+class ManifestWriter:
+    """附加式清單檔 (.csv 或 .jsonl)"""
+
+    def __init__(self, path):
+        """
+        開啟清單檔
+
+        Args:
+            path (str): 清單路徑，副檔名為 .csv 時寫出 CSV，否則寫出 JSONL
+        """
+        self.path = path
+        self.format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        if self.format == 'csv':
+            self._writer = csv.DictWriter(self._file, fieldnames=MANIFEST_FIELDS)
+            if is_new:
+                self._writer.writeheader()
+
+    def write(self, row):
+        """附加一列並立即寫入，中斷時已處理的檔案不會遺失"""
+        with self._lock:
+            if self.format == 'csv':
+                self._writer.writerow(row)
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ManifestIndex:
+    """清單的 SQLite 索引"""
+
+    def __init__(self, path, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        開啟或建立索引
+
+        Args:
+            path (str): SQLite 檔案路徑
+            flush_interval (int): 每寫入多少列提交一次 (多個 process 共用時應設為 1)
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self._conn:
+            # 同一個檔案 (位置與內容皆相同) 重複處理時只保留最新一筆
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS advices ({', '.join(f'{name} TEXT' for name in MANIFEST_FIELDS)},"
+                " UNIQUE (directory, new_name, sha256))"
+            )
+            for column in ('outlet_num', 'bene_abbr', 'period', 'outlet_code', 'sha256'):
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS advices_{column} ON advices ({column})")
+
+    def write(self, row):
+        """新增或更新一列 (每 flush_interval 列提交一次)"""
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO advices VALUES ({', '.join('?' * len(MANIFEST_FIELDS))})",
+                [row.get(name) for name in MANIFEST_FIELDS],
+            )
+            self._pending += 1
+            if self._pending >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        """提交尚未寫入的列"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        """提交尚未寫入的列 (呼叫端需持有 lock)"""
+        if self._pending:
+            self._conn.commit()
+            self._pending = 0
+
+    def query(self, limit=None, **filters):
+        """
+        依欄位查詢
+
+        Args:
+            limit (int): 最多回傳的列數 (None 為不限制)
+            **filters: QUERY_FILTERS 中的篩選條件 (例如 outlet='1208008138', bene='APC')
+
+        Returns:
+            list: 符合的列 (dict)，依期間與新檔名排序
+        """
+        clauses = []
+        values = []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name not in QUERY_FILTERS:
+                raise ValueError(f"未知的查詢條件: '{name}'")
+            clauses.append(f"{QUERY_FILTERS[name]} = ?")
+            values.append(value)
+        sql = f"SELECT {', '.join(MANIFEST_FIELDS)} FROM advices"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY period, new_name"
+        if limit:
+            sql += " LIMIT ?"
+            values.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, values).fetchall()
+        return [dict(zip(MANIFEST_FIELDS, row)) for row in rows]
+
+    def close(self):
+        """提交尚未寫入的列並關閉"""
+        with self._lock:
+            if self._conn is not None:
+                self._flush()
+                self._conn.close()
+                self._conn = None
+
+
+class Manifest:
+    """同時寫入清單檔與索引 (兩者皆可省略)"""
+
+    def __init__(self, path=None, index_path=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.writer = ManifestWriter(path) if path else None
+        self.index = ManifestIndex(index_path, flush_interval) if index_path else None
+
+    def write(self, row):
+        """寫入一列"""
+        if self.writer is not None:
+            self.writer.write(row)
+        if self.index is not None:
+            self.index.write(row)
+
+    def flush(self):
+        """提交索引中尚未寫入的列 (清單檔每列立即寫入)"""
+        if self.index is not None:
+            self.index.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.index is not None:
+            self.index.close()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 處理流程的分段計時
+
+熱點程式碼以 stage() 標記各階段，呼叫端以 collect_stages() 收集單一檔案的
+各階段耗時，再交給 StageMetrics 累計為 Prometheus 格式的 histogram 與百分位數。
+沒有收集中的檔案時，stage() 只多兩次 perf_counter() 呼叫。
+
+階段:
+    prefilter 預先篩選 (檔頭、頁面尺寸、文字層)
+    open      開啟 PDF (含定位第一頁)
+    text      文字提取
+    match     欄位比對
+    filename  生成新檔名
+    write     重新命名或寫入 ZIP
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+
+STAGES = ('prefilter', 'open', 'text', 'match', 'filename', 'write')
+
+# Prometheus histogram 的區間上限 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 計算百分位數時每個階段最多保留的樣本數 (reservoir sampling)
+RESERVOIR_SIZE = 10_000
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """標記一個處理階段，耗時累加到目前收集中的檔案 (沒有時不做任何事)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample = getattr(_local, 'sample', None)
+        if sample is not None:
+            sample[name] = sample.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def collect_stages():
+    """
+    收集目前執行緒中單一檔案的各階段耗時
+
+    Yields:
+        dict: 階段名稱 -> 秒數
+    """
+    previous = getattr(_local, 'sample', None)
+    sample = {}
+    _local.sample = sample
+    try:
+        yield sample
+    finally:
+        _local.sample = previous
+
+
+class Histogram:
+    """累計型 histogram，另外保留樣本以計算百分位數"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._samples = []
+        self._random = random.Random(0)
+
+    def observe(self, value):
+        """記錄一個觀測值 (秒)"""
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        if len(self._samples) < RESERVOIR_SIZE:
+            self._samples.append(value)
+        else:
+            slot = self._random.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self._samples[slot] = value
+
+    def percentile(self, p):
+        """
+        計算百分位數
+
+        Args:
+            p (float): 0 ~ 100
+
+        Returns:
+            float: 秒數，沒有樣本時為 None
+        """
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class StageMetrics:
+    """各階段的 histogram 與檔案計數 (執行緒安全)"""
+
+    def __init__(self, prefix='hsbc'):
+        self.prefix = prefix
+        self.histograms = {name: Histogram() for name in STAGES}
+        self.files = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        """記錄單一階段的耗時"""
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).observe(seconds)
+
+    def record(self, sample, result='ok'):
+        """
+        記錄一個檔案
+
+        Args:
+            sample (dict): collect_stages() 收集的各階段耗時
+            result (str): 處理結果 (例如 ok、error、cached，或預先篩選排除的 non_advice、image_only)
+        """
+        with self._lock:
+            for name, seconds in sample.items():
+                self.histograms.setdefault(name, Histogram()).observe(seconds)
+            self.files[result] = self.files.get(result, 0) + 1
+
+    def summary(self):
+        """
+        各階段的 p50/p95/p99 (毫秒) 與次數
+
+        Returns:
+            dict: 階段名稱 -> {'p50_ms', 'p95_ms', 'p99_ms', 'count'}
+        """
+        with self._lock:
+            result = {}
+            for name, histogram in self.histograms.items():
+                if histogram.count:
+                    result[name] = {
+                        **{f"p{p}_ms": round(histogram.percentile(p) * 1000, 3) for p in (50, 95, 99)},
+                        'count': histogram.count,
+                    }
+            return result
+
+    def render_prometheus(self):
+        """
+        以 Prometheus text exposition 格式輸出
+
+        Returns:
+            str: metrics 文字
+        """
+        name = f"{self.prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each processing stage per file.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for stage_name, histogram in self.histograms.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage_name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage_name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage_name}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage_name}"}} {histogram.count}')
+
+            files = f"{self.prefix}_files_total"
+            lines.append(f"# HELP {files} Files processed, by result.")
+            lines.append(f"# TYPE {files} counter")
+            for result, count in sorted(self.files.items()):
+                lines.append(f'{files}{{result="{result}"}} {count}')
+
+            started = f"{self.prefix}_start_time_seconds"
+            lines.append(f"# HELP {started} Unix time when metrics collection started.")
+            lines.append(f"# TYPE {started} gauge")
+            lines.append(f"{started} {self.started}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 批量重新命名的規劃與執行
+規劃階段只在記憶體中決定每個檔案的新檔名：每個資料夾只列出一次並保存在 set 中，
+檔名衝突依策略處理 (suffix 加上 _2、_3 ... 後綴；skip 略過；fail 整批中止)。
+執行階段依規劃重新命名，每完成一個檔案就附加一行到 JSONL 日誌，
+中斷後可以 --resume 繼續，也可以 --undo 還原。
+
+日誌格式 (每行一個 JSON 物件):
+    {"op": "begin", "period_code": ..., "policy": ..., "created": ...}
+    {"op": "plan", "src": 原路徑, "dst": 新路徑}
+    {"op": "done", "src": ..., "dst": ...}
+    {"op": "undone", "src": ..., "dst": ...}
+"""
+
+import json
+import os
+import time
+
+from hsbc_metrics import stage
+
+
+COLLISION_POLICIES = ('suffix', 'skip', 'fail')
+
+DEFAULT_COLLISION_POLICY = 'skip'
+
+JOURNAL_FILENAME = '.hsbc_rename_journal.jsonl'
+
+
+class CollisionError(Exception):
+    """collision 策略為 fail 時，規劃中出現檔名衝突"""
+
+    def __init__(self, collisions):
+        self.collisions = collisions
+        super().__init__(f"{len(collisions)} 個檔名衝突")
+
+
+def default_journal_path(directory):
+    """資料夾的預設日誌路徑"""
+    return os.path.join(directory, JOURNAL_FILENAME)
+
+
+class RenamePlanner:
+    """以每個資料夾一次的目錄清單偵測檔名衝突"""
+
+    def __init__(self, policy=DEFAULT_COLLISION_POLICY):
+        """
+        初始化規劃
+
+        Args:
+            policy (str): 檔名衝突策略 (suffix、skip 或 fail)
+        """
+        if policy not in COLLISION_POLICIES:
+            raise ValueError(f"未知的檔名衝突策略: '{policy}' (可用: {', '.join(COLLISION_POLICIES)})")
+        self.policy = policy
+        self.renames = []
+        self.collisions = []
+        # 資料夾 -> 已存在或已規劃的檔名
+        self._taken = {}
+
+    def _names(self, directory):
+        names = self._taken.get(directory)
+        if names is None:
+            names = self._taken[directory] = set(os.listdir(directory))
+        return names
+
+    def add(self, src, new_name):
+        """
+        規劃一個檔案的新檔名
+
+        Args:
+            src (str): 原檔案路徑
+            new_name (str): 新檔名
+
+        Returns:
+            tuple: (新路徑或 None, 錯誤訊息或 None)；檔名已正確時新路徑與原路徑相同
+        """
+        directory = os.path.dirname(os.path.abspath(src))
+        if os.path.basename(src) == new_name:
+            return src, None
+
+        names = self._names(directory)
+        target = new_name
+        if target in names:
+            if self.policy == 'suffix':
+                stem, ext = os.path.splitext(new_name)
+                counter = 2
+                while target in names:
+                    target = f"{stem}_{counter}{ext}"
+                    counter += 1
+            else:
+                message = f"檔案 '{new_name}' 已存在"
+                self.collisions.append((src, message))
+                return None, message
+
+        names.add(target)
+        dst = os.path.join(directory, target)
+        self.renames.append((os.path.abspath(src), dst))
+        return dst, None
+
+    def check(self):
+        """fail 策略下有衝突時拋出 CollisionError"""
+        if self.policy == 'fail' and self.collisions:
+            raise CollisionError(self.collisions)
+
+
+class RenameJournal:
+    """附加式 JSONL 重新命名日誌"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def _append(self, record):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if self._ends_mid_line():
+                # 上次中斷時寫到一半的行不能與新記錄接在一起
+                self._file.write("\n")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # 只 flush 到作業系統：process 中斷不會遺失記錄，也不必每個檔案都 fsync
+        self._file.flush()
+
+    def _ends_mid_line(self):
+        with open(self.path, 'rb') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def begin(self, renames, **meta):
+        """
+        開始新的日誌並寫入整份規劃 (覆寫舊日誌)
+
+        Args:
+            renames (list): (原路徑, 新路徑) 的清單
+            **meta: 寫入 begin 記錄的其他欄位
+        """
+        self.close()
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._append({'op': 'begin', 'created': time.time(), **meta})
+        for src, dst in renames:
+            self._append({'op': 'plan', 'src': src, 'dst': dst})
+
+    def record(self, op, src, dst):
+        """記錄一個完成 (done) 或還原 (undone) 的檔案"""
+        self._append({'op': op, 'src': src, 'dst': dst})
+
+    def load(self):
+        """
+        讀取日誌
+
+        Returns:
+            tuple: (規劃的 (原路徑, 新路徑) 清單, 已完成的集合, 已還原的集合)
+        """
+        planned, done, undone = [], set(), set()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中斷時最後一行可能不完整
+                    continue
+                pair = (record.get('src'), record.get('dst'))
+                if record.get('op') == 'plan':
+                    planned.append(pair)
+                elif record.get('op') == 'done':
+                    done.add(pair)
+                elif record.get('op') == 'undone':
+                    undone.add(pair)
+        return planned, done, undone
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+def apply_renames(renames, journal=None, done=(), resume=False):
+    """
+    依規劃重新命名
+
+    已完成 (在 done 中，或繼續日誌時原檔已不存在而新檔存在) 的項目直接視為成功，因此可以重複執行。
+
+    Args:
+        renames (iterable): (原路徑, 新路徑) 的序列
+        journal (RenameJournal): 日誌 (None 為不記錄)
+        done (set): 日誌中已完成的項目
+        resume (bool): 是否為繼續中斷的日誌 (--resume)
+
+    Yields:
+        tuple: (原路徑, 新路徑, 錯誤訊息或 None)
+    """
+    for src, dst in renames:
+        if (src, dst) in done:
+            yield src, dst, None
+            continue
+        with stage('write'):
+            error = _rename(src, dst, resume)
+        if error is None and journal is not None:
+            journal.record('done', src, dst)
+        yield src, dst, error
+
+
+def _rename(src, dst, resume=False):
+    """
+    重新命名單一檔案
+
+    繼續日誌時，原檔已不存在而新檔存在視為成功 (上次在重新命名之後、寫入日誌之前中斷)；
+    一般執行時這代表原檔已被移走，新檔是其他檔案，應回報錯誤。
+
+    Returns:
+        str: 錯誤訊息，成功時為 None
+    """
+    if not os.path.exists(src):
+        if resume and os.path.exists(dst):
+            return None
+        return f"找不到原檔案 '{os.path.basename(src)}'"
+    if os.path.exists(dst):
+        return f"檔案 '{os.path.basename(dst)}' 已存在"
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        return f"重新命名失敗。原因: {e}"
+    return None
+
+
+def undo_renames(journal):
+    """
+    依日誌反向還原已完成的重新命名
+
+    Args:
+        journal (RenameJournal): 日誌
+
+    Yields:
+        tuple: (原路徑, 新路徑, 錯誤訊息或 None)
+    """
+    planned, done, undone = journal.load()
+    for src, dst in reversed(planned):
+        if (src, dst) not in done or (src, dst) in undone:
+            continue
+        if os.path.exists(src):
+            yield src, dst, f"原檔名 '{os.path.basename(src)}' 已被佔用"
+            continue
+        try:
+            with stage('write'):
+                os.rename(dst, src)
+        except OSError as e:
+            yield src, dst, f"還原失敗。原因: {e}"
+            continue
+        journal.record('undone', src, dst)
+        yield src, dst, None
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 預先篩選
+混合資料夾中常有發票、對帳單或掃描圖片等非通知書 PDF。本模組只以便宜的訊號
+(檔頭、第一頁的尺寸與內容串流運算子、製作軟體) 分類檔案，不建立文件物件也不提取文字，
+明顯不是通知書的檔案不必再交給 PDF 後端完整解析。
+
+分類:
+    candidate   可能是通知書 (或無法判斷)，交給後端提取
+    non_advice  不是 PDF、第一頁沒有文字或圖片運算子或頁面尺寸不符
+    image_only  第一頁只有圖片 (掃描檔)，沒有文字層可提取
+
+只在確定時排除檔案；結構無法解析 (物件串流、加密等) 或內容串流無法解碼時一律視為 candidate。
+"""
+
+import mmap
+import os
+import re
+
+from hsbc_backends import EmptyPdfError, RawStreamBackend
+
+
+CANDIDATE, NON_ADVICE, IMAGE_ONLY = 'candidate', 'non_advice', 'image_only'
+
+PREFILTER_CATEGORIES = (CANDIDATE, NON_ADVICE, IMAGE_ONLY)
+
+# 檔頭 "%PDF-" 可出現在前 1024 bytes 內的任何位置
+_HEADER_WINDOW = 1024
+
+# 通知書為 A4 或 Letter；第一頁短邊或長邊超出此範圍 (pt) 時不是通知書
+ADVICE_PAGE_SIDE_RANGE = (280, 1250)
+
+_MEDIABOX_RE = re.compile(rb"/MediaBox\s*\[\s*([-+\d.\s]+?)\s*\]")
+_TEXT_OP_RE = re.compile(rb"\bBT\b")
+_IMAGE_OP_RE = re.compile(rb"\bDo\b|\bBI\b")
+_FORM_XOBJECT_RE = re.compile(rb"/Subtype\s*/Form\b")
+_PRODUCER_RE = re.compile(rb"/(?:Producer|Creator)\s*\(([^)]*)\)")
+
+# 掃描器或 OCR 前的掃描軟體常見的製作軟體名稱
+SCANNER_PRODUCER_PATTERN = re.compile(
+    r"scan|ricoh|xerox|kofax|epson|konica|fujitsu|brother|lexmark|naps2", re.IGNORECASE)
+
+_raw = RawStreamBackend()
+
+
+def classify_pdf(source):
+    """
+    以便宜的訊號分類 PDF
+
+    Args:
+        source: 檔案路徑，或 bytes 等可切片的二進位內容 (bytes、memoryview、mmap)
+
+    Returns:
+        tuple: (分類, 原因或 None)；分類為 candidate、non_advice 或 image_only
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return NON_ADVICE, "檔案是空的"
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                return _classify(view)
+    if len(source) == 0:
+        return NON_ADVICE, "檔案是空的"
+    return _classify(source)
+
+
+def _classify(data):
+    if bytes(data[:_HEADER_WINDOW]).find(b"%PDF-") < 0:
+        return NON_ADVICE, "不是 PDF 檔案 (缺少 %PDF- 檔頭)"
+
+    try:
+        nodes, body = _raw.first_page(data)
+        content = _raw.page_content(nodes[-1], body)
+    except EmptyPdfError:
+        # 交給後端回報「沒有任何頁面」
+        return CANDIDATE, None
+    except Exception:
+        # 物件串流、加密等結構只能以製作軟體判斷
+        producer = _producer(data)
+        if producer and SCANNER_PRODUCER_PATTERN.search(producer):
+            return IMAGE_ONLY, f"由掃描軟體 '{producer}' 產生"
+        return CANDIDATE, None
+
+    size = _page_size(nodes)
+    if size is not None:
+        width, height = size
+        low, high = ADVICE_PAGE_SIDE_RANGE
+        if min(width, height) < low or max(width, height) > high:
+            return NON_ADVICE, f"第一頁尺寸 {width:.0f}x{height:.0f} pt 不是通知書的尺寸"
+
+    if not content.strip() or _TEXT_OP_RE.search(content):
+        # 解碼結果為空 (串流長度或壓縮方式無法判斷) 不能當作「沒有文字」的證據
+        return CANDIDATE, None
+    if _IMAGE_OP_RE.search(content):
+        # Form XObject 可能包含文字，無法在不解析資源的情況下確定
+        if _FORM_XOBJECT_RE.search(data):
+            return CANDIDATE, None
+        return IMAGE_ONLY, "第一頁只有圖片，沒有文字層 (掃描檔需先 OCR)"
+    return NON_ADVICE, "第一頁沒有任何文字"
+
+
+def _page_size(nodes):
+    """第一頁的 /MediaBox 尺寸 (可由上層頁面樹節點繼承)"""
+    for node in reversed(nodes):
+        match = _MEDIABOX_RE.search(node)
+        if match is None:
+            continue
+        try:
+            x0, y0, x1, y1 = (float(value) for value in match.group(1).split())
+        except ValueError:
+            return None
+        return abs(x1 - x0), abs(y1 - y0)
+    return None
+
+
+def _producer(data):
+    match = _PRODUCER_RE.search(data)
+    return match.group(1).decode('latin-1').strip() if match else None
@@ -0,0 +1,1315 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice PDF 重新命名工具的實作
+命令列進入點 hsbc_payment_renamer.py 確認無法轉送給背景服務後才載入本模組
+
+命名格式: YY_PX_BENE_CODE_OUTLETNUM.pdf
+"""
+
+import os
+import io
+import sys
+import argparse
+import csv
+import json
+import time
+from collections import deque
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import lru_cache, partial
+
+from hsbc_backends import BACKENDS, EmptyPdfError, extract_with_backends, resolve_backends
+from hsbc_cache import DEFAULT_MAX_ENTRIES, ResultCache, file_digest, stat_key
+from hsbc_daemon import default_socket_path, serve
+from hsbc_extractor import DEFAULT_FAST_REGIONS, parse_regions
+from hsbc_manifest import MANIFEST_FIELDS, QUERY_FILTERS, Manifest, ManifestIndex, manifest_row
+from hsbc_metrics import StageMetrics, collect_stages, stage
+from hsbc_planner import (COLLISION_POLICIES, DEFAULT_COLLISION_POLICY, CollisionError, RenameJournal,
+                          RenamePlanner, apply_renames, default_journal_path, undo_renames)
+from hsbc_prefilter import CANDIDATE, classify_pdf
+from hsbc_reporter import DEFAULT_REPORT_MODE, PREFILTER_LABELS, VerboseReporter, create_reporter
+from hsbc_scanner import scan_pdfs
+from hsbc_watcher import DEFAULT_POLL_INTERVAL, FolderWatcher
+
+
+# 平行提取時每個 process 最多預先送出的檔案數量
+POOL_WINDOW_PER_JOB = 4
+
+
+@lru_cache(maxsize=None)
+def _backend_chain(backend=None):
+    """每個 process 只建立一次後端實例"""
+    return tuple(resolve_backends(backend))
+
+
+def _extract_fields(pdf_path, regions=None, backend=None, prefilter=True):
+    """
+    從 PDF 提取欄位，不輸出任何訊息 (可在 process pool 中執行)
+    
+    Args:
+        pdf_path (str): PDF 檔案路徑
+        regions (tuple): 快速提取模式的頁面區域；為 None 時提取整頁文字
+        backend (str): PDF 後端名稱 (None 為環境變數 HSBC_PDF_BACKEND 或 auto)
+        prefilter (bool): 是否先以便宜的訊號排除非通知書與掃描檔
+        
+    Returns:
+        tuple: (AdviceFields 或 None, 錯誤訊息或 None, 預先篩選分類)
+    """
+    if prefilter:
+        try:
+            with stage('prefilter'):
+                category, reason = classify_pdf(pdf_path)
+        except OSError as e:
+            return None, f"無法讀取檔案 '{os.path.basename(pdf_path)}'。原因: {e}", CANDIDATE
+        if category != CANDIDATE:
+            return None, reason, category
+
+    try:
+        # 開啟 PDF 文件，只需要第一頁
+        fields, _ = extract_with_backends(pdf_path, _backend_chain(backend), regions)
+    except EmptyPdfError:
+        return None, f"PDF '{os.path.basename(pdf_path)}' 沒有任何頁面", CANDIDATE
+    except Exception as e:
+        return None, f"無法開啟或讀取 PDF '{os.path.basename(pdf_path)}'。原因: {e}", CANDIDATE
+
+    if fields.year is None:
+        return None, "無法在文件中找到 'Advice sending date'", CANDIDATE
+    if fields.outlet_num is None:
+        return (None, "無法找到 'Outlet no. / Name' 模式 (例如: 1208008138/ APC-IT801 或 1208008138/ APC - IT801)",
+                CANDIDATE)
+
+    return fields, None, CANDIDATE
+
+
+def _extract_file(pdf_path, regions=None, cache=None, backend=None, prefilter=True, hash_content=False):
+    """
+    計算內容雜湊並查詢快取，未命中時才開啟 PDF 提取欄位
+    
+    Args:
+        pdf_path (str): PDF 檔案路徑
+        regions (tuple): 快速提取模式的頁面區域
+        cache (ResultCache): 提取結果快取 (None 為不使用快取)
+        backend (str): PDF 後端名稱
+        prefilter (bool): 是否在提取前預先篩選 (快取命中的檔案不需篩選)
+        hash_content (bool): 不使用快取時是否仍計算內容雜湊 (寫入清單時需要)
+        
+    Returns:
+        tuple: (AdviceFields 或 None, 錯誤訊息或 None, 預先篩選分類, 內容雜湊或 None)
+    """
+    if cache is None and not hash_content:
+        return (*_extract_fields(pdf_path, regions, backend, prefilter), None)
+
+    try:
+        digest = file_digest(pdf_path)
+    except OSError as e:
+        return None, f"無法讀取檔案 '{os.path.basename(pdf_path)}'。原因: {e}", CANDIDATE, None
+
+    fields = cache.get(digest) if cache is not None else None
+    if fields is not None:
+        return fields, None, CANDIDATE, digest
+    return (*_extract_fields(pdf_path, regions, backend, prefilter), digest)
+
+
+# process pool 中每個 worker 各自開啟的快取連線
+_worker_cache = None
+
+
+def _init_worker(cache_path):
+    """process pool worker 初始化"""
+    global _worker_cache
+    if cache_path:
+        _worker_cache = ResultCache(cache_path)
+
+
+def _warm_worker(backend=None):
+    """背景服務啟動時預先在 worker 中載入 PDF 後端"""
+    _backend_chain(backend)
+
+
+def _extract_worker(pdf_path, regions=None, backend=None, prefilter=True, hash_content=False):
+    """
+    process pool 中執行的提取函式
+
+    Returns:
+        tuple: (AdviceFields 或 None, 錯誤訊息或 None, 預先篩選分類, 內容雜湊或 None, 各階段耗時)
+    """
+    with collect_stages() as timings:
+        result = _extract_file(pdf_path, regions, _worker_cache, backend, prefilter, hash_content)
+    return (*result, timings)
+
+
+class HSBCPaymentAdviceRenamer:
+    """HSBC Payment Advice PDF 重新命名工具"""
+    
+    def __init__(self, fast_regions=None, cache=None, backend=None, metrics=None, manifest=None,
+                 prefilter=True, pool=None, reporter=None):
+        """
+        初始化重新命名工具
+        
+        Args:
+            fast_regions (tuple): 快速提取模式的頁面區域 (None 為提取整頁文字)
+            cache (ResultCache): 提取結果快取 (None 為不使用快取)
+            backend (str): PDF 後端名稱 (None 為環境變數 HSBC_PDF_BACKEND 或 auto)
+            metrics (StageMetrics): 分段計時統計 (None 為不統計)
+            manifest (Manifest): 提取結果清單 (None 為不寫出)
+            prefilter (bool): 提取前先排除非通知書與純圖片的 PDF
+            pool (ProcessPoolExecutor): 常駐的 process pool (背景服務使用；None 為每次批量處理時建立)
+            reporter (Reporter): 處理過程的輸出方式 (None 為逐行輸出每個檔案的詳細過程)
+        """
+        self.supported_extensions = ['.pdf']
+        self.fast_regions = fast_regions
+        self.cache = cache
+        self.backend = backend
+        self.metrics = metrics
+        self.manifest = manifest
+        self.prefilter = prefilter
+        self.pool = pool
+        self.reporter = reporter if reporter is not None else VerboseReporter()
+        
+    def extract_pdf_info(self, pdf_path):
+        """
+        從 HSBC Payment Advice PDF 中提取資訊
+        
+        Args:
+            pdf_path (str): PDF 檔案路徑
+            
+        Returns:
+            AdviceFields: 提取的資訊，包含 year, outlet_num, bene_abbr, outlet_code
+        """
+        return self._report_extraction(pdf_path, *self._extract(pdf_path)[:3])
+
+    def _extract(self, pdf_path):
+        """
+        查詢快取，未命中時預先篩選並提取 (不輸出訊息)
+
+        Returns:
+            tuple: (AdviceFields 或 None, 錯誤訊息或 None, 預先篩選分類, 內容雜湊或 None)
+        """
+        if self.cache is not None:
+            cached = self.cache.lookup_file(pdf_path)
+            if cached is not None:
+                fields, digest = cached
+                return fields, None, CANDIDATE, digest
+
+        extraction = _extract_file(pdf_path, self.fast_regions, self.cache, self.backend, self.prefilter,
+                                   hash_content=self.manifest is not None)
+        self._store_in_cache(pdf_path, extraction[0], extraction[3])
+        return extraction
+
+    def _store_in_cache(self, pdf_path, extracted_info, digest):
+        """將成功的提取結果連同檔案預先鍵寫入快取"""
+        if self.cache is None or extracted_info is None or digest is None:
+            return
+        try:
+            key = stat_key(pdf_path)
+        except OSError:
+            key = None
+        self.cache.put(digest, extracted_info, key)
+
+    def _report_extraction(self, pdf_path, extracted_info, error, category=CANDIDATE):
+        """
+        輸出提取結果 (提取本身可能在其他 process 中完成)
+        
+        Args:
+            pdf_path (str): PDF 檔案路徑
+            extracted_info (AdviceFields): 提取的資訊，失敗時為 None
+            error (str): 失敗原因，成功時為 None
+            category (str): 預先篩選分類 (非 candidate 時檔案未被完整解析)
+            
+        Returns:
+            AdviceFields: 提取的資訊，失敗時為 None
+        """
+        self.reporter.extracted(pdf_path, extracted_info, error, category)
+        if category != CANDIDATE:
+            return None
+        return extracted_info
+
+    def generate_new_filename(self, extracted_info, period_code):
+        """
+        根據提取的資訊生成新檔名
+        
+        Args:
+            extracted_info (AdviceFields): 提取的資訊
+            period_code (str): 期間代碼 (例如 P1, P2X)
+            
+        Returns:
+            str: 新的檔案名稱
+        """
+        if not extracted_info:
+            return None
+            
+        # 格式: YY_PX_BENE_CODE_OUTLETNUM.pdf
+        return extracted_info.filename(period_code)
+
+    def rename_single_file_with_prompt(self, pdf_path):
+        """
+        重新命名單一 PDF 檔案 (會自動詢問期間代碼)
+        
+        Args:
+            pdf_path (str): PDF 檔案路徑
+            
+        Returns:
+            bool: 是否成功重新命名
+        """
+        print(f"準備處理檔案: {os.path.basename(pdf_path)}")
+        period_code = self.get_period_code_from_user()
+        return self.rename_single_file(pdf_path, period_code)
+
+    def rename_single_file(self, pdf_path, period_code, extraction=None, timings=None):
+        """
+        重新命名單一 PDF 檔案
+        
+        Args:
+            pdf_path (str): PDF 檔案路徑
+            period_code (str): 期間代碼
+            extraction (tuple): 已完成的提取結果 (AdviceFields 或 None, 錯誤訊息或 None, 預先篩選分類,
+                                內容雜湊或 None) (可選)
+            timings (dict): 提取在其他 process 完成時的各階段耗時 (可選)
+            
+        Returns:
+            bool: 是否成功重新命名
+        """
+        return self._rename_and_record(pdf_path, period_code, extraction, timings) == 'ok'
+
+    def _rename_and_record(self, pdf_path, period_code, extraction=None, timings=None):
+        """
+        重新命名單一 PDF 檔案並記錄分段耗時
+
+        Returns:
+            str: 處理結果 (ok、failed，或預先篩選排除時的分類)
+        """
+        with collect_stages() as sample:
+            if timings:
+                sample.update(timings)
+            result = self._rename_single_file(pdf_path, period_code, extraction)
+        if self.metrics is not None:
+            self.metrics.record(sample, result)
+        return result
+
+    def _rename_single_file(self, pdf_path, period_code, extraction):
+        """
+        Returns:
+            str: 處理結果 (ok、failed，或預先篩選排除時的分類)
+        """
+        extracted_info, new_filename, category, error, digest = self._prepare_rename(
+            pdf_path, period_code, extraction)
+        if category != CANDIDATE:
+            self.reporter.file(pdf_path, category, error=error)
+            return category
+        if not new_filename:
+            self.reporter.file(pdf_path, 'failed', error=error)
+            return 'failed'
+            
+        # 建立新的完整路徑
+        directory = os.path.dirname(pdf_path)
+        new_filepath = os.path.join(directory, new_filename)
+        
+        # 檢查檔案是否已存在
+        with stage('write'):
+            exists = os.path.exists(new_filepath)
+        if exists:
+            self.reporter.detail(f"  [警告] 檔案 '{new_filename}' 已存在，跳過重新命名")
+            self.reporter.file(pdf_path, 'failed', new_filepath, f"檔案 '{new_filename}' 已存在", extracted_info)
+            return 'failed'
+            
+        # 執行重新命名
+        original_filename = os.path.basename(pdf_path)
+        self.reporter.detail(f"  > 重新命名 '{original_filename}' 為 '{new_filename}'")
+        
+        try:
+            with stage('write'):
+                os.rename(pdf_path, new_filepath)
+            self.reporter.detail("  > 重新命名成功！")
+            self._write_manifest(pdf_path, new_filepath, extracted_info, period_code, digest)
+            self.reporter.file(pdf_path, 'renamed', new_filepath, fields=extracted_info)
+            return 'ok'
+        except Exception as e:
+            self.reporter.detail(f"  [錯誤] 重新命名失敗。原因: {e}")
+            self.reporter.file(pdf_path, 'failed', new_filepath, f"重新命名失敗。原因: {e}", extracted_info)
+            return 'failed'
+
+    def _prepare_rename(self, pdf_path, period_code, extraction):
+        """
+        提取資訊並生成新檔名 (不變更檔案)
+        
+        Returns:
+            tuple: (AdviceFields 或 None, 新檔名或 None, 預先篩選分類, 錯誤訊息或 None, 內容雜湊或 None)
+        """
+        self.reporter.detail(f"\n--- 處理檔案: {os.path.basename(pdf_path)} ---")
+        
+        # 提取 PDF 資訊
+        if extraction is None:
+            extraction = self._extract(pdf_path)
+        _, error, category, digest = extraction
+        extracted_info = self._report_extraction(pdf_path, *extraction[:3])
+        if not extracted_info:
+            return None, None, category, error, digest
+            
+        # 生成新檔名
+        with stage('filename'):
+            new_filename = self.generate_new_filename(extracted_info, period_code)
+        if not new_filename:
+            self.reporter.detail(f"  [錯誤] 無法生成新檔名")
+            return extracted_info, None, category, "無法生成新檔名", digest
+        return extracted_info, new_filename, category, None, digest
+
+    def _write_manifest(self, src, dst, extracted_info, period_code, digest=None):
+        """
+        將重新命名完成的檔案寫入清單
+
+        Args:
+            digest (str): 提取時計算的內容雜湊 (None 時讀取新檔案計算，例如分割寫出的檔案)
+        """
+        if self.manifest is None:
+            return
+        if digest is None:
+            try:
+                digest = file_digest(dst)
+            except OSError:
+                digest = None
+        self.manifest.write(manifest_row(os.path.basename(src), os.path.basename(dst), extracted_info,
+                                         period_code, digest, os.path.dirname(os.path.abspath(dst))))
+
+    def _create_pool(self, jobs):
+        """建立平行提取用的 process pool (每個 worker 各自開啟快取連線)"""
+        cache_path = self.cache.path if self.cache is not None else None
+        return ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(cache_path,))
+
+    @contextmanager
+    def _pool_for(self, jobs):
+        """使用常駐的 process pool，沒有時建立一個並在結束時關閉"""
+        if self.pool is not None:
+            yield self.pool
+            return
+        with self._create_pool(jobs) as executor:
+            yield executor
+
+    def _extract_with_pool(self, executor, paths, window):
+        """
+        在 process pool 中平行提取，結果依檔案順序交回主 process，
+        以確保檔名衝突能被正確偵測
+        
+        Args:
+            executor (ProcessPoolExecutor): process pool
+            paths (iterable): PDF 檔案路徑 (可為延遲產生的 generator)
+            window (int): 最多同時送出的檔案數量，避免一次讀入所有路徑
+            
+        Yields:
+            tuple: (PDF 檔案路徑, (AdviceFields 或 None, 錯誤訊息或 None, 預先篩選分類, 內容雜湊或 None),
+            各階段耗時或 None)，依 paths 順序
+        """
+        extract = partial(_extract_worker, regions=self.fast_regions, backend=self.backend,
+                          prefilter=self.prefilter, hash_content=self.manifest is not None)
+        pending = deque()
+        for pdf_path in paths:
+            # 預先鍵命中的檔案不需送到 worker
+            cached = self.cache.lookup_file(pdf_path) if self.cache is not None else None
+            if cached is not None:
+                fields, digest = cached
+                pending.append((pdf_path, (fields, None, CANDIDATE, digest)))
+            else:
+                pending.append((pdf_path, executor.submit(extract, pdf_path)))
+            if len(pending) >= window:
+                yield self._finish_pooled(*pending.popleft())
+        while pending:
+            yield self._finish_pooled(*pending.popleft())
+
+    def _finish_pooled(self, pdf_path, result):
+        """取得 process pool 的提取結果並寫入快取"""
+        if isinstance(result, tuple):
+            return pdf_path, result, None
+        extracted_info, error, category, digest, timings = result.result()
+        self._store_in_cache(pdf_path, extracted_info, digest)
+        return pdf_path, (extracted_info, error, category, digest), timings
+
+    def _plan_file(self, planner, pdf_path, period_code, extraction=None, timings=None, planned_fields=None):
+        """
+        提取單一檔案並加入重新命名規劃
+        
+        Args:
+            planned_fields (dict): 收集已規劃檔案的 原路徑 -> (新路徑, AdviceFields, 內容雜湊)，
+                                   供輸出結果與寫入清單 (可選)
+            
+        Returns:
+            str: 處理結果：ok 為已規劃 (包含檔名已正確、不需重新命名的檔案)，
+                 failed 為失敗，預先篩選排除時為其分類 (non_advice 或 image_only)
+        """
+        planned = None
+        with collect_stages() as sample:
+            if timings:
+                sample.update(timings)
+            extracted_info, new_filename, category, error, digest = self._prepare_rename(
+                pdf_path, period_code, extraction)
+            if new_filename:
+                planned, error = planner.add(pdf_path, new_filename)
+                if planned and planned_fields is not None:
+                    planned_fields[os.path.abspath(pdf_path)] = (os.path.abspath(planned), extracted_info, digest)
+                if error:
+                    action = "整批不重新命名" if planner.policy == 'fail' else "跳過重新命名"
+                    self.reporter.detail(f"  [警告] {error}，{action}")
+                elif planned == pdf_path:
+                    self.reporter.detail("  > 檔名已正確，不需重新命名")
+                elif os.path.basename(planned) != new_filename:
+                    self.reporter.detail(f"  [警告] 檔案 '{new_filename}' 已存在，改為 '{os.path.basename(planned)}'")
+                else:
+                    self.reporter.detail(f"  > 新檔名: '{new_filename}'")
+        result = category if category != CANDIDATE else 'ok' if planned else 'failed'
+        if self.metrics is not None:
+            self.metrics.record(sample, result)
+        # 已規劃的檔案在重新命名後才輸出結果
+        if result != 'ok':
+            self.reporter.file(pdf_path, result, error=error, fields=extracted_info)
+        return result
+
+    def _apply_renames(self, renames, journal, done=(), planned_fields=None, period_code=None, resume=False):
+        """
+        執行規劃的重新命名並記錄到日誌，成功的檔案依 planned_fields 寫入清單
+        
+        Returns:
+            int: 失敗的檔案數量
+        """
+        self.reporter.section(f"\n--- 重新命名 {len(renames)} 個檔案 ---")
+        failed_count = 0
+        results = apply_renames(renames, journal, done, resume)
+        while True:
+            with collect_stages() as sample:
+                result = next(results, None)
+            if result is None:
+                break
+            src, dst, error = result
+            if self.metrics is not None and 'write' in sample:
+                self.metrics.observe('write', sample['write'])
+            _, extracted_info, digest = planned_fields[src] if planned_fields else (None, None, None)
+            if error:
+                failed_count += 1
+                self.reporter.detail(f"  [錯誤] '{os.path.basename(src)}': {error}")
+                self.reporter.file(src, 'failed', dst, error, extracted_info)
+            else:
+                self.reporter.detail(f"  > '{os.path.basename(src)}' -> '{os.path.basename(dst)}'")
+                if extracted_info is not None:
+                    self._write_manifest(src, dst, extracted_info, period_code, digest)
+                self.reporter.file(src, 'renamed', dst, fields=extracted_info)
+        return failed_count
+
+    def batch_rename(self, folder_path, period_code, jobs=1, recursive=False, include=None, exclude=None,
+                     max_depth=None, policy=DEFAULT_COLLISION_POLICY, dry_run=False, journal_path=None):
+        """
+        批量重新命名資料夾中的所有 PDF 檔案
+        
+        先提取所有檔案並規劃新檔名 (檔名衝突依 policy 處理)，再依規劃重新命名並寫入日誌。
+        檔案一邊掃描一邊提取，不需要先列出整個資料夾。
+        
+        Args:
+            folder_path (str): 資料夾路徑
+            period_code (str): 期間代碼
+            jobs (int): 平行提取的 process 數量 (1 為不平行，0 或 None 為 CPU 核心數)
+            recursive (bool): 是否包含子資料夾
+            include (list): 只處理符合任一萬用字元模式的檔案
+            exclude (list): 略過符合任一萬用字元模式的檔案與資料夾
+            max_depth (int): 最多進入幾層子資料夾 (隱含 recursive)
+            policy (str): 檔名衝突策略 (suffix、skip 或 fail)
+            dry_run (bool): 只顯示規劃，不變更任何檔案
+            journal_path (str): 日誌路徑 (None 為資料夾中的 .hsbc_rename_journal.jsonl)
+            
+        Returns:
+            dict: 處理結果統計
+        """
+        if not os.path.isdir(folder_path):
+            self.reporter.error(f"[嚴重錯誤] 資料夾 '{folder_path}' 不存在或不是有效目錄")
+            return {'success': 0, 'failed': 0, 'total': 0}
+            
+        self.reporter.section(f"\n--- 處理資料夾中的所有 PDF: {folder_path} ---")
+        
+        # 逐一產生 PDF 檔案 (每個資料夾內依檔名排序，確保規劃順序固定)
+        pdf_files = scan_pdfs(str(folder_path), recursive=recursive, include=include, exclude=exclude,
+                              max_depth=max_depth, on_error=self.reporter.error)
+        planner = RenamePlanner(policy)
+        started = time.perf_counter()
+        
+        # 規劃階段：提取每個檔案並決定新檔名 (依處理結果計數)
+        results = dict.fromkeys(('ok', 'failed', *PREFILTER_LABELS), 0)
+        planned_fields = {}
+        
+        if not jobs:
+            jobs = os.cpu_count() or 1
+
+        if jobs > 1:
+            self.reporter.section(f"  [資訊] 使用 {jobs} 個 process 平行提取")
+            with self._pool_for(jobs) as executor:
+                for pdf_path, extraction, timings in self._extract_with_pool(
+                        executor, pdf_files, jobs * POOL_WINDOW_PER_JOB):
+                    results[self._plan_file(planner, pdf_path, period_code, extraction, timings,
+                                            planned_fields)] += 1
+        else:
+            for pdf_path in pdf_files:
+                results[self._plan_file(planner, pdf_path, period_code, planned_fields=planned_fields)] += 1
+        
+        planned_count = results['ok']
+        failed_count = results['failed']
+        skipped = {category: results[category] for category in PREFILTER_LABELS}
+        total = sum(results.values())
+        if not total:
+            self.reporter.section("  [資訊] 在資料夾中未找到 PDF 檔案")
+            return {'success': 0, 'failed': 0, 'total': 0}
+        
+        try:
+            planner.check()
+        except CollisionError as e:
+            for src, (dst, extracted_info, _) in planned_fields.items():
+                self.reporter.file(src, 'failed', dst, "檔名衝突，依 fail 策略不重新命名", extracted_info)
+            self.reporter.error(f"\n[錯誤] 發現 {len(e.collisions)} 個檔名衝突，依 fail 策略不重新命名任何檔案")
+            return {'success': 0, 'failed': total - sum(skipped.values()), **skipped, 'total': total}
+        
+        # 檔名已正確的檔案不需重新命名，直接寫入清單
+        for src, (dst, extracted_info, digest) in planned_fields.items():
+            if src == dst:
+                if not dry_run:
+                    self._write_manifest(src, dst, extracted_info, period_code, digest)
+                self.reporter.file(src, 'unchanged', fields=extracted_info)
+        
+        # 執行階段
+        if dry_run:
+            self.reporter.section(f"\n--- 模擬執行：將重新命名 {len(planner.renames)} 個檔案 (不變更任何檔案) ---")
+            for src, dst in planner.renames:
+                self.reporter.detail(f"  > '{os.path.basename(src)}' -> '{os.path.basename(dst)}'")
+                self.reporter.file(src, 'planned', dst, fields=planned_fields[src][1])
+        elif planner.renames:
+            journal = RenameJournal(journal_path or default_journal_path(folder_path))
+            try:
+                journal.begin(planner.renames, period_code=period_code, policy=policy,
+                              directory=os.path.abspath(folder_path))
+                apply_failed = self._apply_renames(planner.renames, journal,
+                                                   planned_fields=planned_fields, period_code=period_code)
+            finally:
+                journal.close()
+            planned_count -= apply_failed
+            failed_count += apply_failed
+            self.reporter.section(f"  [資訊] 日誌: {journal.path} (可使用 --undo 還原)")
+        if self.manifest is not None:
+            # 整批只提交一次清單索引
+            self.manifest.flush()
+                
+        self.reporter.summary(f"處理完成{' (模擬)' if dry_run else ''}",
+                              {'success': planned_count, 'failed': failed_count, **skipped, 'total': total})
+        if self.metrics is not None:
+            self.print_stats(total, time.perf_counter() - started)
+        
+        return {
+            'success': planned_count,
+            'failed': failed_count,
+            **skipped,
+            'total': total
+        }
+
+    def resume(self, journal_path):
+        """
+        依日誌繼續中斷的批量重新命名 (不需重新提取)
+        
+        Args:
+            journal_path (str): 日誌路徑
+            
+        Returns:
+            dict: 處理結果統計
+        """
+        if not os.path.exists(journal_path):
+            self.reporter.error(f"[錯誤] 找不到日誌 '{journal_path}'")
+            return {'success': 0, 'failed': 0, 'total': 0}
+        
+        journal = RenameJournal(journal_path)
+        planned, done, _ = journal.load()
+        remaining = [pair for pair in planned if pair not in done]
+        self.reporter.section(f"\n--- 繼續日誌: {journal_path} (已完成 {len(planned) - len(remaining)}/{len(planned)}) ---")
+        
+        failed_count = 0
+        if remaining:
+            try:
+                failed_count = self._apply_renames(remaining, journal, resume=True)
+            finally:
+                journal.close()
+        
+        self.reporter.summary("處理完成", {'success': len(planned) - failed_count, 'failed': failed_count,
+                                          'total': len(planned)})
+        return {
+            'success': len(planned) - failed_count,
+            'failed': failed_count,
+            'total': len(planned)
+        }
+
+    def undo(self, journal_path):
+        """
+        依日誌還原已完成的重新命名
+        
+        Args:
+            journal_path (str): 日誌路徑
+            
+        Returns:
+            dict: 處理結果統計
+        """
+        if not os.path.exists(journal_path):
+            self.reporter.error(f"[錯誤] 找不到日誌 '{journal_path}'")
+            return {'success': 0, 'failed': 0, 'total': 0}
+        
+        self.reporter.section(f"\n--- 還原日誌: {journal_path} ---")
+        journal = RenameJournal(journal_path)
+        success_count = 0
+        failed_count = 0
+        try:
+            for src, dst, error in undo_renames(journal):
+                if error:
+                    failed_count += 1
+                    self.reporter.detail(f"  [錯誤] '{os.path.basename(dst)}': {error}")
+                    self.reporter.file(dst, 'failed', src, error)
+                else:
+                    success_count += 1
+                    self.reporter.detail(f"  > '{os.path.basename(dst)}' -> '{os.path.basename(src)}'")
+                    self.reporter.file(dst, 'restored', src)
+        finally:
+            journal.close()
+        
+        self.reporter.summary("還原完成", {'success': success_count, 'failed': failed_count})
+        return {
+            'success': success_count,
+            'failed': failed_count,
+            'total': success_count + failed_count
+        }
+
+    def split_file(self, pdf_path, period_code, output_dir=None):
+        """
+        將合併多份通知書的 PDF 分割為各自命名的檔案 (原檔不變)
+        
+        Args:
+            pdf_path (str): 合併的 PDF 檔案路徑
+            period_code (str): 期間代碼
+            output_dir (str): 輸出資料夾 (None 為與來源相同的資料夾)
+            
+        Returns:
+            dict: 處理結果統計 (以通知書為單位)
+        """
+        try:
+            from hsbc_splitter import split_advices
+            import fitz  # noqa: F401  分割需要 PyMuPDF 複製頁面
+        except ImportError:
+            self.reporter.error("[錯誤] 分割模式需要 PyMuPDF (pip install pymupdf)")
+            return {'success': 0, 'failed': 0, 'total': 0}
+        
+        self.reporter.section(f"\n--- 分割檔案: {os.path.basename(pdf_path)} ---")
+        started = time.perf_counter()
+        success_count = 0
+        failed_count = 0
+        suffixed_count = 0
+        
+        advices = split_advices(pdf_path, period_code, output_dir)
+        try:
+            while True:
+                with collect_stages() as sample:
+                    advice = next(advices, None)
+                if advice is None:
+                    break
+                
+                first, last = advice['pages']
+                pages = f"第 {first} 頁" if first == last else f"第 {first}-{last} 頁"
+                suffix_note = " (檔名已存在，加上後綴)" if advice['suffixed'] else ""
+                suffixed_count += advice['suffixed']
+                if advice['error']:
+                    failed_count += 1
+                    self.reporter.detail(f"  [錯誤] {pages}: {advice['error']}，"
+                                         f"已寫出 '{os.path.basename(advice['path'])}'{suffix_note}")
+                    self.reporter.file(pdf_path, 'failed', advice['path'], f"{pages}: {advice['error']}",
+                                       advice['fields'])
+                else:
+                    success_count += 1
+                    self.reporter.detail(f"  > {pages} -> '{os.path.basename(advice['path'])}'{suffix_note}")
+                    self._write_manifest(pdf_path, advice['path'], advice['fields'], period_code)
+                    self.reporter.file(pdf_path, 'written', advice['path'], fields=advice['fields'])
+                if self.metrics is not None:
+                    self.metrics.record(sample, 'failed' if advice['error'] else 'ok')
+        except Exception as e:
+            self.reporter.error(f"  [錯誤] 無法開啟或讀取 PDF '{os.path.basename(pdf_path)}'。原因: {e}")
+            return {'success': success_count, 'failed': failed_count, 'total': success_count + failed_count}
+        
+        total = success_count + failed_count
+        self.reporter.summary("分割完成", {'success': success_count, 'failed': failed_count,
+                                         'suffixed': suffixed_count, 'total': total}, unit='份通知書')
+        if self.metrics is not None:
+            self.print_stats(total, time.perf_counter() - started)
+        
+        return {
+            'success': success_count,
+            'failed': failed_count,
+            'total': total
+        }
+
+    def watch(self, folder_path, period_code, jobs=1, interval=DEFAULT_POLL_INTERVAL):
+        """
+        持續監看資料夾，新 PDF 寫入完成後立即重新命名 (Ctrl+C 停止)
+        
+        Args:
+            folder_path (str): 資料夾路徑
+            period_code (str): 期間代碼
+            jobs (int): 平行提取的 process 數量 (1 為不平行，0 或 None 為 CPU 核心數)
+            interval (float): 輪詢間隔 (秒)
+            
+        Returns:
+            dict: 處理結果統計
+        """
+        if not os.path.isdir(folder_path):
+            self.reporter.error(f"[嚴重錯誤] 資料夾 '{folder_path}' 不存在或不是有效目錄")
+            return {'success': 0, 'failed': 0, 'total': 0}
+
+        if not jobs:
+            jobs = os.cpu_count() or 1
+        self.reporter.section(f"\n--- 監看資料夾: {folder_path} (每 {interval:g} 秒檢查一次，按 Ctrl+C 停止) ---")
+        if jobs > 1:
+            self.reporter.section(f"  [資訊] 使用 {jobs} 個 process 平行提取")
+
+        watcher = FolderWatcher(folder_path)
+        executor = self._create_pool(jobs) if jobs > 1 else None
+        # 依處理結果計數 (預先篩選排除的檔案計為略過，不算失敗)
+        counts = dict.fromkeys(('ok', 'failed', *PREFILTER_LABELS), 0)
+        try:
+            while True:
+                paths = watcher.poll()
+                if executor is not None and len(paths) > 1:
+                    results = ((pdf_path, self._rename_and_record(pdf_path, period_code, extraction, timings))
+                               for pdf_path, extraction, timings in self._extract_with_pool(
+                                   executor, paths, jobs * POOL_WINDOW_PER_JOB))
+                else:
+                    results = ((pdf_path, self._rename_and_record(pdf_path, period_code)) for pdf_path in paths)
+                for pdf_path, result in results:
+                    counts[result] += 1
+                    if result != 'ok':
+                        # 失敗或略過的檔案在內容改變前不再處理
+                        watcher.mark_failed(pdf_path)
+                if self.manifest is not None:
+                    self.manifest.flush()
+                self.reporter.flush()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        skipped = {category: counts[category] for category in PREFILTER_LABELS}
+        summary = {'success': counts['ok'], 'failed': counts['failed'], **skipped, 'total': sum(counts.values())}
+        self.reporter.summary("停止監看", summary)
+        return summary
+
+    def print_stats(self, file_count, elapsed):
+        """
+        輸出各階段耗時的百分位數與處理速度
+        
+        Args:
+            file_count (int): 處理的檔案數量
+            elapsed (float): 總耗時 (秒)
+        """
+        self.reporter.stats(self.metrics.summary(), dict(self.metrics.files), file_count, elapsed)
+
+    def get_period_code_from_user(self):
+        """從用戶獲取期間代碼"""
+        print("請選擇期間代碼設定方式：")
+        print("1. 輸入數字 (例如：輸入 1 會產生 P1)")
+        print("2. 直接輸入完整期間代碼 (例如：P1, P2X)")
+        
+        choice = input("請選擇 (1 或 2): ").strip()
+        
+        if choice == "1":
+            # 數字模式
+            while True:
+                try:
+                    number = input("請輸入期間數字 (例如：1, 2, 3): ").strip()
+                    if not number:
+                        print("期間數字不能為空，請重新輸入。")
+                        continue
+                    
+                    # 驗證是否為數字
+                    int(number)  # 這會拋出異常如果不是數字
+                    period_code = f"P{number}"
+                    
+                    # 確認期間代碼
+                    print(f"生成的期間代碼: {period_code}")
+                    confirm = input("確認使用此期間代碼嗎？(y/n): ").strip().lower()
+                    if confirm in ['y', 'yes', '是', '確認']:
+                        return period_code
+                    
+                except ValueError:
+                    print("請輸入有效的數字。")
+                    
+        else:
+            # 直接輸入模式
+            while True:
+                period_code = input("請輸入完整期間代碼 (例如 P1, P2X): ").strip()
+                if not period_code:
+                    print("期間代碼不能為空，請重新輸入。")
+                    continue
+                    
+                # 簡單驗證期間代碼格式
+                if not period_code.upper().startswith('P'):
+                    print("期間代碼應該以 'P' 開頭，例如 P1, P2X")
+                    continue
+                    
+                return period_code.upper()
+
+    def interactive_mode(self):
+        """互動模式：讓使用者選擇資料夾和期間代碼"""
+        print("=== HSBC Payment Advice PDF 重新命名工具 ===")
+        print("此工具會自動提取 PDF 中的資訊並重新命名檔案")
+        print("命名格式: YY_PX_BENE_CODE_OUTLETNUM.pdf\n")
+        
+        # 獲取期間代碼
+        period_code = self.get_period_code_from_user()
+        
+        # 獲取資料夾路徑
+        folder_path = ""
+        while not folder_path or not os.path.isdir(folder_path):
+            folder_path = input("請輸入包含 PDF 檔案的資料夾路徑: ").strip()
+            if not folder_path:
+                print("路徑不能為空，請重新輸入。")
+            elif not os.path.isdir(folder_path):
+                print(f"路徑 '{folder_path}' 不是有效的資料夾，請重新輸入。")
+        
+        # 執行批量重新命名
+        return self.batch_rename(folder_path, period_code)
+
+
+def build_parser(environ=os.environ):
+    """
+    建立命令列參數解析器
+    
+    Args:
+        environ (dict): 提供預設值的環境變數 (背景服務使用客戶端的環境變數)
+        
+    Returns:
+        argparse.ArgumentParser: 解析器
+    """
+    parser = argparse.ArgumentParser(prog="hsbc_payment_renamer.py", description="HSBC Payment Advice PDF 重新命名工具")
+    parser.add_argument("-d", "--directory", help="包含 PDF 檔案的目錄路徑")
+    parser.add_argument("-p", "--period", help="期間代碼 (例如 P1, P2X)")
+    parser.add_argument("-f", "--file", help="單一 PDF 檔案路徑")
+    parser.add_argument("-i", "--interactive", action="store_true", 
+                       help="啟動互動模式")
+    parser.add_argument("--auto", action="store_true",
+                       help="自動處理當前目錄的 PDF 檔案 (會詢問期間代碼)")
+    parser.add_argument("--on-collision", choices=COLLISION_POLICIES, default=DEFAULT_COLLISION_POLICY,
+                       help="批量處理時新檔名已存在的處理方式：suffix 加上 _2 等後綴、skip 跳過 (預設)、"
+                            "fail 不重新命名任何檔案")
+    parser.add_argument("--dry-run", action="store_true",
+                       help="只顯示批量處理的重新命名規劃，不變更任何檔案")
+    parser.add_argument("--journal",
+                       help="批量處理的日誌路徑 (預設為資料夾中的 .hsbc_rename_journal.jsonl)")
+    parser.add_argument("--resume", action="store_true",
+                       help="依日誌繼續中斷的批量處理 (使用 --journal 或 -d 資料夾的日誌)")
+    parser.add_argument("--undo", action="store_true",
+                       help="依日誌還原上一次批量處理 (使用 --journal 或 -d 資料夾的日誌)")
+    parser.add_argument("--split", metavar="FILE",
+                       help="分割合併多份通知書的 PDF，每份以新檔名寫出 (需要 -p)")
+    parser.add_argument("-o", "--output-dir",
+                       help="分割模式的輸出資料夾 (預設與來源檔案相同)")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                       help="包含子資料夾中的 PDF 檔案 (用於 -d 與 --auto)")
+    parser.add_argument("--include", action="append", metavar="PATTERN",
+                       help="只處理符合萬用字元模式的檔案 (相對路徑或檔名，可重複指定)")
+    parser.add_argument("--exclude", action="append", metavar="PATTERN",
+                       help="略過符合萬用字元模式的檔案與資料夾 (可重複指定)")
+    parser.add_argument("--max-depth", type=int,
+                       help="最多進入幾層子資料夾 (隱含 --recursive)")
+    parser.add_argument("--watch", metavar="DIR",
+                       help="持續監看資料夾，新 PDF 寫入完成後自動重新命名 (需要 -p)")
+    parser.add_argument("--interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                       help=f"監看模式的輪詢間隔秒數 (預設 {DEFAULT_POLL_INTERVAL:g})")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                       help="批量處理時平行提取的 process 數量 (預設 1，0 為使用所有 CPU 核心)")
+    parser.add_argument("--fast", action="store_true",
+                       help="快速提取模式：只提取頁面特定區域的文字，欄位缺漏時才提取整頁")
+    parser.add_argument("--regions",
+                       help="快速模式的頁面區域，格式 'x0,y0,x1,y1;...' (頁面比例 0~1，隱含 --fast)")
+    parser.add_argument("--backend", choices=['auto', *BACKENDS],
+                       help="PDF 讀取後端 (預設為環境變數 HSBC_PDF_BACKEND 或 auto：自動選擇已安裝的最快後端)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="不使用提取結果快取")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                       help="清除提取結果快取後重新提取")
+    parser.add_argument("--cache-path",
+                       help="快取檔案路徑 (預設 ~/.cache/hsbc_renamer/results.sqlite 或環境變數 HSBC_CACHE_PATH)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_ENTRIES,
+                       help=f"快取最多保存的結果數量 (預設 {DEFAULT_MAX_ENTRIES})")
+    parser.add_argument("--no-prefilter", action="store_true",
+                       help="不預先篩選：每個 PDF 都完整解析 (預設會先以檔頭、頁面尺寸與文字層排除非通知書與掃描檔)")
+    report = parser.add_mutually_exclusive_group()
+    report.add_argument("--quiet", dest="report", action="store_const", const="quiet",
+                        help="不輸出每個檔案的處理過程，只輸出錯誤與最後的統計")
+    report.add_argument("--progress", dest="report", action="store_const", const="progress",
+                        help="以一行定時更新的進度 (已處理檔案數與每秒檔案數) 取代每個檔案的處理過程")
+    report.add_argument("--jsonl", dest="report", action="store_const", const="jsonl",
+                        help="每個檔案輸出一行 JSON 事件 (供排程程式解析)")
+    parser.set_defaults(report=DEFAULT_REPORT_MODE)
+    parser.add_argument("--stats", action="store_true",
+                       help="批量處理完成後輸出各階段耗時 (p50/p95/p99) 與每秒處理檔案數")
+    parser.add_argument("--manifest", default=environ.get('HSBC_MANIFEST'),
+                       help="將每個處理完成的檔案附加到清單 (.csv 或 .jsonl，預設為環境變數 HSBC_MANIFEST)")
+    parser.add_argument("--manifest-index", default=environ.get('HSBC_MANIFEST_INDEX'),
+                       help="同時寫入可查詢的 SQLite 索引 (預設為環境變數 HSBC_MANIFEST_INDEX，"
+                            "以 'query' 子命令查詢)")
+    parser.add_argument("--daemon", action="store_true",
+                       help="啟動常駐的背景服務：保持 PDF 後端、快取與 process pool，"
+                            "之後的 -f/-d 呼叫會轉送給它處理 (-j 為服務的 process 數量)")
+    parser.add_argument("--socket",
+                       help="背景服務的 Unix socket 路徑 (預設為環境變數 HSBC_DAEMON_SOCKET 或暫存目錄中的 "
+                            "hsbc_renamer-<uid>.sock)")
+    parser.add_argument("--no-daemon", action="store_true",
+                       help="不轉送給背景服務，一律在目前的 process 中處理")
+    
+    return parser
+
+
+def run(argv):
+    """
+    在目前的 process 中執行命令列 (hsbc_payment_renamer.py 無法轉送給背景服務時呼叫)
+    
+    Args:
+        argv (list): 命令列參數 (不含程式名稱)
+    """
+    if argv[:1] == ['query']:
+        return query_main(argv[1:])
+    
+    args = build_parser().parse_args(argv)
+    if args.daemon:
+        return _serve_daemon(args)
+    _execute(args)
+
+
+def _execute(args, cache=None, pool=None):
+    """
+    依命令列參數建立重新命名工具並執行
+    
+    Args:
+        args (argparse.Namespace): 命令列參數
+        cache (ResultCache): 背景服務常駐的快取 (None 為依參數開啟並在結束時關閉)
+        pool (ProcessPoolExecutor): 背景服務常駐的 process pool
+    """
+    reporter = create_reporter(args.report)
+    try:
+        _configure_and_run(args, reporter, cache, pool)
+    finally:
+        reporter.close()
+
+
+def _configure_and_run(args, reporter, cache, pool):
+    """開啟快取與清單並執行 (錯誤與警告透過 reporter 輸出，jsonl 模式的輸出才能完整解析)"""
+    # 快速提取模式的區域設定
+    fast_regions = None
+    if args.regions:
+        try:
+            fast_regions = parse_regions(args.regions)
+        except ValueError as e:
+            reporter.error(f"[錯誤] {e}")
+            return
+    elif args.fast:
+        fast_regions = DEFAULT_FAST_REGIONS
+    
+    # 確認 PDF 後端可用
+    try:
+        _backend_chain(args.backend)
+    except ValueError as e:
+        reporter.error(f"[錯誤] {e}")
+        return
+    
+    # 提取結果快取
+    owns_cache = cache is None
+    if owns_cache and not args.no_cache:
+        try:
+            cache = ResultCache(args.cache_path, max_entries=args.cache_size)
+        except Exception as e:
+            reporter.error(f"[警告] 無法開啟快取，將不使用快取。原因: {e}")
+        else:
+            if args.rebuild_cache:
+                cache.clear()
+    
+    # 提取結果清單
+    manifest = None
+    if args.manifest or args.manifest_index:
+        try:
+            manifest = Manifest(args.manifest, args.manifest_index)
+        except Exception as e:
+            reporter.error(f"[錯誤] 無法開啟清單。原因: {e}")
+            if owns_cache and cache is not None:
+                cache.close()
+            return
+    
+    # 建立重新命名工具
+    renamer = HSBCPaymentAdviceRenamer(fast_regions=fast_regions, cache=cache, backend=args.backend,
+                                       metrics=StageMetrics() if args.stats else None, manifest=manifest,
+                                       prefilter=not args.no_prefilter, pool=pool, reporter=reporter)
+    try:
+        _run(args, renamer)
+    finally:
+        if owns_cache and cache is not None:
+            cache.close()
+        if manifest is not None:
+            manifest.close()
+
+
+# 只在背景服務中生效的參數 (快取由服務啟動時的設定決定)
+_DAEMON_ONLY_OPTIONS = ('no_cache', 'rebuild_cache', 'cache_path')
+
+# 相對於客戶端工作目錄的路徑參數 (背景服務的工作目錄不同)
+_PATH_OPTIONS = ('file', 'directory', 'journal', 'manifest', 'manifest_index')
+
+
+def _can_forward(args):
+    """單檔或資料夾模式且未指定快取參數時，請求可以由背景服務處理"""
+    if args.daemon or args.no_daemon or not args.period or not (args.file or args.directory):
+        return False
+    if args.interactive or args.auto or args.resume or args.undo or args.split or args.watch:
+        return False
+    return not any(getattr(args, name) for name in _DAEMON_ONLY_OPTIONS)
+
+
+def _parse_forwarded(request):
+    """
+    解析客戶端轉送的命令列
+    
+    Args:
+        request (dict): {'argv': 命令列參數, 'cwd': 客戶端工作目錄, 'env': 客戶端的環境變數}
+        
+    Returns:
+        argparse.Namespace: 命令列參數；無法解析或不能由背景服務處理時為 None (交回客戶端處理)
+    """
+    # 解析錯誤與 -h 的說明由客戶端在本地重新解析時輸出
+    try:
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            args = build_parser(request.get('env', {})).parse_args(request['argv'])
+    except SystemExit:
+        return None
+    if not _can_forward(args):
+        return None
+    for name in _PATH_OPTIONS:
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(os.path.join(request['cwd'], getattr(args, name))))
+    return args
+
+
+def _serve_daemon(args):
+    """
+    常駐的背景服務：PDF 後端、快取與 process pool 只建立一次，依序處理轉送的 -f/-d 請求
+    """
+    try:
+        _backend_chain(args.backend)
+    except ValueError as e:
+        print(f"[錯誤] {e}")
+        return
+    
+    cache = None
+    if not args.no_cache:
+        try:
+            cache = ResultCache(args.cache_path, max_entries=args.cache_size)
+        except Exception as e:
+            print(f"[警告] 無法開啟快取，將不使用快取。原因: {e}")
+        else:
+            if args.rebuild_cache:
+                cache.clear()
+    
+    jobs = args.jobs or os.cpu_count() or 1
+    
+    def start_pool():
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                   initargs=(cache.path if cache is not None else None,))
+        for future in [pool.submit(_warm_worker, args.backend) for _ in range(jobs)]:
+            future.result()
+        return pool
+    
+    # 在開始監聽之前建立 pool，worker 不會繼承監聽中的 socket
+    pool = None
+    if jobs > 1:
+        pool = start_pool()
+        print(f"[資訊] 已啟動 {jobs} 個 process 供批量處理使用")
+    
+    def handle(request):
+        nonlocal pool
+        request_args = _parse_forwarded(request)
+        if request_args is None:
+            return False
+        # 請求未指定後端時沿用服務的後端；要求平行處理時使用服務的 pool
+        request_args.backend = request_args.backend or args.backend
+        if pool is not None and request_args.jobs != 1:
+            request_args.jobs = jobs
+        try:
+            _execute(request_args, cache=cache, pool=pool)
+        except BrokenProcessPool:
+            # worker 異常結束時換一個新的 pool，下一個請求仍可使用
+            pool.shutdown(wait=False)
+            pool = start_pool()
+            raise
+        finally:
+            # 請求之間不保留未提交的寫入，不經過服務的呼叫 (--no-daemon) 才不會等待快取的鎖
+            if cache is not None:
+                cache.flush()
+        return True
+    
+    try:
+        serve(args.socket or default_socket_path(), handle)
+    except OSError as e:
+        print(f"[錯誤] 無法啟動背景服務。原因: {e}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if cache is not None:
+            cache.close()
+
+
+# query 子命令表格模式顯示的欄位
+_QUERY_COLUMNS = ('new_name', 'outlet_num', 'bene_abbr', 'outlet_code', 'period', 'year', 'directory')
+
+
+def query_main(argv):
+    """query 子命令：查詢提取結果索引，不需開啟任何 PDF"""
+    parser = argparse.ArgumentParser(prog="hsbc_payment_renamer.py query",
+                                     description="查詢 --manifest-index 寫入的提取結果索引")
+    parser.add_argument("--index", default=os.environ.get('HSBC_MANIFEST_INDEX'),
+                       help="SQLite 索引路徑 (預設為環境變數 HSBC_MANIFEST_INDEX)")
+    parser.add_argument("--outlet", help="Outlet 號碼 (例如 1208008138)")
+    parser.add_argument("--bene", help="受益人縮寫 (例如 APC)")
+    parser.add_argument("--code", help="Outlet 代碼 (例如 IT801)")
+    parser.add_argument("--period", help="期間代碼 (例如 P1)")
+    parser.add_argument("--year", help="兩位數年份 (例如 25)")
+    parser.add_argument("--sha256", help="檔案內容 SHA-256")
+    parser.add_argument("--limit", type=int, help="最多顯示的筆數")
+    parser.add_argument("--format", choices=['table', 'csv', 'jsonl'], default='table',
+                       help="輸出格式 (預設 table)")
+    args = parser.parse_args(argv)
+    
+    if not args.index:
+        print("[錯誤] 請以 --index 或環境變數 HSBC_MANIFEST_INDEX 指定索引路徑")
+        return
+    if not os.path.exists(args.index):
+        print(f"[錯誤] 找不到索引 '{args.index}'")
+        return
+    
+    index = ManifestIndex(args.index)
+    try:
+        rows = index.query(limit=args.limit, **{name: getattr(args, name) for name in QUERY_FILTERS})
+    finally:
+        index.close()
+    
+    if args.format == 'jsonl':
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+    elif args.format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        widths = [max([len(column)] + [len(str(row[column] or '')) for row in rows]) for column in _QUERY_COLUMNS]
+        print("  ".join(column.ljust(width) for column, width in zip(_QUERY_COLUMNS, widths)).rstrip())
+        for row in rows:
+            print("  ".join(str(row[column] or '').ljust(width) for column, width in zip(_QUERY_COLUMNS, widths)).rstrip())
+        print(f"共 {len(rows)} 筆")
+
+
+# 自動模式最多列出的檔案數量
+_AUTO_PREVIEW_LIMIT = 20
+
+
+def _run(args, renamer):
+    """依命令列參數執行對應模式"""
+    scan_options = {
+        'recursive': args.recursive,
+        'include': args.include,
+        'exclude': args.exclude,
+        'max_depth': args.max_depth,
+    }
+    
+    plan_options = {
+        'policy': args.on_collision,
+        'dry_run': args.dry_run,
+        'journal_path': args.journal,
+    }
+    
+    # 繼續或還原上一次批量處理
+    if args.resume or args.undo:
+        journal_path = args.journal or default_journal_path(args.directory or os.getcwd())
+        if args.undo:
+            renamer.undo(journal_path)
+        else:
+            renamer.resume(journal_path)
+        return
+    
+    # 自動模式：處理當前目錄的 PDF 檔案
+    if args.auto:
+        current_dir = os.getcwd()
+        
+        # 只計數並列出前幾個檔案，處理時再重新掃描
+        print("掃描當前目錄的 PDF 檔案:")
+        count = 0
+        for pdf_path in scan_pdfs(current_dir, **scan_options, on_error=renamer.reporter.error):
+            if count < _AUTO_PREVIEW_LIMIT:
+                print(f"  - {os.path.relpath(pdf_path, current_dir)}")
+            count += 1
+        
+        if not count:
+            print("當前目錄中沒有找到 PDF 檔案")
+            return
+            
+        if count > _AUTO_PREVIEW_LIMIT:
+            print(f"  ... 以及另外 {count - _AUTO_PREVIEW_LIMIT} 個檔案")
+        print(f"在當前目錄找到 {count} 個 PDF 檔案")
+        
+        # 獲取期間代碼
+        period_code = renamer.get_period_code_from_user()
+        
+        # 處理每個檔案
+        print(f"\n開始使用期間代碼 '{period_code}' 處理檔案...")
+        renamer.batch_rename(current_dir, period_code, jobs=args.jobs, **scan_options, **plan_options)
+        return
+    
+    # 分割模式：一個合併檔輸出多份通知書
+    if args.split:
+        if not args.period:
+            renamer.reporter.error("[錯誤] 分割模式需要期間代碼 (使用 -p 或 --period)")
+            return
+        if not os.path.exists(args.split):
+            renamer.reporter.error(f"[錯誤] 檔案 '{args.split}' 不存在")
+            return
+        renamer.split_file(args.split, args.period, args.output_dir)
+        return
+    
+    # 監看模式：持續處理新加入的檔案
+    if args.watch:
+        if not args.period:
+            renamer.reporter.error("[錯誤] 監看模式需要期間代碼 (使用 -p 或 --period)")
+            return
+        renamer.watch(args.watch, args.period, jobs=args.jobs, interval=args.interval)
+        return
+    
+    # 互動模式
+    if args.interactive or (not args.directory and not args.file):
+        renamer.interactive_mode()
+        return
+    
+    # 檢查是否提供期間代碼（單檔案或目錄模式需要）
+    if not args.period and (args.file or args.directory):
+        renamer.reporter.error("[錯誤] 請提供期間代碼 (使用 -p 或 --period)，或使用 --auto 模式自動詢問")
+        return
+    
+    # 處理單一檔案
+    if args.file:
+        if not os.path.exists(args.file):
+            renamer.reporter.error(f"[錯誤] 檔案 '{args.file}' 不存在")
+            return
+        result = renamer._rename_and_record(args.file, args.period)
+        # 詳細模式已輸出結果；其他模式沒有逐行輸出，以統計回報
+        if args.report != DEFAULT_REPORT_MODE:
+            skipped = {category: int(result == category) for category in PREFILTER_LABELS}
+            renamer.reporter.summary("處理完成", {'success': int(result == 'ok'), 'failed': int(result == 'failed'),
+                                              **skipped, 'total': 1})
+    
+    # 處理整個目錄
+    elif args.directory:
+        renamer.batch_rename(args.directory, args.period, jobs=args.jobs, **scan_options, **plan_options)
+    
+    else:
+        print("請提供 --directory、--file、--auto 或使用 --interactive 模式")
+        print("使用 -h 或 --help 查看完整選項")
+
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 處理過程輸出
+重新命名工具只透過 Reporter 輸出處理過程，依模式決定輸出多少:
+
+    verbose   每個檔案的提取欄位與重新命名過程 (預設，互動使用)
+    quiet     只輸出錯誤與最後的統計
+    progress  一行定時更新的進度 (已處理檔案數與每秒檔案數)，最後輸出統計
+    jsonl     每個檔案一行 JSON 事件，緩衝後批次寫出，供排程程式解析
+
+數萬個檔案時 verbose 每個檔案五到八行的輸出會佔去明顯的執行時間，批量處理應使用其他模式。
+輸出一律寫到當下的 sys.stdout (背景服務執行請求時會替換為送回客戶端的串流)。
+"""
+
+import json
+import sys
+import time
+import unicodedata
+
+from hsbc_prefilter import CANDIDATE, IMAGE_ONLY, NON_ADVICE
+
+
+REPORT_MODES = ('verbose', 'quiet', 'progress', 'jsonl')
+
+DEFAULT_REPORT_MODE = 'verbose'
+
+# 預先篩選排除的分類在輸出中的名稱
+PREFILTER_LABELS = {NON_ADVICE: '非通知書', IMAGE_ONLY: '純圖片 (掃描檔)'}
+
+# 統計欄位 -> 顯示名稱；成功、失敗與總計一律顯示，其他欄位只在不為 0 時顯示
+SUMMARY_LABELS = {
+    'success': '成功',
+    'failed': '失敗',
+    'suffixed': '檔名已存在、加上後綴',
+    **{category: f"略過{label}" for category, label in PREFILTER_LABELS.items()},
+    'total': '總計',
+}
+_ALWAYS_SHOWN = ('success', 'failed', 'total')
+
+# progress 模式更新進度行的最短間隔 (秒)
+PROGRESS_INTERVAL = 0.5
+
+# jsonl 模式累積多少個事件寫出一次
+JSONL_BUFFER_EVENTS = 256
+
+# 分段耗時表格的欄寬 (終端機顯示寬度，標題與各列共用)
+_STAGE_COLUMN_WIDTH = 12
+_VALUE_COLUMN_WIDTH = 10
+
+
+def _display_width(text):
+    """終端機顯示寬度 (全形字元佔兩格)"""
+    return sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in text)
+
+
+def _ljust(text, width):
+    return text + ' ' * (width - _display_width(text))
+
+
+def _rjust(text, width):
+    return ' ' * (width - _display_width(text)) + text
+
+
+class Reporter:
+    """quiet 模式，也是其他模式的基底類別：只輸出錯誤與最後的統計"""
+
+    def section(self, text):
+        """段落標題與一般資訊"""
+
+    def detail(self, text):
+        """單一檔案的處理細節"""
+
+    def extracted(self, pdf_path, fields, error, category=CANDIDATE):
+        """
+        一個檔案提取完成
+
+        Args:
+            pdf_path (str): PDF 檔案路徑
+            fields (AdviceFields): 提取的資訊，失敗時為 None
+            error (str): 失敗原因，成功時為 None
+            category (str): 預先篩選分類
+        """
+
+    def file(self, path, status, new_path=None, error=None, fields=None):
+        """
+        一個檔案的最終結果
+
+        Args:
+            path (str): 原檔案路徑
+            status (str): renamed、unchanged、planned (模擬執行)、restored (還原)、written (分割)、
+                          failed，或預先篩選排除時的分類 (non_advice 或 image_only)
+            new_path (str): 新檔案路徑
+            error (str): 失敗原因
+            fields (AdviceFields): 提取的資訊
+        """
+
+    def error(self, text):
+        """無法繼續處理的錯誤 (所有模式都會輸出)"""
+        print(text)
+
+    def summary(self, title, counts, unit='個檔案'):
+        """
+        輸出處理結果統計
+
+        Args:
+            title (str): 標題 (例如 處理完成)
+            counts (dict): SUMMARY_LABELS 中的欄位 -> 數量 (只輸出有提供的欄位)
+            unit (str): 數量單位
+        """
+        print(f"\n--- {title} ---")
+        for key, label in SUMMARY_LABELS.items():
+            if key in counts and (key in _ALWAYS_SHOWN or counts[key]):
+                print(f"{label}: {counts[key]} {unit}")
+
+    def stats(self, stages, results, file_count, elapsed):
+        """
+        輸出各階段耗時的百分位數與處理速度
+
+        Args:
+            stages (dict): StageMetrics.summary() 的結果
+            results (dict): 處理結果 -> 檔案數量
+            file_count (int): 處理的檔案數量
+            elapsed (float): 總耗時 (秒)
+        """
+        print(f"\n--- 分段耗時統計 (毫秒) ---")
+        print(_ljust('階段', _STAGE_COLUMN_WIDTH)
+              + ''.join(_rjust(title, _VALUE_COLUMN_WIDTH) for title in ('p50', 'p95', 'p99', '次數')))
+        for name, values in stages.items():
+            print(_ljust(name, _STAGE_COLUMN_WIDTH)
+                  + ''.join(_rjust(f"{values[key]:.3f}", _VALUE_COLUMN_WIDTH) for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+                  + _rjust(str(values['count']), _VALUE_COLUMN_WIDTH))
+        print(f"處理結果: {', '.join(f'{name} {count}' for name, count in sorted(results.items()))}")
+        if elapsed > 0:
+            print(f"處理速度: {file_count / elapsed:.2f} 個檔案/秒 (共 {elapsed:.3f} 秒)")
+
+    def flush(self):
+        """寫出緩衝的輸出 (監看模式每次輪詢後呼叫)"""
+
+    def close(self):
+        """處理結束，寫出所有緩衝的輸出"""
+        self.flush()
+
+
+class VerboseReporter(Reporter):
+    """verbose 模式：每個檔案的詳細過程"""
+
+    def section(self, text):
+        print(text)
+
+    def detail(self, text):
+        print(text)
+
+    def extracted(self, pdf_path, fields, error, category=CANDIDATE):
+        if category != CANDIDATE:
+            print(f"  [略過] {PREFILTER_LABELS[category]}: {error}")
+        elif not fields:
+            print(f"  [錯誤] {error}")
+        else:
+            print(f"  > 找到年份: {fields.year}")
+            print(f"  > 找到 Outlet 號碼: {fields.outlet_num}")
+            print(f"  > 找到受益人縮寫: {fields.bene_abbr}")
+            print(f"  > 找到 Outlet 代碼: {fields.outlet_code}")
+
+
+class ProgressReporter(Reporter):
+    """progress 模式：以 \\r 覆寫同一行進度，最多每 PROGRESS_INTERVAL 秒更新一次"""
+
+    def __init__(self):
+        self.count = 0
+        # 第一個檔案提取完成時才開始計時，掃描與開啟快取的時間不計入每秒檔案數
+        self.started = None
+        self._last_render = 0.0
+        self._line_open = False
+
+    def extracted(self, pdf_path, fields, error, category=CANDIDATE):
+        self.count += 1
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        if now - self._last_render >= PROGRESS_INTERVAL:
+            self._render(now)
+
+    def _render(self, now):
+        elapsed = now - self.started
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        sys.stdout.write(f"\r處理中: {self.count} 個檔案 ({rate:.1f} 個檔案/秒)".ljust(40))
+        sys.stdout.flush()
+        self._last_render = now
+        self._line_open = True
+
+    def _end_line(self):
+        """以最新的數字結束進度行，之後的輸出從新的一行開始"""
+        if self._line_open:
+            self._render(time.perf_counter())
+            sys.stdout.write("\n")
+            self._line_open = False
+
+    def error(self, text):
+        self._end_line()
+        super().error(text)
+
+    def summary(self, title, counts, unit='個檔案'):
+        self._end_line()
+        super().summary(title, counts, unit)
+
+    def stats(self, stages, results, file_count, elapsed):
+        self._end_line()
+        super().stats(stages, results, file_count, elapsed)
+
+    def close(self):
+        self._end_line()
+
+
+class JsonlReporter(Reporter):
+    """jsonl 模式：每行一個 JSON 事件 (file、error、summary、stats)"""
+
+    def __init__(self, buffer_events=JSONL_BUFFER_EVENTS):
+        self.buffer_events = buffer_events
+        self._lines = []
+
+    def _emit(self, event):
+        self._lines.append(json.dumps(event, ensure_ascii=False))
+        if len(self._lines) >= self.buffer_events:
+            self.flush()
+
+    def file(self, path, status, new_path=None, error=None, fields=None):
+        event = {'event': 'file', 'path': path, 'status': status}
+        if new_path is not None:
+            event['new_path'] = new_path
+        if error is not None:
+            event['error'] = error
+        if fields is not None:
+            event['fields'] = fields.as_dict()
+        self._emit(event)
+
+    def error(self, text):
+        self._emit({'event': 'error', 'message': text.strip()})
+
+    def summary(self, title, counts, unit='個檔案'):
+        self._emit({'event': 'summary', 'title': title, **counts})
+
+    def stats(self, stages, results, file_count, elapsed):
+        self._emit({
+            'event': 'stats',
+            'stages': stages,
+            'results': results,
+            'files_per_sec': round(file_count / elapsed, 2) if elapsed > 0 else None,
+            'seconds': round(elapsed, 3),
+        })
+
+    def flush(self):
+        if self._lines:
+            sys.stdout.write("\n".join(self._lines) + "\n")
+            sys.stdout.flush()
+            self._lines = []
+
+
+_REPORTERS = {
+    'verbose': VerboseReporter,
+    'quiet': Reporter,
+    'progress': ProgressReporter,
+    'jsonl': JsonlReporter,
+}
+
+
+def create_reporter(mode=DEFAULT_REPORT_MODE):
+    """
+    建立輸出模式對應的 Reporter
+
+    Args:
+        mode (str): REPORT_MODES 之一
+
+    Returns:
+        Reporter: 輸出物件
+    """
+    if mode not in _REPORTERS:
+        raise ValueError(f"未知的輸出模式: '{mode}' (可用: {', '.join(REPORT_MODES)})")
+    return _REPORTERS[mode]()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice PDF 檔案掃描
+以 os.scandir 逐一產生 PDF 路徑，找到即交給呼叫端處理，不必先列出整個目錄樹
+
+記憶體只與目前走訪路徑上各層資料夾的項目數量有關，與整棵樹的檔案總數無關。
+"""
+
+import fnmatch
+import os
+
+
+def _matches(relpath, name, patterns):
+    """相對路徑或檔名符合任一萬用字元模式"""
+    return any(fnmatch.fnmatch(relpath, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def scan_pdfs(root, recursive=False, include=None, exclude=None, max_depth=None, on_error=print):
+    """
+    依序產生資料夾中的 PDF 檔案路徑 (副檔名不分大小寫)
+
+    每個資料夾內依檔名排序，先產生該層的檔案再進入子資料夾，不跟隨符號連結的資料夾。
+
+    Args:
+        root (str): 起始資料夾
+        recursive (bool): 是否進入子資料夾
+        include (list): 只處理符合任一模式的檔案 (相對於 root 的路徑或檔名，例如 "2025/*" 或 "*P1*")
+        exclude (list): 略過符合任一模式的檔案與資料夾
+        max_depth (int): 最多進入幾層子資料夾 (None 為不限制，指定時隱含 recursive)
+        on_error (callable): 無法讀取資料夾時以警告訊息呼叫 (例如 Reporter.error)，該資料夾會被略過
+
+    Yields:
+        str: PDF 檔案路徑
+    """
+    include = list(include or ())
+    exclude = list(exclude or ())
+    if max_depth is None:
+        max_depth = None if recursive else 0
+
+    # (資料夾路徑, 相對路徑, 深度)
+    stack = [(root, '', 0)]
+    while stack:
+        directory, relative, depth = stack.pop()
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relpath = f"{relative}{entry.name}"
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if (max_depth is None or depth < max_depth) and not _matches(relpath, entry.name, exclude):
+                                subdirs.append(entry.name)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if not entry.name.lower().endswith('.pdf'):
+                        continue
+                    if include and not _matches(relpath, entry.name, include):
+                        continue
+                    if exclude and _matches(relpath, entry.name, exclude):
+                        continue
+                    files.append(entry.name)
+        except OSError as e:
+            on_error(f"  [警告] 無法讀取資料夾 '{directory}'。原因: {e}")
+            continue
+
+        files.sort()
+        for name in files:
+            yield os.path.join(directory, name)
+
+        # 反向放入堆疊，子資料夾依名稱順序走訪
+        for name in sorted(subdirs, reverse=True):
+            stack.append((os.path.join(directory, name), f"{relative}{name}/", depth + 1))
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 合併檔分割 (需要 PyMuPDF)
+銀行有時將數百份通知書合併成單一 PDF，本模組只走訪文件一次：
+每頁提取一次文字，以 "Advice sending date" 標籤判斷新通知書的開始
+(多頁通知書每頁都重複頁首，因此商戶編號與日期都與目前的通知書相同時視為續頁)，
+同一份通知書的欄位由其頁面補齊，接著直接以 YY_PX_BENE_CODE_OUTLETNUM.pdf 寫出。
+
+頁面以 insert_pdf 複製原始物件，不會重新繪製或重新壓縮內容。
+"""
+
+import os
+import re
+
+from hsbc_extractor import DATE_LABEL_PATTERN, match_fields
+from hsbc_metrics import stage
+
+
+# 每份通知書第一頁的頁首標籤
+ADVICE_START_PATTERN = re.compile(r"Advice sending date", re.IGNORECASE)
+
+
+def _sending_date(text):
+    """頁首的 Advice sending date (空白正規化)，找不到時為 None"""
+    match = DATE_LABEL_PATTERN.search(text)
+    return ' '.join(match.group(1).split()) if match else None
+
+
+def _differs(current, value):
+    """兩者都已知且不同時才算不同 (缺漏的欄位不能作為新通知書的證據)"""
+    return current is not None and value is not None and current != value
+
+
+def iter_advices(doc):
+    """
+    依序找出文件中的各份通知書
+
+    有頁首標籤的頁面只有在商戶編號或日期與目前的通知書不同時才開始新的通知書。
+
+    Args:
+        doc (fitz.Document): 合併的 PDF 文件
+
+    Yields:
+        tuple: (起始頁索引, 結束頁索引, AdviceFields)
+    """
+    start = None
+    fields = None
+    date = None
+    for page_no in range(doc.page_count):
+        with stage('text'):
+            text = doc[page_no].get_text("text")
+        if start is None or ADVICE_START_PATTERN.search(text):
+            with stage('match'):
+                page_fields = match_fields(text)
+            page_date = _sending_date(text)
+            if (start is None or _differs(fields.outlet_num, page_fields.outlet_num)
+                    or _differs(date, page_date)):
+                if start is not None:
+                    yield start, page_no - 1, fields
+                start, fields, date = page_no, page_fields, page_date
+                continue
+            date = date or page_date
+        if not fields.complete:
+            with stage('match'):
+                match_fields(text, fields)
+    if start is not None:
+        yield start, doc.page_count - 1, fields
+
+
+def write_pages(doc, start, end, path):
+    """
+    將頁面範圍複製為新的 PDF
+
+    Args:
+        doc (fitz.Document): 來源文件
+        start (int): 起始頁索引
+        end (int): 結束頁索引 (包含)
+        path (str): 輸出路徑
+    """
+    import fitz  # PyMuPDF
+
+    with stage('write'):
+        out = fitz.open()
+        try:
+            out.insert_pdf(doc, from_page=start, to_page=end)
+            out.save(path)
+        finally:
+            out.close()
+
+
+def unused_path(directory, name):
+    """
+    取得資料夾中尚未使用的路徑，檔名已存在時加上 _2、_3 ... 後綴
+
+    Args:
+        directory (str): 資料夾
+        name (str): 檔名
+
+    Returns:
+        str: 輸出路徑
+    """
+    path = os.path.join(directory, name)
+    stem, ext = os.path.splitext(name)
+    counter = 2
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{stem}_{counter}{ext}")
+        counter += 1
+    return path
+
+
+def split_advices(pdf_path, period_code, output_dir=None):
+    """
+    分割合併的 PDF，每份通知書以新檔名寫出
+
+    欄位缺漏的通知書寫成 UNPROCESSED_<原檔名>_p<頁碼>.pdf，不會遺失任何頁面；
+    目標檔案已存在時不覆寫，改以 _2、_3 ... 後綴的檔名寫出。
+
+    Args:
+        pdf_path (str): 合併的 PDF 檔案路徑
+        period_code (str): 期間代碼
+        output_dir (str): 輸出資料夾 (None 為與來源相同的資料夾)
+
+    Yields:
+        dict: {'pages': (第一頁, 最後一頁) (從 1 起算), 'fields', 'path', 'error',
+               'suffixed': 是否因檔名已存在而加上後綴}
+    """
+    import fitz  # PyMuPDF
+
+    output_dir = output_dir or os.path.dirname(os.path.abspath(pdf_path))
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    os.makedirs(output_dir, exist_ok=True)
+
+    with stage('open'):
+        doc = fitz.open(pdf_path)
+    try:
+        for start, end, fields in iter_advices(doc):
+            pages = (start + 1, end + 1)
+            error = None
+            if fields.year is None:
+                error = "無法在文件中找到 'Advice sending date'"
+            elif fields.outlet_num is None:
+                error = "無法找到 'Outlet no. / Name' 模式"
+
+            with stage('filename'):
+                if error:
+                    name = f"UNPROCESSED_{stem}_p{pages[0]}-{pages[1]}.pdf"
+                else:
+                    name = fields.filename(period_code)
+            path = unused_path(output_dir, name)
+
+            write_pages(doc, start, end, path)
+            yield {'pages': pages, 'fields': fields, 'path': path, 'error': error,
+                   'suffixed': os.path.basename(path) != name}
+    finally:
+        doc.close()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+HSBC Payment Advice 監看資料夾
+命令列工具的 --watch 模式使用：定期輪詢資料夾，找出新加入且已寫入完成的 PDF
+
+每次輪詢的工作量與新檔案數量成正比:
+    - 資料夾的 mtime 沒有改變時不重新列出目錄 (新增、刪除、重新命名都會改變 mtime)
+    - 只對尚未處理的檔案呼叫 stat()，大小與修改時間連續兩次輪詢不變才視為寫入完成
+    - 已重新命名格式的檔案直接略過
+"""
+
+import os
+import time
+
+from hsbc_extractor import RENAMED_FILENAME_PATTERN
+
+
+# 預設輪詢間隔 (秒)
+DEFAULT_POLL_INTERVAL = 2.0
+
+# 資料夾 mtime 在這段時間內 (奈秒) 仍視為可能變動，避免時間戳解析度較粗的檔案系統漏掉同一刻新增的檔案
+_DIR_MTIME_SLACK_NS = 2_000_000_000
+
+
+class FolderWatcher:
+    """追蹤資料夾中等待處理的 PDF"""
+
+    def __init__(self, directory):
+        """
+        初始化監看
+
+        Args:
+            directory (str): 要監看的資料夾
+        """
+        self.directory = directory
+        self._dir_mtime = None
+        # 檔名 -> 上次輪詢的 (size, mtime_ns)，None 為尚未 stat
+        self._pending = {}
+        # 處理失敗的檔名 -> (size, mtime_ns)，檔案內容改變後才重試
+        self._failed = {}
+
+    def _scan_directory(self):
+        """列出資料夾中的 PDF，加入新檔案並移除已消失的檔案"""
+        names = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.lower().endswith('.pdf') or RENAMED_FILENAME_PATTERN.fullmatch(name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                names.add(name)
+                if name not in self._pending and name not in self._failed:
+                    self._pending[name] = None
+
+        for name in self._pending.keys() - names:
+            del self._pending[name]
+        for name in self._failed.keys() - names:
+            del self._failed[name]
+
+        # 失敗的檔案被覆寫 (例如重新匯出) 後再試一次
+        for name, signature in list(self._failed.items()):
+            if self._signature(name) != signature:
+                del self._failed[name]
+                self._pending[name] = None
+
+    def _signature(self, name):
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def poll(self):
+        """
+        檢查資料夾一次
+
+        Returns:
+            list: 已寫入完成、可以處理的 PDF 路徑 (依檔名排序)
+        """
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime != self._dir_mtime or time.time_ns() - mtime < _DIR_MTIME_SLACK_NS:
+            self._scan_directory()
+            self._dir_mtime = mtime
+
+        ready = []
+        for name, previous in list(self._pending.items()):
+            signature = self._signature(name)
+            if signature is None:
+                del self._pending[name]
+            elif signature == previous and signature[0] > 0:
+                del self._pending[name]
+                ready.append(name)
+            else:
+                self._pending[name] = signature
+        return [os.path.join(self.directory, name) for name in sorted(ready)]
+
+    def mark_failed(self, path):
+        """記錄處理失敗的檔案，內容改變前不再處理"""
+        name = os.path.basename(path)
+        signature = self._signature(name)
+        if signature is not None:
+            self._failed[name] = signature
+
+    @property
+    def pending_count(self):
+        """等待寫入完成的檔案數量"""
+        return len(self._pending)
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""測試共用設定：讓測試可直接匯入專案根目錄的模組"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
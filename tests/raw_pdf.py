@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+手工組合的最小 PDF (不需要 PyMuPDF)
+
+可控制內容串流的 /Length 寫法 (直接數值或間接參照) 與壓縮方式，
+用於測試只讀取原始結構的 RawStreamBackend 與預先篩選。
+"""
+
+import zlib
+
+
+def advice_content(outlet="1208008138/ APC - IT801", date="20 Jun 2025"):
+    """通知書第一頁的內容串流 (只含提取需要的標籤)"""
+    lines = ("Payment Advice", "Advice sending date", date, "Outlet no. / Name", outlet)
+    ops = [b"BT /F1 9 Tf 40 800 Td"]
+    for line in lines:
+        ops.append(b"(" + line.encode('latin-1') + b") Tj 0 -14 Td")
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+
+def build_pdf(content, indirect_length=False, deflate=True, media_box=(0, 0, 595, 842)):
+    """
+    組合單頁 PDF，附有正確的 xref
+
+    Args:
+        content (bytes): 未壓縮的內容串流
+        indirect_length (bool): 以間接物件 (/Length 12 0 R) 記錄串流長度
+        deflate (bool): 是否以 FlateDecode 壓縮串流
+        media_box (tuple): 頁面的 /MediaBox
+
+    Returns:
+        bytes: PDF 內容
+    """
+    stream = zlib.compress(content) if deflate else content
+    filters = b" /Filter /FlateDecode" if deflate else b""
+    # 長度物件編號 12 (兩位數)：正是會被回溯成 "1" 的情況
+    length = b"12 0 R" if indirect_length else str(len(stream)).encode()
+    box = " ".join(str(value) for value in media_box).encode()
+
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        3: (b"<< /Type /Page /Parent 2 0 R /MediaBox [" + box + b"]"
+            b" /Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>"),
+        4: b"<< /Length " + length + filters + b" >>\nstream\n" + stream + b"\nendstream",
+        5: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    if indirect_length:
+        objects[12] = str(len(stream)).encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += b"%d 0 obj\n" % num + objects[num] + b"\nendobj\n"
+    size = max(objects) + 1
+    xref = len(out)
+    out += b"xref\n0 %d\n" % size
+    out += b"0000000000 65535 f \n"
+    for num in range(1, size):
+        if num in offsets:
+            out += b"%010d 00000 n \n" % offsets[num]
+        else:
+            out += b"0000000000 00000 f \n"
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref)
+    return bytes(out)
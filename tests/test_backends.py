@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""RawStreamBackend 的原始結構解析"""
+
+import io
+
+import pytest
+
+from hsbc_backends import _LENGTH_RE, RawStreamBackend
+from raw_pdf import advice_content, build_pdf
+
+
+@pytest.mark.parametrize("header, expected", [
+    (b"<< /Length 12 >>", b"12"),
+    (b"<< /Length 345 /Filter /FlateDecode >>", b"345"),
+    (b"<< /Length 12 0 R >>", None),
+    (b"<< /Length 1234 0 R /Filter /FlateDecode >>", None),
+])
+def test_length_ignores_indirect_reference(header, expected):
+    """間接長度不可回溯成只取物件編號的前幾位數字"""
+    match = _LENGTH_RE.search(header)
+    assert (match.group(1) if match else None) == expected
+
+
+@pytest.mark.parametrize("deflate", [True, False])
+@pytest.mark.parametrize("indirect_length", [True, False])
+def test_first_page_text(indirect_length, deflate):
+    """間接長度改以 endstream 定位串流結尾，仍能讀出完整內容"""
+    data = build_pdf(advice_content(), indirect_length=indirect_length, deflate=deflate)
+    text = RawStreamBackend().first_page_text(io.BytesIO(data))
+    assert "Advice sending date" in text
+    assert "1208008138/ APC - IT801" in text
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""重新命名的執行與繼續日誌"""
+
+import os
+
+from hsbc_planner import RenameJournal, apply_renames
+
+
+def _touch(path, content=b"%PDF-1.4\n"):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def test_rename_and_journal(tmp_path):
+    src, dst = str(tmp_path / "a.pdf"), str(tmp_path / "25_P1_APC_IT801_1208008138.pdf")
+    _touch(src)
+    journal = RenameJournal(str(tmp_path / "journal.jsonl"))
+    journal.begin([(src, dst)])
+    assert list(apply_renames([(src, dst)], journal)) == [(src, dst, None)]
+    journal.close()
+    assert os.path.exists(dst) and not os.path.exists(src)
+    assert journal.load()[1] == {(src, dst)}
+
+
+def test_missing_source_fails_outside_resume(tmp_path):
+    """一般執行時原檔不見而新檔已存在，不能當作成功"""
+    src, dst = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    _touch(dst)
+    [(_, _, error)] = apply_renames([(src, dst)])
+    assert error is not None
+
+
+def test_missing_source_accepted_on_resume(tmp_path):
+    """繼續日誌時視為上次在寫入日誌之前中斷，並補記為完成"""
+    src, dst = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    _touch(dst)
+    journal = RenameJournal(str(tmp_path / "journal.jsonl"))
+    journal.begin([(src, dst)])
+    assert list(apply_renames([(src, dst)], journal, resume=True)) == [(src, dst, None)]
+    journal.close()
+    assert journal.load()[1] == {(src, dst)}
+
+
+def test_missing_both_fails_on_resume(tmp_path):
+    src, dst = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    [(_, _, error)] = apply_renames([(src, dst)], resume=True)
+    assert error is not None
+
+
+def test_existing_destination_is_not_overwritten(tmp_path):
+    src, dst = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    _touch(src, b"source")
+    _touch(dst, b"other")
+    [(_, _, error)] = apply_renames([(src, dst)])
+    assert error is not None
+    with open(dst, 'rb') as f:
+        assert f.read() == b"other"
+
+
+def test_done_entries_are_skipped(tmp_path):
+    src, dst = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    assert list(apply_renames([(src, dst)], done={(src, dst)})) == [(src, dst, None)]
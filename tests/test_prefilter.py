@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""預先篩選只在有明確證據時排除檔案"""
+
+from hsbc_prefilter import CANDIDATE, IMAGE_ONLY, NON_ADVICE, classify_pdf
+from raw_pdf import advice_content, build_pdf
+
+
+def test_advice_is_candidate():
+    assert classify_pdf(build_pdf(advice_content())) == (CANDIDATE, None)
+
+
+def test_indirect_length_is_candidate():
+    """間接 /Length 的通知書不可被當成沒有文字而略過"""
+    assert classify_pdf(build_pdf(advice_content(), indirect_length=True)) == (CANDIDATE, None)
+
+
+def test_empty_content_is_candidate():
+    """內容串流解碼後為空時無法判斷，交給後端"""
+    assert classify_pdf(build_pdf(b"")) == (CANDIDATE, None)
+
+
+def test_undecodable_content_is_candidate():
+    """壓縮資料損壞時交給後端"""
+    data = build_pdf(advice_content(), deflate=True)
+    data = data.replace(b"stream\nx", b"stream\n\x00", 1)
+    assert classify_pdf(data)[0] == CANDIDATE
+
+
+def test_drawing_only_page_is_non_advice():
+    assert classify_pdf(build_pdf(b"0 0 m 100 100 l S"))[0] == NON_ADVICE
+
+
+def test_image_only_page():
+    assert classify_pdf(build_pdf(b"q 595 0 0 842 0 0 cm /Im0 Do Q"))[0] == IMAGE_ONLY
+
+
+def test_wrong_page_size_is_non_advice():
+    assert classify_pdf(build_pdf(advice_content(), media_box=(0, 0, 2000, 3000)))[0] == NON_ADVICE
+
+
+def test_not_a_pdf():
+    assert classify_pdf(b"PK\x03\x04 not a pdf")[0] == NON_ADVICE
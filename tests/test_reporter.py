@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""jsonl 輸出的事件格式"""
+
+import json
+
+from hsbc_reporter import JsonlReporter
+
+
+def test_summary_includes_title(capsys):
+    reporter = JsonlReporter()
+    reporter.summary("處理完成 (模擬)", {'success': 2, 'failed': 1, 'total': 3})
+    reporter.flush()
+    event = json.loads(capsys.readouterr().out)
+    assert event == {'event': 'summary', 'title': "處理完成 (模擬)", 'success': 2, 'failed': 1, 'total': 3}
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""合併檔分割的通知書邊界"""
+
+from hsbc_splitter import iter_advices
+
+
+class _Page:
+    def __init__(self, text):
+        self.text = text
+
+    def get_text(self, option):
+        return self.text
+
+
+class _Document:
+    """只提供 iter_advices 需要的介面 (page_count 與逐頁文字)"""
+
+    def __init__(self, *texts):
+        self.pages = [_Page(text) for text in texts]
+        self.page_count = len(self.pages)
+
+    def __getitem__(self, index):
+        return self.pages[index]
+
+
+def _header(outlet="1208008138/ APC - IT801", date="20 Jun 2025"):
+    return f"Payment Advice\nAdvice sending date\n{date}\nOutlet no. / Name\n{outlet}\n"
+
+
+def _ranges(doc):
+    return [(start, end, fields.outlet_num) for start, end, fields in iter_advices(doc)]
+
+
+def test_repeated_header_continues_advice():
+    """多頁通知書每頁重複相同頁首時仍是同一份"""
+    doc = _Document(_header(), _header(), "Page 3 of 3\nInvoice no.")
+    assert _ranges(doc) == [(0, 2, "1208008138")]
+
+
+def test_different_outlet_starts_new_advice():
+    doc = _Document(_header(), "Page 2 of 2", _header(outlet="1209999999/ HKE - IT802"))
+    assert _ranges(doc) == [(0, 1, "1208008138"), (2, 2, "1209999999")]
+
+
+def test_different_date_starts_new_advice():
+    doc = _Document(_header(), _header(date="21 Jun 2025"))
+    assert _ranges(doc) == [(0, 0, "1208008138"), (1, 1, "1208008138")]
+
+
+def test_header_without_fields_continues_advice():
+    """頁首沒有可比較的欄位時不能作為新通知書的證據"""
+    doc = _Document(_header(), "Advice sending date (continued)")
+    assert _ranges(doc) == [(0, 1, "1208008138")]
+
+
+def test_fields_completed_from_later_page():
+    doc = _Document("Advice sending date\n20 Jun 2025\n", "Outlet no. / Name\n1208008138/ APC - IT801")
+    [(start, end, fields)] = iter_advices(doc)
+    assert (start, end, fields.year, fields.outlet_code) == (0, 1, "25", "IT801")